@@ -1,24 +1,20 @@
-import os
+from pathlib import Path
 from fastapi import APIRouter, UploadFile, File
 from core.grpc_client import grpc_client_manager
 from core.settings import settings
 from api.schemas.admin import ModelSwitchRequest
 from services.model_store import switch_generation_model, switch_embedding_model
 from protos import inference_pb2
+from services.embedding import embedding_model
+from services.uploads import safe_filename, save_upload
 
 router = APIRouter()
 
 
 @router.post("/models/upload")
 async def upload_model(file: UploadFile = File(...)):
-    model_dir = settings.MODEL_DIR
-    if not os.path.exists(model_dir):
-        os.makedirs(model_dir)
-    file_path = os.path.join(model_dir, file.filename)
-    content = await file.read()
-    with open(file_path, "wb") as f:
-        f.write(content)
-    return {"success": True, "message": f"模型 {file.filename} 上传成功"}
+    saved = await save_upload(file, Path(settings.MODEL_DIR) / safe_filename(file.filename))
+    return {"success": True, "message": f"模型 {file.filename} 上传成功", "sha256": saved["sha256"]}
 
 
 @router.post("/models/switch")
@@ -41,6 +37,7 @@ async def switch_model(request: ModelSwitchRequest):
                 switch_generation_model(model_name)
             elif model_type_str == "EMBEDDING":
                 switch_embedding_model(model_name)
+                embedding_model.clear_cache()
         return {"success": success, "message": message}
     except Exception as e:
         return {"success": False, "message": f"切换模型失败: {e}"}
@@ -33,17 +33,37 @@ def build_final_messages_for_grpc(
     return final_messages
 
 
+def context_doc_ids(context_docs: list) -> list[str]:
+    """IDs of the knowledge-base documents an answer is grounded on."""
+    ids = {doc.metadata.get("source") for doc in context_docs}
+    return sorted(i for i in ids if i)
+
+
 @router.post("/")
 async def chat_api(
-    query: str = Body(..., embed=True), session_id: str | None = Body(default=None)
+    query: str = Body(..., embed=True),
+    session_id: str | None = Body(default=None),
+    model: str | None = Body(default=None),
+    collections: list[str] | None = Body(default=None),
+    where: dict | None = Body(default=None),
 ):
+    """
+    ``collections`` 为要检索的知识库集合（默认只查默认集合，多个集合并行检索），
+    ``where`` 为元数据过滤条件，如 ``{"doc_type": "pdf"}``。
+    """
     if not session_id:
         session_id = session_service.create_session()
 
     history = session_service.get_session_context(session_id)
 
     try:
-        context_docs = await knowledge_service.search(query, n_results=3)
+        context_docs = await knowledge_service.search(
+            query, n_results=3, collections=collections, where=where
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
         context_contents = [doc.page_content for doc in context_docs]
         messages_for_grpc = build_final_messages_for_grpc(
             query, context_contents, history
@@ -55,6 +75,8 @@ async def chat_api(
                 for m in messages_for_grpc
             ],
             session_id=session_id,
+            context_doc_ids=context_doc_ids(context_docs),
+            model_name=model,
         )
 
         answer = ""
@@ -92,7 +114,12 @@ async def websocket_chat(websocket: WebSocket):
                 continue
 
             history = session_service.get_session_context(session_id)
-            context_docs = await knowledge_service.search(user_query, n_results=3)
+            context_docs = await knowledge_service.search(
+                user_query,
+                n_results=3,
+                collections=data.get("collections"),
+                where=data.get("where"),
+            )
             context_contents = [doc.page_content for doc in context_docs]
             messages_for_grpc = build_final_messages_for_grpc(
                 user_query, context_contents, history
@@ -104,6 +131,8 @@ async def websocket_chat(websocket: WebSocket):
                     for m in messages_for_grpc
                 ],
                 session_id=session_id,
+                context_doc_ids=context_doc_ids(context_docs),
+                model_name=data.get("model"),
             )
 
             assistant_response = ""
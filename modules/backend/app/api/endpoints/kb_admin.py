@@ -1,10 +1,22 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
 from services.knowledge_service import knowledge_service
+from services.ingestion import ingestion_queue
+from services.reindex import directory_indexer
+from services.rerank import reranker
+from core.db_client import DEFAULT_COLLECTION, check_collection_name, vector_db, vector_store
+from services.extraction import SUPPORTED_SUFFIXES
+from services.uploads import UploadError, safe_filename, save_upload
+from core.settings import settings
 from pathlib import Path
+from typing import List, Optional
+import asyncio
+import re
 import uuid
 
 router = APIRouter()
 
+_TAG_RE = re.compile(r"^[\w-]{1,64}$")
+
 @router.get("/documents")
 async def list_documents(
     page: int = Query(1, ge=1),
@@ -14,30 +26,146 @@ async def list_documents(
 ):
     return await knowledge_service.paginated_list(page, page_size, search, by)
 
-@router.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
+def parse_document_options(collection: str, tags: str) -> tuple:
+    """校验集合名与逗号分隔的标签，返回 (集合名, 标签列表)"""
+    try:
+        collection = check_collection_name(collection or DEFAULT_COLLECTION)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    tag_list: List[str] = list(dict.fromkeys(t.strip() for t in tags.split(",") if t.strip()))
+    invalid = [t for t in tag_list if not _TAG_RE.match(t)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"无效的标签: {', '.join(invalid)}")
+    return collection, tag_list
+
+@router.post("/upload", status_code=202)
+async def upload_document(
+    file: UploadFile = File(...),
+    collection: str = Form(DEFAULT_COLLECTION, description="写入的知识库集合"),
+    tags: str = Form("", description="逗号分隔的标签"),
+):
+    """
+    保存上传的文件并登记入库任务，立即返回任务 ID；
+    提取、分块、嵌入与写库在后台完成，进度见 /jobs/{job_id}。
+    """
+    collection, tag_list = parse_document_options(collection, tags)
+    try:
+        file_name = safe_filename(file.filename)
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if file_name.lower().split(".")[-1] not in SUPPORTED_SUFFIXES:
+        raise HTTPException(status_code=400, detail="不支持的文件类型")
     try:
-        save_dir = Path("/app/data/knowledge")
-        save_dir.mkdir(parents=True, exist_ok=True)
         unique_id = str(uuid.uuid4())
-        save_path = save_dir / f"{unique_id}_{file.filename}"
+        save_path = Path(settings.KB_UPLOAD_DIR) / f"{unique_id}_{file_name}"
+        saved = await save_upload(file, save_path)
+        return await submit_document(unique_id, file_name, saved, collection, tag_list)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"上传失败: {e}")
 
-        file_bytes = await file.read()
-        with open(save_path, "wb") as f:
-            f.write(file_bytes)
+async def submit_document(
+    doc_id: str,
+    file_name: str,
+    saved: dict,
+    collection: str = DEFAULT_COLLECTION,
+    tags: Optional[List[str]] = None,
+) -> dict:
+    """登记已保存文件的入库任务；内容重复时删除新文件并返回已有文档"""
+    job = await ingestion_queue.submit(
+        doc_id, file_name, saved["path"], saved["sha256"], collection, tags or []
+    )
+    duplicate = job["doc_id"] != doc_id
+    if duplicate:
+        Path(saved["path"]).unlink(missing_ok=True)
+    return {
+        "success": True,
+        "message": f"文档 '{file_name}' 与已有文档内容相同" if duplicate
+        else f"文档 '{file_name}' 已加入处理队列",
+        "id": job["doc_id"],
+        "job_id": job["id"],
+        "sha256": saved["sha256"],
+        "duplicate": duplicate,
+        "collection": collection,
+    }
 
-        doc_id = knowledge_service.add_document(file.filename, file_bytes, doc_id=unique_id)
-        await knowledge_service.embed_document(doc_id, file.filename)
+@router.get("/jobs")
+async def list_jobs(
+    status: Optional[str] = Query(None, regex="^(queued|running|succeeded|failed|deleted)$"),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    return await ingestion_queue.list(status, limit)
 
-        return {"success": True, "message": f"文档 '{file.filename}' 上传成功", "id": doc_id}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"上传失败: {e}")
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """任务状态、进度百分比与各阶段耗时（秒）"""
+    job = await ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    return job
+
+@router.post("/jobs/{job_id}/retry")
+async def retry_job(job_id: str):
+    job = await ingestion_queue.retry(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    return job
+
+@router.post("/reindex", status_code=202)
+async def reindex():
+    """后台增量同步知识库目录与向量库"""
+    if directory_indexer.running:
+        return {"success": False, "message": "索引任务正在运行"}
+    asyncio.create_task(directory_indexer.run())
+    return {"success": True, "message": "已开始增量索引"}
+
+@router.get("/reindex")
+async def reindex_status():
+    return {"running": directory_indexer.running, "last_run": directory_indexer.last_run}
+
+@router.get("/collections")
+async def list_collections():
+    """所有知识库集合及其分块数"""
+    def collect():
+        # 打开集合与统计分块数都会读磁盘，整体放到线程里，不阻塞事件循环
+        return [
+            {"name": c.collection_name, "count": c.index.stats().get("count", 0)}
+            for c in vector_store.all()
+        ]
+
+    return await asyncio.to_thread(collect)
+
+@router.get("/vector-stats")
+async def vector_stats():
+    """向量库写入吞吐：累计写入条数、批数、耗时与每秒条数"""
+    return vector_db.write_stats()
+
+@router.get("/rerank-stats")
+async def rerank_stats():
+    """重排调用次数、超时与失败次数（均已回退到检索顺序）及分数缓存命中情况"""
+    return reranker.stats()
+
+@router.post("/vector-benchmark")
+async def vector_benchmark(
+    queries: int = Query(100, ge=1, le=2000),
+    top_k: int = Query(10, ge=1, le=100),
+    nprobe: Optional[int] = Query(None, ge=1),
+):
+    """量化索引与未量化检索相对精确检索的 recall@k 及延迟，以及内存占用"""
+    try:
+        result = await asyncio.to_thread(vector_db.index.benchmark, queries, top_k, nprobe)
+    except NotImplementedError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**result, "memory": vector_db.index.memory_report()}
 
 @router.delete("/documents/{doc_id}")
 async def delete_document(doc_id: str):
     if not doc_id or doc_id == "undefined":
         raise HTTPException(status_code=400, detail="Invalid document ID")
-    success = await knowledge_service.delete_documents_by_id(doc_id)
+    # 先把入库任务标记为已删除：排队中的任务不再执行，执行中的任务自行取消并清理；
+    # 之后重新上传相同内容也不会被当成重复文件
+    jobs = await ingestion_queue.mark_deleted(doc_id)
+    # 仍在入库的文档还没有文本文件，同样可以删除
+    success = await knowledge_service.delete_documents_by_id(doc_id, missing_ok=jobs > 0)
     if not success:
         raise HTTPException(status_code=500, detail=f"删除失败: ID {doc_id}")
     return {"success": True, "message": f"文档已删除: {doc_id}"}
\ No newline at end of file
@@ -21,6 +21,17 @@ async def list_models():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/stats")
+async def service_stats():
+    """
+    推理服务的加载耗时与运行时计数
+    """
+    try:
+        return await grpc_client_manager.get_service_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/load/{model_name}")
 async def load_model(model_name: str, model_type: str = Body("generation")):
     """
@@ -49,7 +60,9 @@ async def upload_model(file: UploadFile = File(...)):
     上传新模型文件到 /models 目录
     """
     try:
-        await model_service.upload_model(file)
-        return {"success": True, "message": f"模型 {file.filename} 上传成功!"}
+        result = await model_service.upload_model(file)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
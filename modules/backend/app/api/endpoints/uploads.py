@@ -0,0 +1,109 @@
+import uuid
+from pathlib import Path
+from typing import Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+
+from api.endpoints.kb_admin import parse_document_options, submit_document
+from core.db_client import DEFAULT_COLLECTION
+from core.settings import settings
+from services.extraction import SUPPORTED_SUFFIXES
+from services.uploads import OffsetMismatch, UploadError, resumable_uploads, safe_filename
+
+router = APIRouter()
+
+MODEL_SUFFIXES = (".gguf", ".safetensors")
+
+
+class UploadCreateRequest(BaseModel):
+    filename: str
+    size: int = Field(..., ge=0, description="文件总字节数")
+    target: Literal["model", "document"] = "document"
+    sha256: Optional[str] = Field(None, description="可选，完成时校验")
+
+
+def _part_dir(target: str) -> Path:
+    # 分片写在最终目录下，完成时同一文件系统内改名
+    return Path(settings.MODEL_DIR if target == "model" else settings.KB_UPLOAD_DIR)
+
+
+@router.post("")
+async def create_upload(request: UploadCreateRequest):
+    """
+    创建可续传上传会话，之后用 PUT /{upload_id}?offset=N 顺序上传分片
+    （请求体为原始字节），最后 POST /{upload_id}/complete。
+    """
+    try:
+        name = safe_filename(request.filename)
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if request.target == "model" and not name.endswith(MODEL_SUFFIXES):
+        raise HTTPException(status_code=400, detail="只允许上传 .gguf 或 .safetensors 文件")
+    if request.target == "document" and name.lower().split(".")[-1] not in SUPPORTED_SUFFIXES:
+        raise HTTPException(status_code=400, detail="不支持的文件类型")
+    return resumable_uploads.create(
+        name, request.size, request.target, _part_dir(request.target), request.sha256
+    )
+
+
+@router.get("/{upload_id}")
+async def upload_status(upload_id: str):
+    """已接收的字节数，断线后从这里续传"""
+    try:
+        status = resumable_uploads.status(upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"上传不存在: {upload_id}")
+    return status
+
+
+@router.put("/{upload_id}")
+async def upload_chunk(upload_id: str, request: Request, offset: int = Query(..., ge=0)):
+    try:
+        return await resumable_uploads.append(upload_id, offset, request.stream())
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"上传不存在: {upload_id}")
+    except OffsetMismatch as e:
+        return JSONResponse(status_code=409, content={"detail": str(e), "received": e.received})
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/{upload_id}/complete")
+async def complete_upload(
+    upload_id: str,
+    collection: str = Query(DEFAULT_COLLECTION, description="文档写入的知识库集合"),
+    tags: str = Query("", description="逗号分隔的文档标签"),
+):
+    collection, tag_list = parse_document_options(collection, tags)
+    try:
+        status = resumable_uploads.status(upload_id)
+        if status is None:
+            raise KeyError(upload_id)
+        name = status["filename"]
+        if status["target"] == "model":
+            saved = await resumable_uploads.complete(upload_id, Path(settings.MODEL_DIR) / name)
+            return {"success": True, "message": f"模型 {name} 上传成功", **saved}
+        doc_id = str(uuid.uuid4())
+        saved = await resumable_uploads.complete(
+            upload_id, Path(settings.KB_UPLOAD_DIR) / f"{doc_id}_{name}"
+        )
+        return await submit_document(doc_id, name, saved, collection, tag_list)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"上传不存在: {upload_id}")
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.delete("/{upload_id}")
+async def abort_upload(upload_id: str):
+    try:
+        aborted = resumable_uploads.abort(upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not aborted:
+        raise HTTPException(status_code=404, detail=f"上传不存在: {upload_id}")
+    return {"success": True}
@@ -1,7 +1,8 @@
 from fastapi import APIRouter
-from api.endpoints import chat, models, kb_admin
+from api.endpoints import chat, models, kb_admin, uploads
 
 api_router = APIRouter()
 api_router.include_router(chat.router, prefix="/chat", tags=["Chat"])
 api_router.include_router(models.router, prefix="/admin/models", tags=["Models"])
 api_router.include_router(kb_admin.router, prefix="/admin/kb", tags=["KnowledgeBaseAdmin"])
+api_router.include_router(uploads.router, prefix="/admin/uploads", tags=["Uploads"])
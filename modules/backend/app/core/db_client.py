@@ -1,70 +1,188 @@
 import os
+import re
+import asyncio
 import logging
-import chromadb
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from langchain_core.documents import Document
-from typing import List
+from typing import Dict, List, Optional
 
+from core.lexical_index import LexicalIndex
+from core.metadata_filter import normalize_where
+from core.settings import settings
+from core.vector_index import ChromaIndex, IVFIndex, VectorIndex
 from services.embedding import embedding_model
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_COLLECTION = "knowledge_base_main_collection"
+# 与 Chroma 的集合命名规则一致：3-63 个字符，字母数字开头结尾
+_COLLECTION_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{1,61}[A-Za-z0-9]$")
+
+
+def create_index(backend: str, collection_name: str) -> VectorIndex:
+    if backend == "chroma":
+        return ChromaIndex(os.getenv("CHROMA_PERSIST_DIR", "/app/chroma_store"), collection_name)
+    if backend == "ivf":
+        return IVFIndex(
+            os.path.join(settings.VECTOR_INDEX_DIR, collection_name),
+            nlist=settings.IVF_NLIST,
+            nprobe=settings.IVF_NPROBE,
+            train_min=settings.IVF_TRAIN_MIN,
+            compact_dead_ratio=settings.IVF_COMPACT_DEAD_RATIO,
+            compact_tail_ratio=settings.IVF_COMPACT_TAIL_RATIO,
+            quantization=settings.IVF_QUANTIZATION,
+            pq_m=settings.IVF_PQ_M,
+            rerank_factor=settings.IVF_RERANK_FACTOR,
+            filter_exact_max=settings.IVF_FILTER_EXACT_MAX,
+        )
+    raise ValueError(f"未知的向量索引后端: {backend}")
+
+
+def lexical_index_path(collection_name: str) -> str:
+    """默认集合沿用 ``LEXICAL_INDEX_PATH``，其他集合在旁边各用一个文件。"""
+    if collection_name == DEFAULT_COLLECTION:
+        return settings.LEXICAL_INDEX_PATH
+    root, ext = os.path.splitext(settings.LEXICAL_INDEX_PATH)
+    return f"{root}.{collection_name}{ext}"
+
+
+def check_collection_name(name: str) -> str:
+    if not _COLLECTION_RE.match(name or ""):
+        raise ValueError(f"无效的集合名: {name}")
+    return name
+
 
 class VectorDBClient:
     """
-    用于与 Chroma 本地嵌入式向量数据库交互的客户端。
+    单个集合的向量数据库客户端，具体存储由 ``VECTOR_INDEX_BACKEND`` 选择的
+    ``VectorIndex`` 实现（嵌入式 Chroma 或进程内 IVF 索引）。
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        collection_name: str = DEFAULT_COLLECTION,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ):
         try:
-            persist_dir = os.getenv("CHROMA_PERSIST_DIR", "/app/chroma_store")
-
-            self.client = chromadb.Client(
-                settings=chromadb.Settings(
-                    is_persistent=True,
-                    persist_directory=persist_dir,
-                )
+            self.collection_name = collection_name
+            self.index = create_index(settings.VECTOR_INDEX_BACKEND, self.collection_name)
+            # 分块正文的 BM25 倒排索引，与向量同步写入、删除
+            self.lexical = LexicalIndex(lexical_index_path(collection_name))
+            # 索引的读写都是阻塞调用，放到独立线程池里执行，不占用事件循环
+            self._executor = executor or ThreadPoolExecutor(
+                max_workers=settings.VECTOR_WRITE_THREADS, thread_name_prefix="vector-db"
             )
-
-            self.collection_name = "knowledge_base_main_collection"
-            self.collection = self.client.get_or_create_collection(
-                name=self.collection_name
+            self.batch_size = min(
+                settings.VECTOR_WRITE_BATCH_SIZE,
+                self.index.max_batch_size or settings.VECTOR_WRITE_BATCH_SIZE,
             )
-            logger.info(f"成功初始化嵌入式 ChromaDB 集合: '{self.collection_name}'，目录: {persist_dir}")
+            self._stats_lock = threading.Lock()
+            self.written = 0
+            self.write_batches = 0
+            self.write_seconds = 0.0
+            logger.info(f"成功初始化向量索引: '{self.collection_name}'，后端: {self.index.name}")
         except Exception as e:
             logger.error(f"初始化向量数据库失败: {e}", exc_info=True)
             raise
 
-    async def add_documents(self, documents: List[Document], embeddings: List[List[float]], document_source: str):
+    @staticmethod
+    def _metadatas(documents: List[Document], document_source: str) -> List[dict]:
+        # 保留分块元数据（偏移、页码、章节等），Chroma 不接受 None 值；
+        # 正文作为 document 单独保存，不再在元数据里重复一份
+        return [
+            {
+                **{k: v for k, v in doc.metadata.items() if v is not None},
+                "source": document_source,
+            }
+            for doc in documents
+        ]
+
+    def _upsert(self, ids: List[str], embeddings, metadatas: List[dict], texts: List[str]) -> None:
+        start = time.perf_counter()
+        for i in range(0, len(ids), self.batch_size):
+            end = i + self.batch_size
+            self.index.upsert(ids[i:end], embeddings[i:end], metadatas[i:end], texts[i:end])
+            self.lexical.upsert(ids[i:end], metadatas[i:end], texts[i:end])
+        with self._stats_lock:
+            self.written += len(ids)
+            self.write_batches += (len(ids) + self.batch_size - 1) // self.batch_size
+            self.write_seconds += time.perf_counter() - start
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def add_documents(
+        self,
+        documents: List[Document],
+        embeddings,
+        document_source: str,
+        start_index: int = 0,
+        ids: Optional[List[str]] = None,
+    ):
+        """Upsert chunks with their vectors; re-ingesting the same ids is idempotent."""
         try:
-            ids = [f"{document_source}_{i}" for i in range(len(documents))]
-            metadatas = [{"source": document_source, "text": doc.page_content} for doc in documents]
-            self.collection.add(embeddings=embeddings, metadatas=metadatas, ids=ids)
-            logger.info(f"成功添加 {len(documents)} 个文档片段到集合中，来源: {document_source}")
+            ids = ids or [f"{document_source}_{start_index + i}" for i in range(len(documents))]
+            await self._run(
+                self._upsert,
+                ids,
+                np.asarray(embeddings, dtype=np.float32),
+                self._metadatas(documents, document_source),
+                [doc.page_content for doc in documents],
+            )
+            logger.info(f"成功写入 {len(documents)} 个文档片段到集合中，来源: {document_source}")
         except Exception as e:
             logger.error(f"添加文档失败: {e}", exc_info=True)
+            raise
+
+    def bulk_writer(self, document_source: str) -> "BulkWriter":
+        return BulkWriter(self, document_source, self.batch_size)
+
+    def write_stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            return {
+                "written": self.written,
+                "batches": self.write_batches,
+                "write_seconds": self.write_seconds,
+                "records_per_second": self.written / self.write_seconds if self.write_seconds else 0.0,
+                "batch_size": self.batch_size,
+                "index": {"backend": self.index.name, **self.index.stats()},
+            }
+
+    def update_metadatas(self, ids: List[str], documents: List[Document], document_source: str):
+        """Rewrite chunk metadata (offsets, indices) without touching the vectors."""
+        if ids:
+            metadatas = self._metadatas(documents, document_source)
+            self.index.update_metadatas(ids, metadatas)
+            self.lexical.update_metadatas(ids, metadatas)
 
-    async def search_with_vector(self, query_embedding: List[float], top_k: int) -> List[Document]:
+    def delete_ids(self, ids: List[str]):
+        if ids:
+            self.index.delete(ids)
+            self.lexical.delete(ids)
+
+    def list_sources(self) -> List[str]:
+        return self.index.sources()
+
+    async def search_with_vector(
+        self, query_embedding: List[float], top_k: int, where: Optional[dict] = None
+    ) -> List[Document]:
+        """``where`` 为元数据过滤条件（见 ``core.metadata_filter``），在索引内先过滤再取 top_k。"""
         try:
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k,
-                include=["metadatas", "documents", "distances"],
-            )
+            hits = await self._run(self.index.query, query_embedding, top_k, normalize_where(where))
 
             found_docs = []
-            metas_list = results.get("metadatas", [[]])
-            docs_list = results.get("documents", [[]])
-            distances_list = results.get("distances", [[]])
-
-            if metas_list and metas_list[0]:
-                for i, metadata in enumerate(metas_list[0]):
-                    text = metadata.get("text")
-                    if not text and docs_list[0]:
-                        text = docs_list[0][i]
-                    distance = distances_list[0][i] if distances_list else None
-                    metadata["distance"] = distance
-                    if text:
-                        found_docs.append(Document(page_content=text, metadata=metadata))
+            for hit in hits:
+                metadata = dict(hit.metadata)
+                metadata["chunk_id"] = hit.id
+                metadata["collection"] = self.collection_name
+                # 旧数据的正文存在元数据 "text" 里
+                text = hit.text or metadata.pop("text", None)
+                metadata["distance"] = hit.distance
+                if text:
+                    found_docs.append(Document(page_content=text, metadata=metadata))
 
             logger.info(f"通过向量搜索找到 {len(found_docs)} 个文档。")
             return found_docs
@@ -72,23 +190,162 @@ class VectorDBClient:
             logger.error(f"向量搜索失败: {e}", exc_info=True)
             return []
 
-    async def asimilarity_search(self, query: str, k: int = 3) -> List[Document]:
+    async def lexical_search(
+        self, query: str, top_k: int, where: Optional[dict] = None
+    ) -> List[Document]:
+        """BM25 search over chunk text; exact codes and numbers match here."""
+        try:
+            hits = await self._run(self.lexical.search, query, top_k, normalize_where(where))
+        except Exception as e:
+            logger.error(f"关键词搜索失败: {e}", exc_info=True)
+            return []
+        return [
+            Document(
+                page_content=text,
+                metadata={
+                    **metadata,
+                    "chunk_id": id_,
+                    "collection": self.collection_name,
+                    "bm25": score,
+                },
+            )
+            for id_, text, metadata, score in hits
+        ]
+
+    def rebuild_lexical(self) -> int:
+        """Fill the BM25 index from the vector store (chunks written before it existed)."""
+        count = 0
+        for ids, metadatas, texts in self.index.scan():
+            self.lexical.upsert(ids, metadatas, texts)
+            count += len(ids)
+        logger.info(f"关键词索引重建完成，共 {count} 个分块")
+        return count
+
+    async def asimilarity_search(
+        self, query: str, k: int = 3, where: Optional[dict] = None
+    ) -> List[Document]:
         try:
             query_embedding = await embedding_model.embed(query)
             if not query_embedding:
                 logger.warning("未能获得有效的 embedding。")
                 return []
-            return await self.search_with_vector(query_embedding, k)
+            return await self.search_with_vector(query_embedding, k, where)
         except Exception as e:
             logger.error(f"相似度搜索失败: {e}", exc_info=True)
             return []
 
     def delete_documents_by_source(self, source: str):
         try:
-            self.collection.delete(where={"source": source})
+            self.index.delete_source(source)
+            self.lexical.delete_source(source)
             logger.info(f"已删除来源为 '{source}' 的文档。")
         except Exception as e:
             logger.error(f"删除文档失败: {e}", exc_info=True)
 
 
-vector_db = VectorDBClient()
+class BulkWriter:
+    """
+    缓冲待写入的分块，攒满 ``batch_size`` 条后在线程池中批量 upsert。
+
+    同一时间最多一批在写，下一批在事件循环里继续缓冲，写库与嵌入重叠；
+    ``async with`` 退出时写入剩余记录并等待完成。
+    """
+
+    def __init__(self, db: VectorDBClient, document_source: str, batch_size: int):
+        self.db = db
+        self.document_source = document_source
+        self.batch_size = batch_size
+        self._ids: List[str] = []
+        self._embeddings = np.empty((0, 0), dtype=np.float32)
+        self._metadatas: List[dict] = []
+        self._texts: List[str] = []
+        self._pending: Optional[asyncio.Future] = None
+
+    async def add(
+        self,
+        documents: List[Document],
+        embeddings,
+        start_index: int = 0,
+        ids: Optional[List[str]] = None,
+    ) -> None:
+        self._ids += ids or [
+            f"{self.document_source}_{start_index + i}" for i in range(len(documents))
+        ]
+        # 向量以 float32 数组缓冲，不再展开成 Python 列表
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        self._embeddings = (
+            np.concatenate([self._embeddings, embeddings]) if len(self._embeddings) else embeddings
+        )
+        self._metadatas += self.db._metadatas(documents, self.document_source)
+        self._texts += [doc.page_content for doc in documents]
+        while len(self._ids) >= self.batch_size:
+            await self._flush(self.batch_size)
+
+    async def _flush(self, count: Optional[int] = None) -> None:
+        if self._pending is not None:
+            await self._pending
+            self._pending = None
+        if not self._ids:
+            return
+        count = count or len(self._ids)
+        batch = (self._ids[:count], self._embeddings[:count], self._metadatas[:count], self._texts[:count])
+        del self._ids[:count], self._metadatas[:count], self._texts[:count]
+        self._embeddings = self._embeddings[count:]
+        self._pending = asyncio.ensure_future(self.db._run(self.db._upsert, *batch))
+
+    async def close(self) -> None:
+        await self._flush()
+        if self._pending is not None:
+            await self._pending
+            self._pending = None
+
+    async def __aenter__(self) -> "BulkWriter":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            await self.close()
+        elif self._pending is not None:
+            await asyncio.gather(self._pending, return_exceptions=True)
+
+
+class VectorStore:
+    """
+    按名称管理多个集合（如按租户或产品线划分），每个集合各有向量索引与
+    关键词索引，共用一个线程池。集合在首次使用时打开，写入时自动创建。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.VECTOR_WRITE_THREADS, thread_name_prefix="vector-db"
+        )
+        self._clients: Dict[str, VectorDBClient] = {}
+        self.default = self.collection(DEFAULT_COLLECTION)
+
+    def names(self) -> List[str]:
+        with self._lock:
+            opened = set(self._clients)
+        return sorted(opened | set(self.default.index.collections()))
+
+    def collection(self, name: Optional[str] = None, create: bool = True) -> VectorDBClient:
+        """打开集合；``create=False`` 时集合不存在则抛出 ``ValueError``（查询不应建出空集合）。"""
+        name = check_collection_name(name or DEFAULT_COLLECTION)
+        with self._lock:
+            client = self._clients.get(name)
+        if client is not None:
+            return client
+        if not create and name not in self.names():
+            raise ValueError(f"集合不存在: {name}")
+        with self._lock:
+            if name not in self._clients:
+                self._clients[name] = VectorDBClient(name, self._executor)
+            return self._clients[name]
+
+    def all(self) -> List[VectorDBClient]:
+        return [self.collection(name) for name in self.names()]
+
+
+vector_store = VectorStore()
+# 未指定集合的读写都走默认集合
+vector_db = vector_store.default
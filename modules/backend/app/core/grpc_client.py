@@ -3,14 +3,39 @@ from protos import inference_pb2
 from protos import inference_pb2_grpc
 from core.settings import settings
 import logging
-from typing import List, Optional
+from typing import AsyncIterable, AsyncIterator, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+_EMBEDDING_ENCODINGS = {
+    "values": inference_pb2.EMBEDDING_VALUES,
+    "float32": inference_pb2.EMBEDDING_FLOAT32,
+    "float16": inference_pb2.EMBEDDING_FLOAT16,
+}
+_PACKED_DTYPES = {
+    inference_pb2.EMBEDDING_FLOAT32: np.dtype("<f4"),
+    inference_pb2.EMBEDDING_FLOAT16: np.dtype("<f2"),
+}
+
+
+
+def _unpack(resp) -> np.ndarray:
+    """Decode a packed embedding response into a float32 matrix without copying."""
+    if resp.rows == 0:
+        return np.empty((0, resp.dim), dtype=np.float32)
+    dtype = _PACKED_DTYPES[resp.packed_encoding]
+    matrix = np.frombuffer(resp.packed, dtype=dtype).reshape(resp.rows, resp.dim)
+    return matrix if dtype == np.float32 else matrix.astype(np.float32)
+
+
 class GrpcClientManager:
     def __init__(self):
         self.channel: Optional[grpc.aio.Channel] = None
         self.stub: Optional[inference_pb2_grpc.InferenceServiceStub] = None
+        # 最近一次嵌入响应中的模型名
+        self.embedding_model_name: str = ""
 
     async def connect(self):
         """连接到 gRPC 推理服务。settings.GRPC_SERVER 建议配置为 'inference:50051'。"""
@@ -46,14 +71,78 @@ class GrpcClientManager:
             logger.error(f"gRPC chat error: {e}")
             yield f"[Error: {e}]"
 
-    async def get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+    async def get_embeddings_array(self, texts: List[str]) -> np.ndarray:
+        """
+        以打包的二进制格式获取向量，直接解码为 (len(texts), dim) 的 float32 矩阵。
+        """
         if not self.stub:
             raise ConnectionError("gRPC not connected")
         if not texts:
-            return []
-        req = inference_pb2.EmbeddingBatchRequest(texts=texts)
+            return np.empty((0, 0), dtype=np.float32)
+        req = inference_pb2.EmbeddingBatchRequest(
+            texts=texts, encoding=_EMBEDDING_ENCODINGS[settings.EMBEDDING_TRANSPORT]
+        )
         resp = await self.stub.GetEmbeddingsBatch(req)
-        return [list(e.values) for e in resp.embeddings]
+        self.embedding_model_name = resp.model_name
+        if resp.packed_encoding == inference_pb2.EMBEDDING_VALUES:
+            # 旧版推理服务只返回 repeated float
+            return np.array([e.values for e in resp.embeddings], dtype=np.float32)
+        return _unpack(resp)
+
+    async def embed_stream(
+        self,
+        texts: Union[Iterable[str], AsyncIterable[str]],
+        group_size: int = 64,
+    ) -> AsyncIterator[Tuple[int, np.ndarray]]:
+        """
+        通过 EmbedStream 流式获取向量，按顺序产出 (offset, 向量矩阵)。
+
+        ``texts`` 可以是异步迭代器，文本边产生边发送，提取、嵌入与写库可以重叠。
+        """
+        if not self.stub:
+            raise ConnectionError("gRPC not connected")
+        encoding = _EMBEDDING_ENCODINGS[settings.EMBEDDING_TRANSPORT]
+
+        async def each_text():
+            if isinstance(texts, AsyncIterable):
+                async for text in texts:
+                    yield text
+            else:
+                for text in texts:
+                    yield text
+
+        async def requests():
+            group = []
+            async for text in each_text():
+                group.append(text)
+                if len(group) >= group_size:
+                    yield inference_pb2.EmbedStreamRequest(texts=group, encoding=encoding)
+                    group = []
+            if group:
+                yield inference_pb2.EmbedStreamRequest(texts=group, encoding=encoding)
+
+        async for resp in self.stub.EmbedStream(requests()):
+            logger.debug(f"EmbedStream progress: {resp.processed}/{resp.received}")
+            self.embedding_model_name = resp.model_name
+            yield resp.offset, _unpack(resp)
+
+    async def get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        return (await self.get_embeddings_array(texts)).tolist()
+
+    async def rerank(self, query: str, texts: List[str]) -> Tuple[List[float], str]:
+        """Cross-encoder scores for ``(query, text)`` pairs and the rerank model name."""
+        if not self.stub:
+            raise ConnectionError("gRPC not connected")
+        resp = await self.stub.Rerank(inference_pb2.RerankRequest(query=query, texts=texts))
+        return list(resp.scores), resp.model_name
+
+    async def invalidate_cache(self, doc_ids: List[str]) -> int:
+        """Drop cached answers that were generated from the given documents."""
+        if not self.stub:
+            raise ConnectionError("gRPC not connected")
+        req = inference_pb2.InvalidateCacheRequest(doc_ids=doc_ids)
+        resp = await self.stub.InvalidateCache(req)
+        return resp.removed
 
     async def list_models(self):
         if not self.stub:
@@ -66,6 +155,23 @@ class GrpcClientManager:
             "current_generation_model": resp.current_generation_model,
             "current_embedding_model": resp.current_embedding_model,
             "device": getattr(resp, "device", ""),
+            "resident_models": list(resp.resident_models),
+            "loading_model": resp.loading_model,
+            "load_progress": resp.load_progress,
+            "memory_total_bytes": resp.memory_total_bytes,
+            "memory_available_bytes": resp.memory_available_bytes,
+            "resident_model_bytes": resp.resident_model_bytes,
+        }
+
+    async def get_service_stats(self):
+        """Load-phase timings and runtime counters of the inference service."""
+        if not self.stub:
+            raise ConnectionError("gRPC not connected")
+        resp = await self.stub.GetServiceStats(inference_pb2.Empty())
+        return {
+            "ready": resp.ready,
+            "load_seconds": dict(resp.load_seconds),
+            "counters": dict(resp.counters),
         }
 
     async def switch_model(
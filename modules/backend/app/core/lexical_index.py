@@ -0,0 +1,175 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from typing import List, Optional, Sequence, Set, Tuple
+
+from core.metadata_filter import where_to_sql
+
+logger = logging.getLogger(__name__)
+
+# 中日韩文字按字切分后取二元组；字母数字按词切分
+_CJK = r"぀-ヿ㐀-䶿一-鿿가-힯豈-﫿"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[^\W_{_CJK}]+(?:[-_./:][^\W_{_CJK}]+)*")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+_PART_RE = re.compile(r"[-_./:]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中文友好的分词：汉字串切成重叠的二元组（单字串保留单字），
+    字母数字串按词小写。``ERR-1042``、``v2.3.1`` 这类编号同时产出
+    整体（去掉分隔符）和各段，精确的产品编号、错误码也能命中。
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(unicodedata.normalize("NFKC", text).lower()):
+        word = match.group()
+        if _CJK_RE.match(word):
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i : i + 2] for i in range(len(word) - 1))
+        elif _PART_RE.search(word):
+            parts = [p for p in _PART_RE.split(word) if p]
+            tokens.append("".join(parts))
+            tokens.extend(parts)
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def _match_expression(tokens: Sequence[str], operator: str) -> str:
+    quoted = ['"' + t.replace('"', '""') + '"' for t in dict.fromkeys(tokens)]
+    return f" {operator} ".join(quoted)
+
+
+class LexicalIndex:
+    """
+    分块正文的持久化倒排索引（SQLite FTS5，BM25 打分）。
+
+    分词在 Python 里完成，FTS5 只按空格切分预先分好的词；写入、删除
+    与向量库同步增量进行，``VectorDBClient`` 负责调用。
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chunks (
+                    rowid INTEGER PRIMARY KEY,
+                    id TEXT NOT NULL UNIQUE,
+                    source TEXT,
+                    text TEXT NOT NULL,
+                    metadata TEXT NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source)")
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chunk_terms"
+                " USING fts5(terms, tokenize = \"unicode61 categories 'L* N* Co'\")"
+            )
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def _delete_rows(self, rowids: List[int]) -> None:
+        self._conn.executemany("DELETE FROM chunk_terms WHERE rowid = ?", [(r,) for r in rowids])
+        self._conn.executemany("DELETE FROM chunks WHERE rowid = ?", [(r,) for r in rowids])
+
+    def _rowids(self, ids: Sequence[str]) -> List[int]:
+        rowids = []
+        for i in range(0, len(ids), 500):
+            part = list(ids[i : i + 500])
+            rowids += [
+                r
+                for (r,) in self._conn.execute(
+                    f"SELECT rowid FROM chunks WHERE id IN ({','.join('?' * len(part))})", part
+                )
+            ]
+        return rowids
+
+    def upsert(self, ids: Sequence[str], metadatas: Sequence[dict], texts: Sequence[str]) -> None:
+        rows = [(id_, meta, text or "") for id_, meta, text in zip(ids, metadatas, texts)]
+        terms = [" ".join(tokenize(text)) for _, _, text in rows]
+        with self._lock, self._conn:
+            self._delete_rows(self._rowids(ids))
+            for (id_, meta, text), doc_terms in zip(rows, terms):
+                cursor = self._conn.execute(
+                    "INSERT INTO chunks (id, source, text, metadata) VALUES (?, ?, ?, ?)",
+                    (id_, meta.get("source"), text, json.dumps(meta, ensure_ascii=False)),
+                )
+                self._conn.execute(
+                    "INSERT INTO chunk_terms (rowid, terms) VALUES (?, ?)",
+                    (cursor.lastrowid, doc_terms),
+                )
+
+    def update_metadatas(self, ids: Sequence[str], metadatas: Sequence[dict]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE chunks SET metadata = ?, source = ? WHERE id = ?",
+                [
+                    (json.dumps(meta, ensure_ascii=False), meta.get("source"), id_)
+                    for id_, meta in zip(ids, metadatas)
+                ],
+            )
+
+    def delete(self, ids: Sequence[str]) -> None:
+        with self._lock, self._conn:
+            self._delete_rows(self._rowids(ids))
+
+    def delete_source(self, source: str) -> None:
+        with self._lock, self._conn:
+            rowids = [
+                r for (r,) in self._conn.execute("SELECT rowid FROM chunks WHERE source = ?", (source,))
+            ]
+            self._delete_rows(rowids)
+
+    def search(
+        self, query: str, top_k: int, where: Optional[dict] = None
+    ) -> List[Tuple[str, str, dict, float]]:
+        """
+        Return ``(id, text, metadata, bm25 score)``, best first; any query term
+        may match. ``where`` (a normalized metadata filter) is applied before LIMIT.
+        """
+        tokens = tokenize(query)
+        if not tokens or top_k <= 0:
+            return []
+        clause, params = where_to_sql(where, "c") if where else ("1", [])
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT c.id, c.text, c.metadata, bm25(chunk_terms) AS score
+                FROM chunk_terms JOIN chunks c ON c.rowid = chunk_terms.rowid
+                WHERE chunk_terms MATCH ? AND ({clause})
+                ORDER BY score
+                LIMIT ?
+                """,
+                (_match_expression(tokens, "OR"), *params, top_k),
+            ).fetchall()
+        # FTS5 的 bm25() 越小越相关，这里取反
+        return [(id_, text, json.loads(meta), -score) for id_, text, meta, score in rows]
+
+    def matching_sources(self, query: str) -> Set[str]:
+        """Sources with at least one chunk containing every query term."""
+        tokens = tokenize(query)
+        if not tokens:
+            return set()
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT DISTINCT c.source
+                FROM chunk_terms JOIN chunks c ON c.rowid = chunk_terms.rowid
+                WHERE chunk_terms MATCH ?
+                """,
+                (_match_expression(tokens, "AND"),),
+            ).fetchall()
+        return {source for (source,) in rows if source}
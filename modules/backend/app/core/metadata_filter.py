@@ -0,0 +1,87 @@
+import re
+from typing import Any, List, Optional, Tuple
+
+# Chroma 风格的元数据过滤条件（子集），IVF 与关键词索引把它编译成 SQL，
+# Chroma 后端直接透传给 ``where=``：
+#   {"source": "a.pdf"}                         等值
+#   {"uploaded_at": {"$gte": 1700000000}}       比较：$eq $ne $gt $gte $lt $lte
+#   {"doc_type": {"$in": ["pdf", "docx"]}}      集合：$in $nin
+#   {"$and": [...]} / {"$or": [...]}            组合；顶层多个字段按 $and 处理
+_COMPARISONS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+_MEMBERSHIP = {"$in": "IN", "$nin": "NOT IN"}
+_LOGICAL = {"$and": "AND", "$or": "OR"}
+_KEY_RE = re.compile(r"^[^$\"\\][^\"\\]*$")
+# 这些字段在 SQLite 表里有单独的列（带索引），不必解析 JSON
+_COLUMNS = {"source"}
+
+
+def _check_value(key: str, value: Any) -> None:
+    if isinstance(value, (bool, int, float, str)):
+        return
+    raise ValueError(f"过滤字段 '{key}' 的值必须是字符串、数字或布尔值")
+
+
+def normalize_where(where: Optional[dict]) -> Optional[dict]:
+    """
+    校验过滤条件并规范成 Chroma 接受的形式：每层只有一个键，
+    多个字段改写成 ``$and``，字段简写改写成 ``{"$eq": value}``。
+    条件无效时抛出 ``ValueError``；空条件返回 None。
+    """
+    if not where:
+        return None
+    if not isinstance(where, dict):
+        raise ValueError("过滤条件必须是 JSON 对象")
+    clauses = []
+    for key, value in where.items():
+        if key in _LOGICAL:
+            if not isinstance(value, list) or not value:
+                raise ValueError(f"'{key}' 需要非空的条件列表")
+            parts = [normalize_where(part) for part in value]
+            parts = [p for p in parts if p]
+            if len(parts) == 1:
+                clauses.append(parts[0])
+            elif parts:
+                clauses.append({key: parts})
+            continue
+        if not _KEY_RE.match(key):
+            raise ValueError(f"无效的过滤字段: {key}")
+        if not isinstance(value, dict):
+            value = {"$eq": value}
+        if len(value) != 1:
+            raise ValueError(f"过滤字段 '{key}' 每个条件只能有一个运算符")
+        (op, operand), = value.items()
+        if op in _COMPARISONS:
+            _check_value(key, operand)
+        elif op in _MEMBERSHIP:
+            if not isinstance(operand, list) or not operand:
+                raise ValueError(f"'{op}' 需要非空列表")
+            for item in operand:
+                _check_value(key, item)
+        else:
+            raise ValueError(f"不支持的过滤运算符: {op}")
+        clauses.append({key: {op: operand}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def where_to_sql(where: dict, table: str = "") -> Tuple[str, List[Any]]:
+    """
+    把规范化后的条件编译成 SQL 表达式与参数，作用于带 ``source`` 列和
+    JSON ``metadata`` 列的表；缺少该字段的记录不匹配任何比较（含 ``$ne``）。
+    """
+    prefix = f"{table}." if table else ""
+    (key, value), = where.items()
+    if key in _LOGICAL:
+        parts = [where_to_sql(part, table) for part in value]
+        sql = f" {_LOGICAL[key]} ".join(f"({s})" for s, _ in parts)
+        return sql, [p for _, params in parts for p in params]
+    if key in _COLUMNS:
+        column, params = f"{prefix}{key}", []
+    else:
+        column, params = f"json_extract({prefix}metadata, ?)", [f'$."{key}"']
+    (op, operand), = value.items()
+    if op in _MEMBERSHIP:
+        marks = ", ".join("?" * len(operand))
+        return f"{column} {_MEMBERSHIP[op]} ({marks})", params + list(operand)
+    return f"{column} {_COMPARISONS[op]} ?", params + [operand]
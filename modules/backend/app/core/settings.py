@@ -8,6 +8,79 @@ class Settings(BaseSettings):
 
     # gRPC服务器地址，强烈建议仅用一个环境变量
     GRPC_SERVER: str = "inference:50051"  # 默认
+    # 向量传输格式：float32 / float16（打包二进制）或 values（旧的 repeated float）
+    EMBEDDING_TRANSPORT: str = "float32"
+    # 查询向量的进程内缓存：条目数、有效期（秒）、可缓存文本的最大长度
+    QUERY_EMBEDDING_CACHE_SIZE: int = 1024
+    QUERY_EMBEDDING_CACHE_TTL: int = 600
+    QUERY_EMBEDDING_CACHE_MAX_CHARS: int = 2000
+
+    # 知识库分块：每块最大 token 数与相邻块重叠的 token 数；
+    # CHUNK_TOKENIZER 为 HuggingFace 分词器名称或路径，留空时近似估算 token 数
+    CHUNK_SIZE_TOKENS: int = 400
+    CHUNK_OVERLAP_TOKENS: int = 50
+    CHUNK_TOKENIZER: str = ""
+
+    # 入库任务队列：任务库路径、并发任务数、文本提取进程数、最大尝试次数、
+    # 首次重试等待秒数（之后指数退避）、每组嵌入的分块数
+    INGEST_DB_PATH: str = "/app/data/ingest_jobs.sqlite3"
+    INGEST_WORKERS: int = 2
+    INGEST_PROCESS_WORKERS: int = 2
+    INGEST_MAX_ATTEMPTS: int = 3
+    INGEST_RETRY_DELAY: float = 5.0
+    INGEST_EMBED_GROUP_SIZE: int = 64
+    # 上传：知识库原始文件目录、可续传上传的会话目录、流式读写的块大小（字节）
+    KB_UPLOAD_DIR: str = "/app/data/knowledge"
+    UPLOAD_TMP_DIR: str = "/app/data/uploads"
+    UPLOAD_CHUNK_BYTES: int = 1024 * 1024
+    # 可续传上传的会话超过多少秒没有新数据即清理（连同分片文件，0 表示不清理）、清理间隔秒数
+    UPLOAD_SESSION_TTL: int = 24 * 3600
+    UPLOAD_SWEEP_INTERVAL: int = 3600
+
+    # 向量库写入：每批 upsert 的记录数（不超过 Chroma 的上限）、执行读写的线程数
+    VECTOR_WRITE_BATCH_SIZE: int = 512
+    VECTOR_WRITE_THREADS: int = 2
+    # 向量索引后端："chroma"（嵌入式 Chroma）或 "ivf"（进程内内存映射 IVF 索引）及其数据目录
+    VECTOR_INDEX_BACKEND: str = "chroma"
+    VECTOR_INDEX_DIR: str = "/app/data/vector_index"
+    # IVF 索引：聚类数上限、查询探测的聚类数、开始训练聚类的最少向量数（之前全量扫描）、
+    # 墓碑占比与未排序尾部占比超过阈值时后台压缩
+    IVF_NLIST: int = 1024
+    IVF_NPROBE: int = 16
+    IVF_TRAIN_MIN: int = 20000
+    IVF_COMPACT_DEAD_RATIO: float = 0.2
+    IVF_COMPACT_TAIL_RATIO: float = 0.2
+    # IVF 向量量化："none"、"int8"（每维 1 字节）或 "pq"（每向量 IVF_PQ_M 字节）；
+    # 量化检索取 top_k * IVF_RERANK_FACTOR 个候选再用 float32 原始向量精排
+    IVF_QUANTIZATION: str = "none"
+    IVF_PQ_M: int = 64
+    IVF_RERANK_FACTOR: int = 4
+    # 带元数据过滤的 IVF 查询：匹配行不超过此数时直接对匹配行精确检索，否则在 IVF 扫描中屏蔽其余行
+    IVF_FILTER_EXACT_MAX: int = 20000
+    # 混合检索：BM25 倒排索引路径；是否在向量检索之外融合 BM25 结果；
+    # 每路检索的候选数、倒数排名融合（RRF）的平滑常数 k
+    LEXICAL_INDEX_PATH: str = "/app/data/lexical_index.sqlite3"
+    HYBRID_SEARCH: bool = True
+    HYBRID_CANDIDATES: int = 20
+    RRF_K: int = 60
+    # 交叉编码器重排：是否启用、送去重排的候选数、重排的延迟预算（毫秒，超时按检索顺序返回）、
+    # 分数缓存条目数与有效期（秒）、推理服务未加载重排模型时暂停重排的秒数
+    RERANK_ENABLED: bool = True
+    RERANK_CANDIDATES: int = 20
+    RERANK_TIMEOUT_MS: int = 300
+    RERANK_CACHE_SIZE: int = 10000
+    RERANK_CACHE_TTL: int = 3600
+    RERANK_RETRY_SECONDS: float = 30.0
+
+    # 知识库目录增量索引：清单路径、并发处理的文件数、是否在启动时运行
+    REINDEX_MANIFEST_PATH: str = "/app/data/index_manifest.sqlite3"
+    REINDEX_CONCURRENCY: int = 4
+    REINDEX_ON_STARTUP: bool = False
+
+    # 文本提取：PDF 每个进程任务处理的页数；是否按文件内容哈希缓存提取结果及缓存目录
+    EXTRACT_PAGES_PER_TASK: int = 16
+    EXTRACT_CACHE: bool = True
+    EXTRACT_CACHE_DIR: str = "/app/data/extract_cache"
 
     # 模型、数据库等路径
     MODEL_DIR: str = "/models"
@@ -0,0 +1,1044 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.metadata_filter import where_to_sql
+
+logger = logging.getLogger(__name__)
+
+
+class SearchHit:
+    __slots__ = ("id", "text", "metadata", "distance")
+
+    def __init__(self, id: str, text: Optional[str], metadata: dict, distance: float):
+        self.id = id
+        self.text = text
+        self.metadata = metadata
+        self.distance = distance
+
+
+class VectorIndex:
+    """
+    向量索引接口。``VectorDBClient`` 只通过这些方法读写，具体实现可以是
+    Chroma 或进程内的 IVF 索引。所有方法都是阻塞调用，由调用方放到线程池执行。
+    距离统一为平方 L2（与 Chroma 默认一致）。
+    """
+
+    name = ""
+    # 单次 upsert 的记录数上限，None 表示不限
+    max_batch_size: Optional[int] = None
+
+    def upsert(self, ids: List[str], embeddings, metadatas: List[dict], texts: List[str]) -> None:
+        raise NotImplementedError
+
+    def update_metadatas(self, ids: List[str], metadatas: List[dict]) -> None:
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]) -> None:
+        raise NotImplementedError
+
+    def delete_source(self, source: str) -> None:
+        raise NotImplementedError
+
+    def query(self, embedding, top_k: int, where: Optional[dict] = None) -> List[SearchHit]:
+        """``where`` is a normalized metadata filter, applied before the top-k cut."""
+        raise NotImplementedError
+
+    def sources(self) -> List[str]:
+        raise NotImplementedError
+
+    def collections(self) -> List[str]:
+        """Names of every collection stored alongside this one (including itself)."""
+        raise NotImplementedError
+
+    def scan(self, batch_size: int = 1000) -> Iterable[Tuple[List[str], List[dict], List[str]]]:
+        """Yield ``(ids, metadatas, texts)`` batches of every stored record."""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, float]:
+        return {}
+
+    def memory_report(self) -> Dict[str, float]:
+        return {}
+
+    def benchmark(self, queries: int = 100, top_k: int = 10, nprobe: Optional[int] = None) -> Dict:
+        raise NotImplementedError(f"{self.name} 索引不支持召回率基准")
+
+
+class ChromaIndex(VectorIndex):
+    """嵌入式 Chroma 集合（HNSW，持久化到 SQLite）。"""
+
+    name = "chroma"
+
+    def __init__(self, persist_dir: str, collection_name: str):
+        import chromadb
+
+        self.client = chromadb.Client(
+            settings=chromadb.Settings(
+                is_persistent=True,
+                persist_directory=persist_dir,
+            )
+        )
+        self.collection = self.client.get_or_create_collection(name=collection_name)
+        self.max_batch_size = self.client.max_batch_size
+
+    def upsert(self, ids, embeddings, metadatas, texts):
+        self.collection.upsert(
+            ids=ids,
+            embeddings=np.asarray(embeddings, dtype=np.float32).tolist(),
+            metadatas=metadatas,
+            documents=texts,
+        )
+
+    def update_metadatas(self, ids, metadatas):
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def delete_source(self, source):
+        self.collection.delete(where={"source": source})
+
+    def query(self, embedding, top_k, where=None):
+        results = self.collection.query(
+            query_embeddings=[list(map(float, embedding))],
+            n_results=top_k,
+            where=where or None,
+            include=["metadatas", "documents", "distances"],
+        )
+        ids = (results.get("ids") or [[]])[0]
+        metas = (results.get("metadatas") or [[]])[0]
+        docs = (results.get("documents") or [[]])[0] or [None] * len(ids)
+        distances = (results.get("distances") or [[]])[0] or [None] * len(ids)
+        return [
+            SearchHit(i, d, m or {}, dist) for i, d, m, dist in zip(ids, docs, metas, distances)
+        ]
+
+    def sources(self):
+        results = self.collection.get(include=["metadatas"], limit=None)
+        seen = {}
+        for meta in results.get("metadatas", []):
+            src = (meta or {}).get("source")
+            if src:
+                seen.setdefault(src, None)
+        return list(seen)
+
+    def collections(self):
+        # 不同版本的 chromadb 返回集合对象或集合名
+        return [getattr(c, "name", c) for c in self.client.list_collections()]
+
+    def scan(self, batch_size=1000):
+        offset = 0
+        while True:
+            results = self.collection.get(
+                include=["metadatas", "documents"], limit=batch_size, offset=offset
+            )
+            ids = results.get("ids") or []
+            if not ids:
+                return
+            metas = [dict(m or {}) for m in results.get("metadatas") or []]
+            # 旧数据的正文存在元数据 "text" 里
+            texts = [d or m.pop("text", "") for d, m in zip(results.get("documents") or [], metas)]
+            yield ids, metas, texts
+            offset += len(ids)
+
+    def stats(self):
+        return {"count": self.collection.count(), "memory": self.memory_report()}
+
+    def memory_report(self):
+        # HNSW 图与 float32 向量都常驻内存，这里只估算向量本身
+        count = self.collection.count()
+        peek = self.collection.peek(1).get("embeddings") if count else None
+        dim = len(peek[0]) if peek is not None and len(peek) else 0
+        return {
+            "vectors": count,
+            "float32_bytes": count * dim * 4,
+            "scanned_bytes": count * dim * 4,
+            "bytes_per_vector": dim * 4,
+            "compression": 1.0,
+        }
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray, block: int = 8192) -> np.ndarray:
+    """Index of the nearest centroid for every row, computed in blocks."""
+    c_norms = (centroids * centroids).sum(axis=1)
+    out = np.empty(len(vectors), dtype=np.int32)
+    for i in range(0, len(vectors), block):
+        x = np.asarray(vectors[i : i + block], dtype=np.float32)
+        out[i : i + block] = np.argmin(c_norms - 2.0 * x @ centroids.T, axis=1)
+    return out
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # 空簇重新随机取点，避免列表退化
+        if empty.any():
+            centroids[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+    return centroids
+
+
+class ScalarQuantizer:
+    """
+    int8 标量量化：每一维按训练样本的取值范围线性映射到 [-127, 127]，
+    每个向量 ``dim`` 字节（float32 的 1/4）。
+    """
+
+    kind = "int8"
+    dtype = np.int8
+
+    def __init__(self, offset: np.ndarray, scale: np.ndarray):
+        self.offset = offset.astype(np.float32)
+        self.scale = scale.astype(np.float32)
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, **_) -> "ScalarQuantizer":
+        lo, hi = vectors.min(axis=0), vectors.max(axis=0)
+        scale = (hi - lo) / 254.0
+        scale[scale == 0] = 1.0
+        return cls((hi + lo) / 2.0, scale)
+
+    def code_size(self, dim: int) -> int:
+        return dim
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((np.asarray(vectors, dtype=np.float32) - self.offset) / self.scale)
+        return np.clip(codes, -127, 127).astype(np.int8)
+
+    def prepare(self, q: np.ndarray):
+        """Return ``distances(codes, norms)`` for one query (without |q|^2)."""
+        bias, weights = float(q @ self.offset), q * self.scale
+
+        def distances(codes: np.ndarray, norms: np.ndarray) -> np.ndarray:
+            # |x|^2 用精确值，只有内积 q·x 是近似的
+            return norms - 2.0 * (bias + np.asarray(codes, dtype=np.float32) @ weights)
+
+        return distances
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"offset": self.offset, "scale": self.scale}
+
+
+class ProductQuantizer:
+    """
+    乘积量化：向量切成 ``m`` 段，每段用 256 个中心的码本编码成 1 字节，
+    每个向量 ``m`` 字节。距离用查表（ADC）计算。
+    """
+
+    kind = "pq"
+    dtype = np.uint8
+
+    def __init__(self, codebooks: np.ndarray):
+        self.codebooks = codebooks.astype(np.float32)  # (m, 256, dsub)
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, m: int = 64, **_) -> "ProductQuantizer":
+        dim = vectors.shape[1]
+        m = max(d for d in range(1, min(m, dim) + 1) if dim % d == 0)
+        dsub, k = dim // m, min(256, len(vectors))
+        codebooks = np.stack(
+            [kmeans(np.ascontiguousarray(vectors[:, j * dsub : (j + 1) * dsub]), k) for j in range(m)]
+        )
+        if k < 256:
+            codebooks = np.concatenate(
+                [codebooks, np.repeat(codebooks[:, :1], 256 - k, axis=1)], axis=1
+            )
+        return cls(codebooks)
+
+    def code_size(self, dim: int) -> int:
+        return len(self.codebooks)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        m, _, dsub = self.codebooks.shape
+        return np.stack(
+            [_nearest(vectors[:, j * dsub : (j + 1) * dsub], self.codebooks[j]) for j in range(m)],
+            axis=1,
+        ).astype(np.uint8)
+
+    def prepare(self, q: np.ndarray):
+        m, _, dsub = self.codebooks.shape
+        table = ((self.codebooks - q.reshape(m, 1, dsub)) ** 2).sum(axis=2)
+        # 与其他路径一致，返回值不含 |q|^2
+        table -= float(q @ q) / m
+        flat = table.ravel()
+        base = np.arange(m, dtype=np.intp) * 256
+
+        def distances(codes: np.ndarray, norms: np.ndarray) -> np.ndarray:
+            return flat[np.asarray(codes, dtype=np.intp) + base].sum(axis=1)
+
+        return distances
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks}
+
+
+QUANTIZERS = {"int8": ScalarQuantizer, "pq": ProductQuantizer}
+
+
+class _State:
+    """
+    一次生成（generation）的索引数据。查询只读取当前 ``_State`` 的引用，
+    扩容与压缩时整体替换，追加写入只在 ``count`` 之后进行。
+    """
+
+    __slots__ = (
+        "gen", "capacity", "count", "sorted_count", "vectors", "norms",
+        "assign", "alive", "ids", "centroids", "offsets", "codes", "quantizer",
+    )
+
+    def __init__(self, **fields):
+        for key in self.__slots__:
+            setattr(self, key, fields.get(key))
+
+
+class IVFIndex(VectorIndex):
+    """
+    进程内 IVF（倒排文件）向量索引。
+
+    - 向量以 float32 存在内存映射文件里，按所属聚类排序，每个倒排列表是
+      文件中连续的一段；新写入的向量追加在末尾（tail），查询时一并扫描；
+    - 查询只计算距离最近的 ``nprobe`` 个聚类（加上 tail 中属于它们的向量），
+      ``nprobe`` 越大召回越高、延迟越高；向量数少于 ``train_min`` 时不训练
+      聚类，直接全量扫描；
+    - 删除只打墓碑；墓碑或 tail 占比超过阈值时后台线程压缩：必要时重新
+      训练聚类，按聚类重排写出新一代文件，再原子切换。压缩基于开始时的
+      快照，期间写入与查询照常使用旧数据，切换时补上期间的写入与删除；
+    - ``quantization`` 为 "int8" 或 "pq" 时，聚类训练的同时训练量化器，
+      查询只扫描常驻内存的压缩编码，取前 ``top_k * rerank_factor`` 个候选
+      再用磁盘上的 float32 原始向量精排；float32 文件只有候选所在的页会被
+      读入，内存主要花在编码上；
+    - id、元数据、正文以及当前代数等元信息存在同目录的 SQLite 中；带元数据
+      过滤的查询先在 SQLite 里选出匹配的行，匹配行不超过 ``filter_exact_max``
+      时只对这些行精确计算距离，否则在 IVF 扫描中屏蔽其余行，过滤都发生在
+      取 top_k 之前。
+    """
+
+    name = "ivf"
+
+    def __init__(
+        self,
+        directory: str,
+        nlist: int = 1024,
+        nprobe: int = 16,
+        train_min: int = 20000,
+        compact_dead_ratio: float = 0.2,
+        compact_tail_ratio: float = 0.2,
+        quantization: str = "none",
+        pq_m: int = 64,
+        rerank_factor: int = 4,
+        filter_exact_max: int = 20000,
+    ):
+        if quantization not in ("none", *QUANTIZERS):
+            raise ValueError(f"未知的向量量化方式: {quantization}")
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_min = train_min
+        self.compact_dead_ratio = compact_dead_ratio
+        self.compact_tail_ratio = compact_tail_ratio
+        self.quantization = quantization
+        self.pq_m = pq_m
+        self.rerank_factor = rerank_factor
+        self.filter_exact_max = filter_exact_max
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._compacting = False
+        # 同一时间只有一次压缩；压缩只在开始取快照与最后切换时持有 _lock
+        self._compact_lock = threading.Lock()
+        self.compactions = 0
+        self.last_compaction_seconds = 0.0
+
+        self._db_path = os.path.join(directory, "index.sqlite3")
+        self._conn = self._connect()
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                " id TEXT PRIMARY KEY, row INTEGER NOT NULL, source TEXT,"
+                " metadata TEXT NOT NULL, text TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS records_row ON records (row)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS records_source ON records (source)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+        self.dim: Optional[int] = None
+        self.trained_size = 0
+        self._state: Optional[_State] = None
+        self._load()
+        # 量化方式或阈值改变后，启动时即在后台按新配置压缩
+        self._maybe_compact()
+
+    # ---- 存储 ----
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        # 查询在多个线程并发执行，每个线程一个只读连接（WAL 下读写互不阻塞）
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _path(self, kind: str, gen: int) -> str:
+        suffix = {"centroids": "npy", "quantizer": "npz", "codes": "bin"}.get(kind, "f32")
+        return os.path.join(self.directory, f"{kind}.{gen}.{suffix}")
+
+    def _open(self, kind: str, gen: int, shape: tuple, dtype) -> np.memmap:
+        path = self._path(kind, gen)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def _open_arrays(self, gen: int, capacity: int, quantizer=None):
+        vectors = self._open("vectors", gen, (capacity, self.dim), np.float32)
+        norms = self._open("norms", gen, (capacity,), np.float32)
+        codes = None
+        if quantizer is not None:
+            codes = self._open(
+                "codes", gen, (capacity, quantizer.code_size(self.dim)), quantizer.dtype
+            )
+        return vectors, norms, codes
+
+    def _remove_generation(self, gen: int) -> None:
+        for kind in ("vectors", "norms", "codes", "centroids", "quantizer"):
+            try:
+                os.remove(self._path(kind, gen))
+            except FileNotFoundError:
+                pass
+
+    def _meta(self) -> Dict[str, str]:
+        return dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+
+    def _meta_rows(self, st: _State) -> List[tuple]:
+        return [
+            ("dim", str(self.dim)),
+            ("gen", str(st.gen)),
+            ("capacity", str(st.capacity)),
+            ("count", str(st.count)),
+            ("sorted_count", str(st.sorted_count)),
+            ("offsets", json.dumps(st.offsets.tolist() if st.offsets is not None else None)),
+            ("trained_size", str(self.trained_size)),
+            ("quantizer", st.quantizer.kind if st.quantizer is not None else "none"),
+        ]
+
+    def _load(self) -> None:
+        meta = self._meta()
+        if "dim" not in meta:
+            return
+        self.dim = int(meta["dim"])
+        gen, capacity, count = int(meta["gen"]), int(meta["capacity"]), int(meta["count"])
+        self.trained_size = int(meta.get("trained_size", 0))
+        quantizer = None
+        kind = meta.get("quantizer", "none")
+        if kind in QUANTIZERS and os.path.exists(self._path("quantizer", gen)):
+            with np.load(self._path("quantizer", gen)) as arrays:
+                quantizer = QUANTIZERS[kind](**{k: arrays[k] for k in arrays.files})
+        vectors, norms, codes = self._open_arrays(gen, capacity, quantizer)
+        centroids = None
+        offsets = json.loads(meta.get("offsets") or "null")
+        centroids_path = self._path("centroids", gen)
+        if offsets is not None and os.path.exists(centroids_path):
+            centroids = np.load(centroids_path)
+            offsets = np.asarray(offsets, dtype=np.int64)
+        else:
+            offsets = None
+        sorted_count = int(meta.get("sorted_count", 0))
+
+        ids = np.empty(capacity, dtype=object)
+        alive = np.zeros(capacity, dtype=bool)
+        for row, id_ in self._conn.execute("SELECT row, id FROM records"):
+            ids[row] = id_
+            alive[row] = True
+        assign = np.zeros(capacity, dtype=np.int32)
+        if centroids is not None:
+            assign[:sorted_count] = np.repeat(
+                np.arange(len(centroids), dtype=np.int32), np.diff(offsets)
+            )
+            if count > sorted_count:
+                assign[sorted_count:count] = _nearest(vectors[sorted_count:count], centroids)
+        self._state = _State(
+            gen=gen, capacity=capacity, count=count, sorted_count=sorted_count,
+            vectors=vectors, norms=norms, assign=assign, alive=alive, ids=ids,
+            centroids=centroids, offsets=offsets, codes=codes, quantizer=quantizer,
+        )
+        logger.info(
+            f"IVF 索引已加载: {int(alive[:count].sum())} 条向量，维度 {self.dim}，"
+            f"{len(centroids) if centroids is not None else 0} 个聚类，量化: {kind}"
+        )
+
+    def _reserve(self, needed: int) -> _State:
+        st = self._state
+        if st is not None and needed <= st.capacity:
+            return st
+        if st is None:
+            gen, capacity, count = 0, max(1024, needed), 0
+        else:
+            gen, count = st.gen, st.count
+            capacity = max(needed, int(st.capacity * 1.5))
+        vectors, norms, codes = self._open_arrays(gen, capacity, st.quantizer if st else None)
+
+        def grow(old, dtype, fill):
+            new = np.full(capacity, fill, dtype=dtype)
+            if old is not None:
+                new[: len(old)] = old
+            return new
+
+        new = _State(
+            gen=gen, capacity=capacity, count=count,
+            sorted_count=st.sorted_count if st else 0,
+            vectors=vectors, norms=norms,
+            assign=grow(st.assign if st else None, np.int32, 0),
+            alive=grow(st.alive if st else None, bool, False),
+            ids=grow(st.ids if st else None, object, None),
+            centroids=st.centroids if st else None,
+            offsets=st.offsets if st else None,
+            codes=codes,
+            quantizer=st.quantizer if st else None,
+        )
+        self._state = new
+        return new
+
+    def _rows_for(self, ids: Sequence[str]) -> List[tuple]:
+        rows = []
+        for i in range(0, len(ids), 500):
+            part = list(ids[i : i + 500])
+            rows += self._conn.execute(
+                f"SELECT id, row FROM records WHERE id IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+        return rows
+
+    # ---- 写入 ----
+
+    def upsert(self, ids, embeddings, metadatas, texts):
+        emb = np.asarray(embeddings, dtype=np.float32)
+        if not len(ids):
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = emb.shape[1]
+            elif emb.shape[1] != self.dim:
+                raise ValueError(f"向量维度 {emb.shape[1]} 与索引维度 {self.dim} 不一致")
+            st = self._reserve((self._state.count if self._state else 0) + len(ids))
+            replaced = self._rows_for(ids)
+
+            start, end = st.count, st.count + len(ids)
+            st.vectors[start:end] = emb
+            st.norms[start:end] = (emb * emb).sum(axis=1)
+            st.vectors.flush()
+            st.norms.flush()
+            if st.quantizer is not None:
+                st.codes[start:end] = st.quantizer.encode(emb)
+                st.codes.flush()
+            if st.centroids is not None:
+                st.assign[start:end] = _nearest(emb, st.centroids)
+            st.ids[start:end] = ids
+
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO records (id, row, source, metadata, text)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (id_, start + i, meta.get("source"), json.dumps(meta, ensure_ascii=False), text)
+                        for i, (id_, meta, text) in enumerate(zip(ids, metadatas, texts))
+                    ],
+                )
+                st.count = end
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", self._meta_rows(st)
+                )
+            # 数据与元信息都落盘后再对查询可见，然后才隐藏被替换的旧行
+            st.alive[start:end] = True
+            for _, row in replaced:
+                st.alive[row] = False
+        self._maybe_compact()
+
+    def update_metadatas(self, ids, metadatas):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE records SET metadata = ?, source = ? WHERE id = ?",
+                [
+                    (json.dumps(meta, ensure_ascii=False), meta.get("source"), id_)
+                    for id_, meta in zip(ids, metadatas)
+                ],
+            )
+
+    def _drop(self, rows: Iterable[tuple]) -> None:
+        rows = list(rows)
+        if not rows:
+            return
+        st = self._state
+        for _, row in rows:
+            st.alive[row] = False
+        with self._conn:
+            self._conn.executemany("DELETE FROM records WHERE id = ?", [(i,) for i, _ in rows])
+
+    def delete(self, ids):
+        with self._lock:
+            if self._state is not None:
+                self._drop(self._rows_for(ids))
+        self._maybe_compact()
+
+    def delete_source(self, source):
+        with self._lock:
+            if self._state is not None:
+                self._drop(
+                    self._conn.execute("SELECT id, row FROM records WHERE source = ?", (source,))
+                )
+        self._maybe_compact()
+
+    # ---- 查询 ----
+
+    def _candidates(
+        self, st: _State, count: int, q: np.ndarray, nprobe: int, quantized: bool = True
+    ):
+        """Yield (rows, squared distances without |q|^2) per scanned segment."""
+        if st.centroids is None:
+            segments = [(0, count)]
+            tail = None
+        else:
+            nprobe = min(nprobe, len(st.centroids))
+            c_dist = (st.centroids * st.centroids).sum(axis=1) - 2.0 * st.centroids @ q
+            probe = np.argpartition(c_dist, nprobe - 1)[:nprobe]
+            segments = [(int(st.offsets[c]), int(st.offsets[c + 1])) for c in probe]
+            tail = np.nonzero(np.isin(st.assign[st.sorted_count : count], probe))[0]
+            tail += st.sorted_count
+        if quantized and st.quantizer is not None:
+            distances = st.quantizer.prepare(q)
+            for start, end in segments:
+                if end > start:
+                    yield np.arange(start, end), distances(st.codes[start:end], st.norms[start:end])
+            if tail is not None and len(tail):
+                yield tail, distances(st.codes[tail], st.norms[tail])
+            return
+        for start, end in segments:
+            if end > start:
+                yield np.arange(start, end), st.norms[start:end] - 2.0 * (st.vectors[start:end] @ q)
+        if tail is not None and len(tail):
+            yield tail, st.norms[tail] - 2.0 * (st.vectors[tail] @ q)
+
+    @staticmethod
+    def _top(rows: np.ndarray, dists: np.ndarray, k: int):
+        if len(rows) > k:
+            top = np.argpartition(dists, k - 1)[:k]
+            rows, dists = rows[top], dists[top]
+        order = np.argsort(dists)
+        return rows[order], dists[order]
+
+    def _search(
+        self,
+        st: _State,
+        q: np.ndarray,
+        top_k: int,
+        nprobe: int,
+        quantized: bool = True,
+        mask: Optional[np.ndarray] = None,
+    ):
+        """Return (rows, squared distances) of the nearest live vectors allowed by ``mask``."""
+        count = st.count
+        rows, dists = [], []
+        for r, d in self._candidates(st, count, q, nprobe, quantized):
+            keep = st.alive[r] if mask is None else st.alive[r] & mask[r]
+            rows.append(r[keep])
+            dists.append(d[keep])
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows, dists = np.concatenate(rows), np.concatenate(dists)
+        if quantized and st.quantizer is not None:
+            # 编码距离只用来挑候选，最终顺序用 float32 原始向量重新计算
+            rows, _ = self._top(rows, dists, top_k * max(self.rerank_factor, 1))
+            rows = np.sort(rows)
+            dists = st.norms[rows] - 2.0 * (st.vectors[rows] @ q)
+        rows, dists = self._top(rows, dists, top_k)
+        return rows, dists + float(q @ q)
+
+    def _filtered_rows(self, st: _State, where: dict):
+        """
+        Rows of ``st`` whose metadata matches ``where``. Compaction renumbers
+        rows in SQLite just before swapping ``_state``, so rows whose id does
+        not match the snapshot are dropped and read again from the new state.
+        """
+        clause, params = where_to_sql(where)
+        for _ in range(2):
+            count = st.count
+            pairs = self._reader().execute(
+                f"SELECT row, id FROM records WHERE {clause}", params
+            ).fetchall()
+            rows = np.fromiter((r for r, _ in pairs), dtype=np.int64, count=len(pairs))
+            ids = np.array([i for _, i in pairs], dtype=object)
+            # 快照之后追加的行不在本次查询范围内
+            keep = rows < count
+            keep[keep] = st.ids[rows[keep]] == ids[keep]
+            if keep.all() or self._state is st:
+                break
+            st = self._state
+        return st, np.sort(rows[keep])
+
+    def _exact(self, st: _State, q: np.ndarray, rows: np.ndarray, top_k: int):
+        rows = rows[st.alive[rows]]
+        dists = st.norms[rows] - 2.0 * (st.vectors[rows] @ q)
+        rows, dists = self._top(rows, dists, top_k)
+        return rows, dists + float(q @ q)
+
+    def query(self, embedding, top_k, where=None, nprobe: Optional[int] = None):
+        st = self._state
+        if st is None or top_k <= 0:
+            return []
+        q = np.asarray(embedding, dtype=np.float32)
+        if not where:
+            rows, dists = self._search(st, q, top_k, nprobe or self.nprobe)
+        else:
+            st, allowed = self._filtered_rows(st, where)
+            if st.centroids is None or len(allowed) <= self.filter_exact_max:
+                rows, dists = self._exact(st, q, allowed, top_k)
+            else:
+                mask = np.zeros(st.capacity, dtype=bool)
+                mask[allowed] = True
+                rows, dists = self._search(st, q, top_k, nprobe or self.nprobe, mask=mask)
+                if len(rows) < top_k:
+                    # 探查的聚类里匹配行不够 top_k 条，退回对匹配行精确检索
+                    rows, dists = self._exact(st, q, allowed, top_k)
+        if not len(rows):
+            return []
+        ids = [st.ids[r] for r in rows]
+
+        found = {
+            id_: (meta, text)
+            for id_, meta, text in self._reader().execute(
+                f"SELECT id, metadata, text FROM records WHERE id IN ({','.join('?' * len(ids))})",
+                ids,
+            )
+        }
+        return [
+            SearchHit(id_, found[id_][1], json.loads(found[id_][0]), max(float(d), 0.0))
+            for id_, d in zip(ids, dists)
+            if id_ in found
+        ]
+
+    def sources(self):
+        return [
+            row[0]
+            for row in self._reader().execute(
+                "SELECT DISTINCT source FROM records WHERE source IS NOT NULL"
+            )
+        ]
+
+    def collections(self):
+        parent = os.path.dirname(os.path.normpath(self.directory))
+        return sorted(
+            name
+            for name in os.listdir(parent)
+            if os.path.isfile(os.path.join(parent, name, "index.sqlite3"))
+        )
+
+    def scan(self, batch_size=1000):
+        last = ""
+        while True:
+            rows = self._reader().execute(
+                "SELECT id, metadata, text FROM records WHERE id > ? ORDER BY id LIMIT ?",
+                (last, batch_size),
+            ).fetchall()
+            if not rows:
+                return
+            yield [r[0] for r in rows], [json.loads(r[1]) for r in rows], [r[2] or "" for r in rows]
+            last = rows[-1][0]
+
+    # ---- 压缩 ----
+
+    def _needs_compaction(self) -> bool:
+        st = self._state
+        if st is None or st.count == 0:
+            return False
+        live = int(st.alive[: st.count].sum())
+        if st.count - live > self.compact_dead_ratio * st.count:
+            return True
+        if st.centroids is None:
+            return live >= self.train_min
+        if (st.quantizer.kind if st.quantizer is not None else "none") != self.quantization:
+            return True
+        return st.count - st.sorted_count > self.compact_tail_ratio * max(st.sorted_count, 1)
+
+    def _maybe_compact(self) -> None:
+        with self._lock:
+            if self._compacting or not self._needs_compaction():
+                return
+            self._compacting = True
+        threading.Thread(target=self._compact_in_background, name="ivf-compact", daemon=True).start()
+
+    def _compact_in_background(self) -> None:
+        try:
+            self.compact()
+        except Exception as e:
+            logger.error(f"IVF 索引压缩失败: {e}", exc_info=True)
+        finally:
+            self._compacting = False
+
+    def compact(self) -> None:
+        """
+        Rewrite live vectors grouped by cluster into a new generation.
+
+        聚类训练、向量重写与新行号映射都在 ``_lock`` 之外进行，期间写入与查询
+        照常；最后在锁内补上快照之后追加的行、隐藏期间删除的行，更新 SQLite
+        行号并切换到新一代。
+        """
+        with self._compact_lock:
+            started = time.perf_counter()
+            with self._lock:
+                st = self._state
+                if st is None:
+                    return
+                base_count = st.count
+                live_rows = np.nonzero(st.alive[:base_count])[0]
+                live_ids = st.ids[live_rows]
+            # 快照之前的行不再被改写（写入只追加、删除只打墓碑），以下读取无需加锁
+            centroids = st.centroids
+            retrain = (centroids is None and len(live_rows) >= self.train_min) or (
+                centroids is not None and len(live_rows) >= 2 * self.trained_size
+            )
+            if retrain:
+                nlist = max(1, min(self.nlist, len(live_rows) // 39))
+                sample = live_rows
+                if len(sample) > nlist * 256:
+                    sample = np.sort(np.random.default_rng(0).choice(live_rows, nlist * 256, replace=False))
+                centroids = kmeans(np.asarray(st.vectors[sample]), nlist)
+                self.trained_size = len(live_rows)
+                assign = _nearest(st.vectors[live_rows], centroids) if len(live_rows) else np.empty(0, np.int32)
+            elif centroids is not None:
+                assign = st.assign[live_rows]
+            else:
+                assign = np.zeros(len(live_rows), dtype=np.int32)
+
+            # 量化器与聚类同时训练；量化方式改变时也重新训练
+            quantizer = st.quantizer
+            if centroids is None or self.quantization == "none":
+                quantizer = None
+            elif retrain or quantizer is None or quantizer.kind != self.quantization:
+                sample = live_rows
+                if len(sample) > 65536:
+                    sample = np.sort(np.random.default_rng(1).choice(live_rows, 65536, replace=False))
+                quantizer = QUANTIZERS[self.quantization].train(
+                    np.asarray(st.vectors[sample]), m=self.pq_m
+                )
+            reuse_codes = quantizer is not None and quantizer is st.quantizer
+
+            order = np.argsort(assign, kind="stable")
+            source_rows = live_rows[order]
+            source_ids = live_ids[order]
+            assign = assign[order]
+            size = len(source_rows)
+            gen = st.gen + 1
+            capacity = max(1024, int(size * 1.25))
+            vectors, norms, codes = self._open_arrays(gen, capacity, quantizer)
+            for i in range(0, size, 65536):
+                part = source_rows[i : i + 65536]
+                vectors[i : i + len(part)] = st.vectors[part]
+                norms[i : i + len(part)] = st.norms[part]
+                if quantizer is not None:
+                    codes[i : i + len(part)] = (
+                        st.codes[part] if reuse_codes else quantizer.encode(vectors[i : i + len(part)])
+                    )
+            if quantizer is not None:
+                with open(self._path("quantizer", gen), "wb") as f:
+                    np.savez(f, **quantizer.arrays())
+            offsets = None
+            if centroids is not None:
+                with open(self._path("centroids", gen), "wb") as f:
+                    np.save(f, centroids)
+                offsets = np.searchsorted(assign, np.arange(len(centroids) + 1)).astype(np.int64)
+
+            # id → 新行号先写进单独的库文件，不占用主库的写锁，切换时一条 UPDATE 应用
+            staging_path = os.path.join(self.directory, "compact.sqlite3")
+            staging = sqlite3.connect(staging_path)
+            try:
+                with staging:
+                    staging.execute("DROP TABLE IF EXISTS compact_rows")
+                    staging.execute("CREATE TABLE compact_rows (id TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+                    staging.executemany(
+                        "INSERT INTO compact_rows (id, row) VALUES (?, ?)",
+                        zip(source_ids.tolist(), range(size)),
+                    )
+            finally:
+                staging.close()
+
+            with self._lock:
+                cur = self._state
+                tail = np.arange(base_count, cur.count)
+                count = size + len(tail)
+                if count > capacity:
+                    capacity = max(count, int(capacity * 1.5))
+                    vectors, norms, codes = self._open_arrays(gen, capacity, quantizer)
+                # 快照之后追加的行原样接在后面（含已删除的），成为新一代的 tail
+                if len(tail):
+                    vectors[size:count] = cur.vectors[tail]
+                    norms[size:count] = cur.norms[tail]
+                    if quantizer is not None:
+                        codes[size:count] = (
+                            cur.codes[tail] if reuse_codes else quantizer.encode(vectors[size:count])
+                        )
+                for array in (vectors, norms, codes):
+                    if array is not None:
+                        array.flush()
+
+                new = _State(
+                    gen=gen, capacity=capacity, count=count,
+                    sorted_count=size if centroids is not None else 0,
+                    vectors=vectors, norms=norms,
+                    assign=np.zeros(capacity, dtype=np.int32),
+                    alive=np.zeros(capacity, dtype=bool),
+                    ids=np.empty(capacity, dtype=object),
+                    centroids=centroids, offsets=offsets, codes=codes, quantizer=quantizer,
+                )
+                new.assign[:size] = assign
+                if centroids is not None and len(tail):
+                    new.assign[size:count] = _nearest(vectors[size:count], centroids)
+                # 快照中的行在构建期间可能被删除或被新写入替换
+                new.alive[:size] = cur.alive[source_rows]
+                new.alive[size:count] = cur.alive[tail]
+                new.ids[:size] = source_ids
+                new.ids[size:count] = cur.ids[tail]
+
+                self._conn.execute("ATTACH DATABASE ? AS staging", (staging_path,))
+                try:
+                    with self._conn:
+                        # 仍指向快照行的记录换成新行号（都小于 base_count）；
+                        # 之后追加的记录整体平移到 tail
+                        self._conn.execute(
+                            "UPDATE records SET row ="
+                            " (SELECT c.row FROM staging.compact_rows c WHERE c.id = records.id)"
+                            " WHERE row < ?",
+                            (base_count,),
+                        )
+                        self._conn.execute(
+                            "UPDATE records SET row = row - ? WHERE row >= ?",
+                            (base_count - size, base_count),
+                        )
+                        self._conn.executemany(
+                            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", self._meta_rows(new)
+                        )
+                finally:
+                    self._conn.execute("DETACH DATABASE staging")
+                self._state = new
+                self.compactions += 1
+                self.last_compaction_seconds = time.perf_counter() - started
+            self._remove_generation(st.gen)
+            os.remove(staging_path)
+        logger.info(
+            f"IVF 索引压缩完成: {size} 条向量（另有 {len(tail)} 条 tail），"
+            f"{len(centroids) if centroids is not None else 0} 个聚类，"
+            f"量化: {quantizer.kind if quantizer is not None else 'none'}，用时 {self.last_compaction_seconds:.2f}s"
+        )
+
+    def stats(self):
+        st = self._state
+        if st is None:
+            return {"count": 0}
+        live = int(st.alive[: st.count].sum())
+        return {
+            "count": live,
+            "dead": st.count - live,
+            "tail": st.count - st.sorted_count,
+            "nlist": len(st.centroids) if st.centroids is not None else 0,
+            "nprobe": self.nprobe,
+            "dim": self.dim or 0,
+            "quantization": st.quantizer.kind if st.quantizer is not None else "none",
+            "compactions": self.compactions,
+            "last_compaction_seconds": self.last_compaction_seconds,
+            "memory": self.memory_report(),
+        }
+
+    def memory_report(self) -> Dict[str, float]:
+        """
+        内存占用估算（字节）。``scanned_bytes`` 是查询时需要常驻内存的部分
+        （量化编码或 float32 向量，加上范数、聚类分配等），``rerank_bytes``
+        是只在精排时按页读取的 float32 向量。
+        """
+        st = self._state
+        if st is None:
+            return {}
+        dim, count = self.dim or 0, st.count
+        float_bytes = count * dim * 4
+        bookkeeping = count * (4 + 4 + 1 + 8)  # 范数、聚类分配、存活标记、id 引用
+        if st.centroids is not None:
+            bookkeeping += st.centroids.nbytes + st.offsets.nbytes
+        if st.quantizer is None:
+            code_bytes, rerank_bytes = 0, 0
+            scanned = float_bytes
+        else:
+            code_bytes = count * st.quantizer.code_size(dim) * np.dtype(st.quantizer.dtype).itemsize
+            code_bytes += sum(a.nbytes for a in st.quantizer.arrays().values())
+            rerank_bytes = float_bytes
+            scanned = code_bytes
+        return {
+            "vectors": count,
+            "float32_bytes": float_bytes,
+            "code_bytes": code_bytes,
+            "scanned_bytes": scanned + bookkeeping,
+            "rerank_bytes": rerank_bytes,
+            "bytes_per_vector": (scanned + bookkeeping) / count if count else 0.0,
+            "compression": float_bytes / code_bytes if code_bytes else 1.0,
+        }
+
+    def benchmark(self, queries: int = 100, top_k: int = 10, nprobe: Optional[int] = None) -> Dict:
+        """
+        召回率基准：随机取已有向量（加少量噪声）作查询，以全量 float32 精确
+        检索为基准，比较量化检索与未量化 IVF 检索的 recall@k 和延迟。
+        """
+        st = self._state
+        if st is None:
+            return {"queries": 0}
+        live_rows = np.nonzero(st.alive[: st.count])[0]
+        if not len(live_rows):
+            return {"queries": 0}
+        nprobe = nprobe or self.nprobe
+        rng = np.random.default_rng(0)
+        picked = rng.choice(live_rows, size=min(queries, len(live_rows)), replace=False)
+        sample = np.asarray(st.vectors[np.sort(picked)])
+        noise = rng.normal(size=sample.shape).astype(np.float32)
+        noise *= 0.05 * np.sqrt(st.norms[np.sort(picked)] / self.dim)[:, None]
+        sample += noise
+
+        def exact(q):
+            rows, dists = [], []
+            for i in range(0, len(live_rows), 65536):
+                part = live_rows[i : i + 65536]
+                rows.append(part)
+                dists.append(st.norms[part] - 2.0 * (st.vectors[part] @ q))
+            return set(self._top(np.concatenate(rows), np.concatenate(dists), top_k)[0].tolist())
+
+        results = {}
+        truth = [exact(q) for q in sample]
+        modes = {"float32": False}
+        if st.quantizer is not None:
+            modes[st.quantizer.kind] = True
+        for name, quantized in modes.items():
+            hits, latencies = 0, []
+            for q, expected in zip(sample, truth):
+                started = time.perf_counter()
+                rows, _ = self._search(st, q, top_k, nprobe, quantized)
+                latencies.append((time.perf_counter() - started) * 1000)
+                hits += len(expected & set(rows.tolist()))
+            results[name] = {
+                "recall": hits / sum(len(t) for t in truth),
+                "mean_ms": float(np.mean(latencies)),
+                "p95_ms": float(np.percentile(latencies, 95)),
+            }
+        return {"queries": len(sample), "top_k": top_k, "nprobe": nprobe, "results": results}
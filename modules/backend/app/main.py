@@ -5,7 +5,12 @@ from api.router import api_router   # 用统一路由聚合器更整洁
 import logging
 import asyncio
 
+from core.db_client import vector_db
 from core.grpc_client import grpc_client_manager
+from services.ingestion import ingestion_queue
+from services.reindex import directory_indexer
+from services.uploads import resumable_uploads
+from core.settings import settings
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,11 +26,18 @@ app.add_middleware(
 
 @app.on_event("startup")
 async def startup_event():
+    await ingestion_queue.start()
+    resumable_uploads.start()
+    # 关键词索引为空而向量库有数据（升级前入库的文档）时，后台补建
+    if vector_db.lexical.count() == 0 and vector_db.index.stats().get("count"):
+        asyncio.create_task(asyncio.to_thread(vector_db.rebuild_lexical))
     logger.info("尝试连接到 gRPC 服务")
     for i in range(10):
         try:
             await grpc_client_manager.connect()
             logger.info("连接成功")
+            if settings.REINDEX_ON_STARTUP:
+                asyncio.create_task(directory_indexer.run())
             return
         except Exception as e:
             logger.warning(f"第{i+1}次重试失败：{e}，等待5秒")
@@ -34,6 +46,8 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await ingestion_queue.stop()
+    await resumable_uploads.stop()
     await grpc_client_manager.disconnect()
 
 # 统一路由前缀
@@ -15,11 +15,16 @@ _sym_db = _symbol_database.Default()
 
 
 DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(
-    b'\n\x0finference.proto\x12\tinference"\x07\n\x05\x45mpty"(\n\x07Message\x12\x0c\n\x04role\x18\x01 \x01(\t\x12\x0f\n\x07\x63ontent\x18\x02 \x01(\t"[\n\x0b\x43hatRequest\x12$\n\x08messages\x18\x01 \x03(\x0b\x32\x12.inference.Message\x12\x17\n\nsession_id\x18\x02 \x01(\tH\x00\x88\x01\x01\x42\r\n\x0b_session_id"d\n\x0c\x43hatResponse\x12\x0f\n\x05token\x18\x01 \x01(\tH\x00\x12\x17\n\rerror_message\x18\x02 \x01(\tH\x00\x12\x19\n\x0fsource_document\x18\x03 \x01(\tH\x00\x42\x0f\n\rresponse_type"\x1b\n\tEmbedding\x12\x0e\n\x06values\x18\x01 \x03(\x02"&\n\x15\x45mbeddingBatchRequest\x12\r\n\x05texts\x18\x01 \x03(\t"B\n\x16\x45mbeddingBatchResponse\x12(\n\nembeddings\x18\x01 \x03(\x0b\x32\x14.inference.Embedding"\x9b\x01\n\x11ModelListResponse\x12\x19\n\x11generation_models\x18\x01 \x03(\t\x12\x18\n\x10\x65mbedding_models\x18\x02 \x03(\t\x12 \n\x18\x63urrent_generation_model\x18\x03 \x01(\t\x12\x1f\n\x17\x63urrent_embedding_model\x18\x04 \x01(\t\x12\x0e\n\x06\x64\x65vice\x18\x05 \x01(\t"R\n\x12SwitchModelRequest\x12\x12\n\nmodel_name\x18\x01 \x01(\t\x12(\n\nmodel_type\x18\x02 \x01(\x0e\x32\x14.inference.ModelType"7\n\x13SwitchModelResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t*7\n\tModelType\x12\x0b\n\x07UNKNOWN\x10\x00\x12\x0e\n\nGENERATION\x10\x01\x12\r\n\tEMBEDDING\x10\x02\x32\xc3\x02\n\x10InferenceService\x12?\n\nChatStream\x12\x16.inference.ChatRequest\x1a\x17.inference.ChatResponse0\x01\x12\x45\n\x13ListAvailableModels\x12\x10.inference.Empty\x1a\x1c.inference.ModelListResponse\x12L\n\x0bSwitchModel\x12\x1d.inference.SwitchModelRequest\x1a\x1e.inference.SwitchModelResponse\x12Y\n\x12GetEmbeddingsBatch\x12 .inference.EmbeddingBatchRequest\x1a!.inference.EmbeddingBatchResponseb\x06proto3'
+    b'\n\x0finference.proto\x12\tinference"\x07\n\x05\x45mpty"(\n\x07Message\x12\x0c\n\x04role\x18\x01 \x01(\t\x12\x0f\n\x07\x63ontent\x18\x02 \x01(\t"\x9c\x01\n\x0b\x43hatRequest\x12$\n\x08messages\x18\x01 \x03(\x0b\x32\x12.inference.Message\x12\x17\n\nsession_id\x18\x02 \x01(\tH\x00\x88\x01\x01\x12\x17\n\x0f\x63ontext_doc_ids\x18\x03 \x03(\t\x12\x17\n\nmodel_name\x18\x04 \x01(\tH\x01\x88\x01\x01\x42\r\n\x0b_session_idB\r\n\x0b_model_name"d\n\x0c\x43hatResponse\x12\x0f\n\x05token\x18\x01 \x01(\tH\x00\x12\x17\n\rerror_message\x18\x02 \x01(\tH\x00\x12\x19\n\x0fsource_document\x18\x03 \x01(\tH\x00\x42\x0f\n\rresponse_type"\x1b\n\tEmbedding\x12\x0e\n\x06values\x18\x01 \x03(\x02"V\n\x15\x45mbeddingBatchRequest\x12\r\n\x05texts\x18\x01 \x03(\t\x12.\n\x08\x65ncoding\x18\x02 \x01(\x0e\x32\x1c.inference.EmbeddingEncoding"\xb8\x01\n\x16\x45mbeddingBatchResponse\x12(\n\nembeddings\x18\x01 \x03(\x0b\x32\x14.inference.Embedding\x12\x0e\n\x06packed\x18\x02 \x01(\x0c\x12\x35\n\x0fpacked_encoding\x18\x03 \x01(\x0e\x32\x1c.inference.EmbeddingEncoding\x12\x0c\n\x04rows\x18\x04 \x01(\x05\x12\x0b\n\x03\x64im\x18\x05 \x01(\x05\x12\x12\n\nmodel_name\x18\x06 \x01(\t"S\n\x12\x45mbedStreamRequest\x12\r\n\x05texts\x18\x01 \x03(\t\x12.\n\x08\x65ncoding\x18\x02 \x01(\x0e\x32\x1c.inference.EmbeddingEncoding"\xc0\x01\n\x13\x45mbedStreamResponse\x12\x0e\n\x06offset\x18\x01 \x01(\x03\x12\x0e\n\x06packed\x18\x02 \x01(\x0c\x12\x35\n\x0fpacked_encoding\x18\x03 \x01(\x0e\x32\x1c.inference.EmbeddingEncoding\x12\x0c\n\x04rows\x18\x04 \x01(\x05\x12\x0b\n\x03\x64im\x18\x05 \x01(\x05\x12\x10\n\x08received\x18\x06 \x01(\x03\x12\x11\n\tprocessed\x18\x07 \x01(\x03\x12\x12\n\nmodel_name\x18\x08 \x01(\t"-\n\rRerankRequest\x12\r\n\x05query\x18\x01 \x01(\t\x12\r\n\x05texts\x18\x02 \x03(\t"4\n\x0eRerankResponse\x12\x0e\n\x06scores\x18\x01 \x03(\x02\x12\x12\n\nmodel_name\x18\x02 \x01(\t"\xbc\x02\n\x11ModelListResponse\x12\x19\n\x11generation_models\x18\x01 \x03(\t\x12\x18\n\x10\x65mbedding_models\x18\x02 \x03(\t\x12 \n\x18\x63urrent_generation_model\x18\x03 \x01(\t\x12\x1f\n\x17\x63urrent_embedding_model\x18\x04 \x01(\t\x12\x0e\n\x06\x64\x65vice\x18\x05 \x01(\t\x12\x17\n\x0fresident_models\x18\x06 \x03(\t\x12\x15\n\rloading_model\x18\x07 \x01(\t\x12\x15\n\rload_progress\x18\x08 \x01(\x02\x12\x1a\n\x12memory_total_bytes\x18\t \x01(\x03\x12\x1e\n\x16memory_available_bytes\x18\n \x01(\x03\x12\x1c\n\x14resident_model_bytes\x18\x0b \x01(\x03"R\n\x12SwitchModelRequest\x12\x12\n\nmodel_name\x18\x01 \x01(\t\x12(\n\nmodel_type\x18\x02 \x01(\x0e\x32\x14.inference.ModelType"7\n\x13SwitchModelResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t")\n\x16InvalidateCacheRequest\x12\x0f\n\x07\x64oc_ids\x18\x01 \x03(\t"*\n\x17InvalidateCacheResponse\x12\x0f\n\x07removed\x18\x01 \x01(\x05"\x93\x02\n\x14ServiceStatsResponse\x12\r\n\x05ready\x18\x01 \x01(\x08\x12\x46\n\x0cload_seconds\x18\x02 \x03(\x0b\x32\x30.inference.ServiceStatsResponse.LoadSecondsEntry\x12?\n\x08\x63ounters\x18\x03 \x03(\x0b\x32-.inference.ServiceStatsResponse.CountersEntry\x1a\x32\n\x10LoadSecondsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x01:\x02\x38\x01\x1a/\n\rCountersEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x01:\x02\x38\x01*W\n\x11\x45mbeddingEncoding\x12\x14\n\x10\x45MBEDDING_VALUES\x10\x00\x12\x15\n\x11\x45MBEDDING_FLOAT32\x10\x01\x12\x15\n\x11\x45MBEDDING_FLOAT16\x10\x02*7\n\tModelType\x12\x0b\n\x07UNKNOWN\x10\x00\x12\x0e\n\nGENERATION\x10\x01\x12\r\n\tEMBEDDING\x10\x02\x32\xf4\x04\n\x10InferenceService\x12?\n\nChatStream\x12\x16.inference.ChatRequest\x1a\x17.inference.ChatResponse0\x01\x12\x45\n\x13ListAvailableModels\x12\x10.inference.Empty\x1a\x1c.inference.ModelListResponse\x12L\n\x0bSwitchModel\x12\x1d.inference.SwitchModelRequest\x1a\x1e.inference.SwitchModelResponse\x12Y\n\x12GetEmbeddingsBatch\x12 .inference.EmbeddingBatchRequest\x1a!.inference.EmbeddingBatchResponse\x12X\n\x0fInvalidateCache\x12!.inference.InvalidateCacheRequest\x1a".inference.InvalidateCacheResponse\x12\x44\n\x0fGetServiceStats\x12\x10.inference.Empty\x1a\x1f.inference.ServiceStatsResponse\x12P\n\x0b\x45mbedStream\x12\x1d.inference.EmbedStreamRequest\x1a\x1e.inference.EmbedStreamResponse(\x01\x30\x01\x12=\n\x06Rerank\x12\x18.inference.RerankRequest\x1a\x19.inference.RerankResponseb\x06proto3'
 )
 
+_EMBEDDINGENCODING = DESCRIPTOR.enum_types_by_name["EmbeddingEncoding"]
+EmbeddingEncoding = enum_type_wrapper.EnumTypeWrapper(_EMBEDDINGENCODING)
 _MODELTYPE = DESCRIPTOR.enum_types_by_name["ModelType"]
 ModelType = enum_type_wrapper.EnumTypeWrapper(_MODELTYPE)
+EMBEDDING_VALUES = 0
+EMBEDDING_FLOAT32 = 1
+EMBEDDING_FLOAT16 = 2
 UNKNOWN = 0
 GENERATION = 1
 EMBEDDING = 2
@@ -32,9 +37,22 @@ _CHATRESPONSE = DESCRIPTOR.message_types_by_name["ChatResponse"]
 _EMBEDDING = DESCRIPTOR.message_types_by_name["Embedding"]
 _EMBEDDINGBATCHREQUEST = DESCRIPTOR.message_types_by_name["EmbeddingBatchRequest"]
 _EMBEDDINGBATCHRESPONSE = DESCRIPTOR.message_types_by_name["EmbeddingBatchResponse"]
+_EMBEDSTREAMREQUEST = DESCRIPTOR.message_types_by_name["EmbedStreamRequest"]
+_EMBEDSTREAMRESPONSE = DESCRIPTOR.message_types_by_name["EmbedStreamResponse"]
+_RERANKREQUEST = DESCRIPTOR.message_types_by_name["RerankRequest"]
+_RERANKRESPONSE = DESCRIPTOR.message_types_by_name["RerankResponse"]
 _MODELLISTRESPONSE = DESCRIPTOR.message_types_by_name["ModelListResponse"]
 _SWITCHMODELREQUEST = DESCRIPTOR.message_types_by_name["SwitchModelRequest"]
 _SWITCHMODELRESPONSE = DESCRIPTOR.message_types_by_name["SwitchModelResponse"]
+_INVALIDATECACHEREQUEST = DESCRIPTOR.message_types_by_name["InvalidateCacheRequest"]
+_INVALIDATECACHERESPONSE = DESCRIPTOR.message_types_by_name["InvalidateCacheResponse"]
+_SERVICESTATSRESPONSE = DESCRIPTOR.message_types_by_name["ServiceStatsResponse"]
+_SERVICESTATSRESPONSE_LOADSECONDSENTRY = _SERVICESTATSRESPONSE.nested_types_by_name[
+    "LoadSecondsEntry"
+]
+_SERVICESTATSRESPONSE_COUNTERSENTRY = _SERVICESTATSRESPONSE.nested_types_by_name[
+    "CountersEntry"
+]
 Empty = _reflection.GeneratedProtocolMessageType(
     "Empty",
     (_message.Message,),
@@ -112,6 +130,50 @@ EmbeddingBatchResponse = _reflection.GeneratedProtocolMessageType(
 )
 _sym_db.RegisterMessage(EmbeddingBatchResponse)
 
+EmbedStreamRequest = _reflection.GeneratedProtocolMessageType(
+    "EmbedStreamRequest",
+    (_message.Message,),
+    {
+        "DESCRIPTOR": _EMBEDSTREAMREQUEST,
+        "__module__": "inference_pb2",
+        # @@protoc_insertion_point(class_scope:inference.EmbedStreamRequest)
+    },
+)
+_sym_db.RegisterMessage(EmbedStreamRequest)
+
+EmbedStreamResponse = _reflection.GeneratedProtocolMessageType(
+    "EmbedStreamResponse",
+    (_message.Message,),
+    {
+        "DESCRIPTOR": _EMBEDSTREAMRESPONSE,
+        "__module__": "inference_pb2",
+        # @@protoc_insertion_point(class_scope:inference.EmbedStreamResponse)
+    },
+)
+_sym_db.RegisterMessage(EmbedStreamResponse)
+
+RerankRequest = _reflection.GeneratedProtocolMessageType(
+    "RerankRequest",
+    (_message.Message,),
+    {
+        "DESCRIPTOR": _RERANKREQUEST,
+        "__module__": "inference_pb2",
+        # @@protoc_insertion_point(class_scope:inference.RerankRequest)
+    },
+)
+_sym_db.RegisterMessage(RerankRequest)
+
+RerankResponse = _reflection.GeneratedProtocolMessageType(
+    "RerankResponse",
+    (_message.Message,),
+    {
+        "DESCRIPTOR": _RERANKRESPONSE,
+        "__module__": "inference_pb2",
+        # @@protoc_insertion_point(class_scope:inference.RerankResponse)
+    },
+)
+_sym_db.RegisterMessage(RerankResponse)
+
 ModelListResponse = _reflection.GeneratedProtocolMessageType(
     "ModelListResponse",
     (_message.Message,),
@@ -145,32 +207,109 @@ SwitchModelResponse = _reflection.GeneratedProtocolMessageType(
 )
 _sym_db.RegisterMessage(SwitchModelResponse)
 
+InvalidateCacheRequest = _reflection.GeneratedProtocolMessageType(
+    "InvalidateCacheRequest",
+    (_message.Message,),
+    {
+        "DESCRIPTOR": _INVALIDATECACHEREQUEST,
+        "__module__": "inference_pb2",
+        # @@protoc_insertion_point(class_scope:inference.InvalidateCacheRequest)
+    },
+)
+_sym_db.RegisterMessage(InvalidateCacheRequest)
+
+InvalidateCacheResponse = _reflection.GeneratedProtocolMessageType(
+    "InvalidateCacheResponse",
+    (_message.Message,),
+    {
+        "DESCRIPTOR": _INVALIDATECACHERESPONSE,
+        "__module__": "inference_pb2",
+        # @@protoc_insertion_point(class_scope:inference.InvalidateCacheResponse)
+    },
+)
+_sym_db.RegisterMessage(InvalidateCacheResponse)
+
+ServiceStatsResponse = _reflection.GeneratedProtocolMessageType(
+    "ServiceStatsResponse",
+    (_message.Message,),
+    {
+        "LoadSecondsEntry": _reflection.GeneratedProtocolMessageType(
+            "LoadSecondsEntry",
+            (_message.Message,),
+            {
+                "DESCRIPTOR": _SERVICESTATSRESPONSE_LOADSECONDSENTRY,
+                "__module__": "inference_pb2",
+                # @@protoc_insertion_point(class_scope:inference.ServiceStatsResponse.LoadSecondsEntry)
+            },
+        ),
+        "CountersEntry": _reflection.GeneratedProtocolMessageType(
+            "CountersEntry",
+            (_message.Message,),
+            {
+                "DESCRIPTOR": _SERVICESTATSRESPONSE_COUNTERSENTRY,
+                "__module__": "inference_pb2",
+                # @@protoc_insertion_point(class_scope:inference.ServiceStatsResponse.CountersEntry)
+            },
+        ),
+        "DESCRIPTOR": _SERVICESTATSRESPONSE,
+        "__module__": "inference_pb2",
+        # @@protoc_insertion_point(class_scope:inference.ServiceStatsResponse)
+    },
+)
+_sym_db.RegisterMessage(ServiceStatsResponse)
+_sym_db.RegisterMessage(ServiceStatsResponse.LoadSecondsEntry)
+_sym_db.RegisterMessage(ServiceStatsResponse.CountersEntry)
+
 _INFERENCESERVICE = DESCRIPTOR.services_by_name["InferenceService"]
 if _descriptor._USE_C_DESCRIPTORS == False:
 
     DESCRIPTOR._options = None
-    _MODELTYPE._serialized_start = 712
-    _MODELTYPE._serialized_end = 767
+    _SERVICESTATSRESPONSE_LOADSECONDSENTRY._options = None
+    _SERVICESTATSRESPONSE_LOADSECONDSENTRY._serialized_options = b"8\001"
+    _SERVICESTATSRESPONSE_COUNTERSENTRY._options = None
+    _SERVICESTATSRESPONSE_COUNTERSENTRY._serialized_options = b"8\001"
+    _EMBEDDINGENCODING._serialized_start = 1852
+    _EMBEDDINGENCODING._serialized_end = 1939
+    _MODELTYPE._serialized_start = 1941
+    _MODELTYPE._serialized_end = 1996
     _EMPTY._serialized_start = 30
     _EMPTY._serialized_end = 37
     _MESSAGE._serialized_start = 39
     _MESSAGE._serialized_end = 79
-    _CHATREQUEST._serialized_start = 81
-    _CHATREQUEST._serialized_end = 172
-    _CHATRESPONSE._serialized_start = 174
-    _CHATRESPONSE._serialized_end = 274
-    _EMBEDDING._serialized_start = 276
-    _EMBEDDING._serialized_end = 303
-    _EMBEDDINGBATCHREQUEST._serialized_start = 305
-    _EMBEDDINGBATCHREQUEST._serialized_end = 343
-    _EMBEDDINGBATCHRESPONSE._serialized_start = 345
-    _EMBEDDINGBATCHRESPONSE._serialized_end = 411
-    _MODELLISTRESPONSE._serialized_start = 414
-    _MODELLISTRESPONSE._serialized_end = 569
-    _SWITCHMODELREQUEST._serialized_start = 571
-    _SWITCHMODELREQUEST._serialized_end = 653
-    _SWITCHMODELRESPONSE._serialized_start = 655
-    _SWITCHMODELRESPONSE._serialized_end = 710
-    _INFERENCESERVICE._serialized_start = 770
-    _INFERENCESERVICE._serialized_end = 1093
+    _CHATREQUEST._serialized_start = 82
+    _CHATREQUEST._serialized_end = 238
+    _CHATRESPONSE._serialized_start = 240
+    _CHATRESPONSE._serialized_end = 340
+    _EMBEDDING._serialized_start = 342
+    _EMBEDDING._serialized_end = 369
+    _EMBEDDINGBATCHREQUEST._serialized_start = 371
+    _EMBEDDINGBATCHREQUEST._serialized_end = 457
+    _EMBEDDINGBATCHRESPONSE._serialized_start = 460
+    _EMBEDDINGBATCHRESPONSE._serialized_end = 644
+    _EMBEDSTREAMREQUEST._serialized_start = 646
+    _EMBEDSTREAMREQUEST._serialized_end = 729
+    _EMBEDSTREAMRESPONSE._serialized_start = 732
+    _EMBEDSTREAMRESPONSE._serialized_end = 924
+    _RERANKREQUEST._serialized_start = 926
+    _RERANKREQUEST._serialized_end = 971
+    _RERANKRESPONSE._serialized_start = 973
+    _RERANKRESPONSE._serialized_end = 1025
+    _MODELLISTRESPONSE._serialized_start = 1028
+    _MODELLISTRESPONSE._serialized_end = 1344
+    _SWITCHMODELREQUEST._serialized_start = 1346
+    _SWITCHMODELREQUEST._serialized_end = 1428
+    _SWITCHMODELRESPONSE._serialized_start = 1430
+    _SWITCHMODELRESPONSE._serialized_end = 1485
+    _INVALIDATECACHEREQUEST._serialized_start = 1487
+    _INVALIDATECACHEREQUEST._serialized_end = 1528
+    _INVALIDATECACHERESPONSE._serialized_start = 1530
+    _INVALIDATECACHERESPONSE._serialized_end = 1572
+    _SERVICESTATSRESPONSE._serialized_start = 1575
+    _SERVICESTATSRESPONSE._serialized_end = 1850
+    _SERVICESTATSRESPONSE_LOADSECONDSENTRY._serialized_start = 1751
+    _SERVICESTATSRESPONSE_LOADSECONDSENTRY._serialized_end = 1801
+    _SERVICESTATSRESPONSE_COUNTERSENTRY._serialized_start = 1803
+    _SERVICESTATSRESPONSE_COUNTERSENTRY._serialized_end = 1850
+    _INFERENCESERVICE._serialized_start = 1999
+    _INFERENCESERVICE._serialized_end = 2627
 # @@protoc_insertion_point(module_scope)
@@ -0,0 +1,154 @@
+import logging
+import re
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+
+from langchain_core.documents import Document
+from langchain_text_splitters import Language, RecursiveCharacterTextSplitter
+
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# PDF 提取时用换页符分隔各页
+PAGE_BREAK = "\f"
+
+# 纯文本按段落、句子（含中文标点）逐级切分
+TEXT_SEPARATORS = ["\n\n", "\n", "。", "！", "？", "；", ".", "!", "?", ";", "，", ",", " ", ""]
+MARKDOWN_SEPARATORS = RecursiveCharacterTextSplitter.get_separators_for_language(
+    Language.MARKDOWN
+) + ["。", "！", "？", "；", "，"]
+
+_HEADING = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t#]*$", re.MULTILINE)
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff\uac00-\ud7af]")
+
+
+def _approx_tokens(text: str) -> int:
+    """Rough token count: one per CJK character, ~4 characters per token otherwise."""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+@lru_cache(maxsize=1)
+def token_length_function() -> Callable[[str], int]:
+    """
+    分块使用的长度函数。配置了 CHUNK_TOKENIZER 时用对应的 HuggingFace 分词器，
+    否则使用近似估算。
+    """
+    if settings.CHUNK_TOKENIZER:
+        try:
+            from transformers import AutoTokenizer
+
+            tokenizer = AutoTokenizer.from_pretrained(settings.CHUNK_TOKENIZER)
+            logger.info(f"分块使用分词器: {settings.CHUNK_TOKENIZER}")
+            return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+        except Exception as e:
+            logger.warning(f"加载分词器 {settings.CHUNK_TOKENIZER} 失败，改用近似长度: {e}")
+    return _approx_tokens
+
+
+def _splitter(separators: List[str]) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        separators=separators,
+        chunk_size=settings.CHUNK_SIZE_TOKENS,
+        chunk_overlap=settings.CHUNK_OVERLAP_TOKENS,
+        length_function=token_length_function(),
+    )
+
+
+def _markdown_sections(text: str):
+    """Yield (offset, section_text, heading_path) split at Markdown headings."""
+    path: List[str] = []
+    starts = [(m.start(), len(m.group(1)), m.group(2).strip()) for m in _HEADING.finditer(text)]
+    if not starts or starts[0][0] > 0:
+        starts.insert(0, (0, 0, ""))
+    for i, (start, level, title) in enumerate(starts):
+        if level:
+            path = path[: level - 1] + [title]
+        end = starts[i + 1][0] if i + 1 < len(starts) else len(text)
+        if text[start:end].strip():
+            yield start, text[start:end], " / ".join(path)
+
+
+def _sections(text: str, file_name: str):
+    """Yield (offset, section_text, extra_metadata, separators) per structural part."""
+    suffix = file_name.lower().rsplit(".", 1)[-1]
+    if suffix == "pdf":
+        offset = 0
+        for page_no, page in enumerate(text.split(PAGE_BREAK), start=1):
+            if page.strip():
+                yield offset, page, {"page": page_no}, TEXT_SEPARATORS
+            offset += len(page) + len(PAGE_BREAK)
+    elif suffix in ("md", "markdown", "docx"):
+        # DOCX 提取时标题已转成 Markdown 标题
+        for offset, section, heading in _markdown_sections(text):
+            yield offset, section, {"section": heading} if heading else {}, MARKDOWN_SEPARATORS
+    else:
+        yield 0, text, {}, TEXT_SEPARATORS
+
+
+def _chunk_section(
+    offset: int,
+    section: str,
+    extra: Dict,
+    separators: List[str],
+    metadata: Optional[Dict],
+    first_index: int,
+) -> List[Document]:
+    chunks: List[Document] = []
+    # 相邻块至多重叠 chunk_overlap，取起点不晚于上一块终点的最后一次出现；
+    # 中间隔着被去掉的分隔符时再向后查找
+    prev_start, prev_end = -1, 0
+    for piece in _splitter(separators).split_text(section):
+        found = section.rfind(piece, prev_start + 1, prev_end + len(piece))
+        if found < 0:
+            found = section.find(piece, prev_end)
+        if found < 0:
+            found = prev_start + 1
+        prev_start, prev_end = found, found + len(piece)
+        start = offset + found
+        chunks.append(
+            Document(
+                page_content=piece,
+                metadata={
+                    **(metadata or {}),
+                    **extra,
+                    "chunk": first_index + len(chunks),
+                    "start": start,
+                    "end": start + len(piece),
+                },
+            )
+        )
+    return chunks
+
+
+def chunk_text(text: str, file_name: str, metadata: Optional[Dict] = None) -> List[Document]:
+    """
+    把提取出的文本切成带偏移量的块。
+
+    先按文档结构（PDF 页、Markdown/DOCX 标题）划分，再在每部分内按 token
+    长度递归切分并保留重叠；每块记录在原文中的 ``start``/``end`` 偏移。
+    """
+    chunks: List[Document] = []
+    for offset, section, extra, separators in _sections(text, file_name):
+        chunks += _chunk_section(offset, section, extra, separators, metadata, len(chunks))
+    logger.info(f"文档 '{file_name}' 切分为 {len(chunks)} 块")
+    return chunks
+
+
+def chunk_page(
+    page: str,
+    page_no: int,
+    offset: int,
+    metadata: Optional[Dict] = None,
+    first_index: int = 0,
+) -> List[Document]:
+    """
+    对逐页到达的 PDF 单页分块，与 ``chunk_text`` 处理整份文本的结果一致。
+
+    ``offset`` 为该页在以 ``PAGE_BREAK`` 连接的全文中的起点，``first_index``
+    为已产生的块数。
+    """
+    if not page.strip():
+        return []
+    return _chunk_section(offset, page, {"page": page_no}, TEXT_SEPARATORS, metadata, first_index)
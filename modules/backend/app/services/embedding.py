@@ -1,8 +1,59 @@
 from core.grpc_client import grpc_client_manager
-from typing import List
+from core.settings import settings
+from typing import List, Optional
+from collections import OrderedDict
+import time
+import unicodedata
+
+import numpy as np
 import asyncio  # 【新增】导入asyncio
 
 
+def normalize_text(text: str) -> str:
+    """NFKC + collapsed whitespace; must match the inference-side cache key."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class QueryEmbeddingCache:
+    """
+    进程内的查询向量 LRU。
+
+    条目记录生成它的嵌入模型，推理服务返回的模型名变化时整体清空；
+    另有 TTL 兜底，防止其他实例切换模型后长期使用旧向量。
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.model_name = ""
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text: str) -> Optional[List[float]]:
+        key = normalize_text(text)
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, text: str, vector: List[float], model_name: str) -> None:
+        if model_name != self.model_name:
+            self.clear()
+            self.model_name = model_name
+        key = normalize_text(text)
+        self._entries[key] = (time.monotonic(), vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
 class EmbeddingModel:
     """
     一个封装了 gRPC 客户端的嵌入服务。
@@ -11,6 +62,9 @@ class EmbeddingModel:
 
     def __init__(self):
         self.grpc_client = grpc_client_manager
+        self.query_cache = QueryEmbeddingCache(
+            settings.QUERY_EMBEDDING_CACHE_SIZE, settings.QUERY_EMBEDDING_CACHE_TTL
+        )
 
     # 【修改】将批量方法修改为异步，以匹配gRPC客户端
     async def embed_batch(self, texts: List[str]) -> List[List[float]]:
@@ -19,12 +73,34 @@ class EmbeddingModel:
         # 调用 gRPC 客户端的异步方法
         return await self.grpc_client.get_embeddings_batch(texts)
 
+    async def embed_array(self, texts: List[str]) -> np.ndarray:
+        """Embeddings as a float32 matrix, without per-float Python objects."""
+        return await self.grpc_client.get_embeddings_array(texts)
+
+    def embed_stream(self, texts, group_size: int = 64):
+        """Stream (offset, vectors) pairs for a large or incremental set of texts."""
+        return self.grpc_client.embed_stream(texts, group_size=group_size)
+
     # 【可选保留】单个嵌入的方法，以防未来需要
     async def embed(self, text: str) -> List[float]:
         if not text.strip():
             return []
+        # 只缓存较短的文本（用户查询），整篇文档不进本地缓存
+        cacheable = len(text) <= settings.QUERY_EMBEDDING_CACHE_MAX_CHARS
+        if cacheable:
+            cached = self.query_cache.get(text)
+            if cached is not None:
+                return cached
         results = await self.embed_batch([text])
-        return results[0] if results else []
+        if not results:
+            return []
+        if cacheable:
+            self.query_cache.put(text, results[0], self.grpc_client.embedding_model_name)
+        return results[0]
+
+    def clear_cache(self) -> None:
+        """Forget cached query vectors, e.g. after the embedding model changed."""
+        self.query_cache.clear()
 
 
 embedding_model = EmbeddingModel()
@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from collections import deque
+from typing import AsyncIterator, List, Optional, Tuple
+
+import pdfplumber
+from docx import Document as DocxDocument
+
+from services.chunking import PAGE_BREAK
+
+logger = logging.getLogger(__name__)
+
+# 本模块在入库进程池的子进程中导入，不要引入 gRPC、向量库等重量级依赖
+
+SUPPORTED_SUFFIXES = ("txt", "md", "pdf", "docx")
+
+
+def _suffix(file_name: str) -> str:
+    return file_name.lower().split(".")[-1]
+
+
+def _docx_paragraph(para) -> str:
+    """Render DOCX headings as Markdown headings so chunking can follow them."""
+    style = para.style.name if para.style is not None else ""
+    if style.startswith("Heading") and para.text.strip():
+        level = style.replace("Heading", "").strip()
+        level = int(level) if level.isdigit() else 1
+        return "#" * min(level, 6) + " " + para.text.strip()
+    if style == "Title" and para.text.strip():
+        return "# " + para.text.strip()
+    return para.text
+
+
+def _extract_pdf(source) -> str:
+    with pdfplumber.open(source) as pdf:
+        return PAGE_BREAK.join([page.extract_text() or "" for page in pdf.pages])
+
+
+def _extract_docx(source) -> str:
+    doc = DocxDocument(source)
+    return "\n".join([_docx_paragraph(para) for para in doc.paragraphs])
+
+
+def extract_text(file_bytes: bytes, file_name: str) -> str:
+    suffix = _suffix(file_name)
+    if suffix in ["txt", "md"]:
+        return file_bytes.decode("utf-8", errors="ignore")
+    elif suffix == "pdf":
+        # 页之间用换页符分隔，分块时按页切分并记录页码
+        return _extract_pdf(io.BytesIO(file_bytes))
+    elif suffix == "docx":
+        return _extract_docx(io.BytesIO(file_bytes))
+    else:
+        raise ValueError("不支持的文件类型")
+
+
+def extract_file(file_path: str, file_name: str) -> str:
+    """Extract a whole non-paged document straight from disk."""
+    suffix = _suffix(file_name)
+    if suffix in ["txt", "md"]:
+        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+    elif suffix == "docx":
+        return _extract_docx(file_path)
+    elif suffix == "pdf":
+        return _extract_pdf(file_path)
+    else:
+        raise ValueError("不支持的文件类型")
+
+
+def pdf_page_count(file_path: str) -> int:
+    with pdfplumber.open(file_path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_pdf_pages(file_path: str, start: int, end: int) -> List[str]:
+    """
+    在工作进程中提取 [start, end) 页的文本。
+
+    直接从磁盘打开文件，处理完每页即释放其解析缓存，内存只与页数范围有关。
+    """
+    texts = []
+    with pdfplumber.open(file_path) as pdf:
+        for i in range(start, min(end, len(pdf.pages))):
+            page = pdf.pages[i]
+            texts.append(page.extract_text() or "")
+            page.close()
+    return texts
+
+
+def file_sha256(file_path: str, block_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    按文件内容的 SHA-256 缓存提取出的全文（页间以 ``PAGE_BREAK`` 分隔），
+    同一文件重复上传或重新入库时跳过解析。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, sha256: str) -> str:
+        return os.path.join(self.directory, sha256[:2], sha256 + ".txt")
+
+    def get(self, sha256: str) -> Optional[str]:
+        try:
+            with open(self._path(sha256), "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, sha256: str, text: str) -> None:
+        path = self._path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+
+async def stream_pages(
+    executor,
+    file_path: str,
+    file_name: str,
+    cache: Optional[ExtractionCache] = None,
+    sha256: Optional[str] = None,
+    pages_per_task: int = 16,
+    max_pending: int = 4,
+) -> AsyncIterator[Tuple[Optional[int], int, str]]:
+    """
+    逐页异步产出 (页码, 总页数, 文本)。
+
+    PDF 按 ``pages_per_task`` 页一组分给进程池并行提取，最多同时提交
+    ``max_pending`` 组，按页序产出，调用方可以在最后一页解析完之前就开始
+    分块与嵌入。其他格式整篇提取，作为一页产出，页码为 None。
+    命中 ``cache`` 时直接从缓存读出；上传时已算出的 ``sha256`` 可以直接传入。
+    """
+    loop = asyncio.get_running_loop()
+    is_pdf = _suffix(file_name) == "pdf"
+    if _suffix(file_name) not in SUPPORTED_SUFFIXES:
+        raise ValueError("不支持的文件类型")
+
+    if cache is not None:
+        sha256 = sha256 or await asyncio.to_thread(file_sha256, file_path)
+        cached = await asyncio.to_thread(cache.get, sha256)
+        if cached is not None:
+            logger.info(f"文档 '{file_name}' 命中提取缓存")
+            if not is_pdf:
+                yield None, 1, cached
+                return
+            pages = cached.split(PAGE_BREAK)
+            for page_no, page in enumerate(pages, start=1):
+                yield page_no, len(pages), page
+            return
+
+    if not is_pdf:
+        text = await loop.run_in_executor(executor, extract_file, file_path, file_name)
+        if cache is not None:
+            await asyncio.to_thread(cache.put, sha256, text)
+        yield None, 1, text
+        return
+
+    count = await loop.run_in_executor(executor, pdf_page_count, file_path)
+    ranges = deque((s, min(s + pages_per_task, count)) for s in range(0, count, pages_per_task))
+    pending = deque()
+    pages: List[str] = []
+    try:
+        while ranges or pending:
+            while ranges and len(pending) < max_pending:
+                start, end = ranges.popleft()
+                pending.append(
+                    (start, loop.run_in_executor(executor, extract_pdf_pages, file_path, start, end))
+                )
+            start, future = pending.popleft()
+            for i, page in enumerate(await future):
+                pages.append(page)
+                yield start + i + 1, count, page
+    finally:
+        for _, future in pending:
+            future.cancel()
+    if cache is not None:
+        await asyncio.to_thread(cache.put, sha256, PAGE_BREAK.join(pages))
@@ -0,0 +1,460 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.documents import Document
+
+from core.db_client import DEFAULT_COLLECTION, vector_store
+from core.settings import settings
+from services.embedding import embedding_model
+from services.chunking import PAGE_BREAK, chunk_page, chunk_text
+from services.extraction import ExtractionCache, stream_pages
+from services.knowledge_service import knowledge_service
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """入库过程中文档被删除，任务停止并清理已写入的部分"""
+
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+# 文档已被删除；不再参与去重，排队中的任务不再执行，执行中的任务在下一组写入前取消
+DELETED = "deleted"
+
+_COLUMNS = (
+    "id", "doc_id", "file_name", "file_path", "status", "stage", "progress",
+    "attempts", "error", "chunks", "timings", "created_at", "updated_at", "sha256",
+    "collection", "tags",
+)
+
+
+class JobStore:
+    """
+    SQLite 中持久化的入库任务表，服务重启后未完成的任务会重新排队。
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS ingest_jobs (
+                    id TEXT PRIMARY KEY,
+                    doc_id TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT NOT NULL DEFAULT '',
+                    progress REAL NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT NOT NULL DEFAULT '',
+                    chunks INTEGER NOT NULL DEFAULT 0,
+                    timings TEXT NOT NULL DEFAULT '{}',
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(ingest_jobs)")}
+            if "sha256" not in columns:
+                self._conn.execute(
+                    "ALTER TABLE ingest_jobs ADD COLUMN sha256 TEXT NOT NULL DEFAULT ''"
+                )
+            if "collection" not in columns:
+                self._conn.execute(
+                    "ALTER TABLE ingest_jobs ADD COLUMN collection TEXT NOT NULL"
+                    f" DEFAULT '{DEFAULT_COLLECTION}'"
+                )
+                self._conn.execute(
+                    "ALTER TABLE ingest_jobs ADD COLUMN tags TEXT NOT NULL DEFAULT '[]'"
+                )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ingest_jobs_sha256 ON ingest_jobs (sha256)"
+            )
+
+    @staticmethod
+    def _row(row) -> Dict:
+        job = dict(zip(_COLUMNS, row))
+        job["timings"] = json.loads(job["timings"])
+        job["tags"] = json.loads(job["tags"])
+        return job
+
+    def create(
+        self,
+        doc_id: str,
+        file_name: str,
+        file_path: str,
+        sha256: str = "",
+        collection: str = DEFAULT_COLLECTION,
+        tags: Sequence[str] = (),
+    ) -> Dict:
+        now = time.time()
+        job_id = str(uuid.uuid4())
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO ingest_jobs"
+                " (id, doc_id, file_name, file_path, status, created_at, updated_at, sha256,"
+                " collection, tags)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id, doc_id, file_name, file_path, QUEUED, now, now, sha256,
+                    collection, json.dumps(list(tags), ensure_ascii=False),
+                ),
+            )
+        return self.get(job_id)
+
+    def update(self, job_id: str, expected_status: Optional[str] = None, **fields) -> bool:
+        """
+        更新任务字段；给出 ``expected_status`` 时只在任务仍处于该状态时更新，
+        返回是否更新成功（任务已被删除时为 False）。
+        """
+        if "timings" in fields:
+            fields["timings"] = json.dumps(fields["timings"])
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        query = f"UPDATE ingest_jobs SET {assignments} WHERE id = ?"
+        args = (*fields.values(), job_id)
+        if expected_status is not None:
+            query += " AND status = ?"
+            args += (expected_status,)
+        with self._lock, self._conn:
+            return self._conn.execute(query, args).rowcount > 0
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM ingest_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        query = f"SELECT {', '.join(_COLUMNS)} FROM ingest_jobs"
+        args: tuple = ()
+        if status:
+            query += " WHERE status = ?"
+            args = (status,)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(query, (*args, limit)).fetchall()
+        return [self._row(r) for r in rows]
+
+    def find_by_sha256(self, sha256: str, collection: str = DEFAULT_COLLECTION) -> Optional[Dict]:
+        """Latest job in ``collection`` for the same file contents that has not failed or been deleted."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM ingest_jobs"
+                " WHERE sha256 = ? AND collection = ? AND status NOT IN (?, ?)"
+                " ORDER BY created_at DESC LIMIT 1",
+                (sha256, collection, FAILED, DELETED),
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def mark_deleted(self, doc_id: str) -> int:
+        """
+        Mark every job of ``doc_id`` as deleted so its contents can be uploaded again.
+        Queued jobs are skipped and running jobs cancel themselves; returns the job count.
+        """
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE ingest_jobs SET status = ?, updated_at = ? WHERE doc_id = ?",
+                (DELETED, time.time(), doc_id),
+            ).rowcount
+
+    def unfinished(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM ingest_jobs"
+                " WHERE status IN (?, ?) ORDER BY created_at",
+                (QUEUED, RUNNING),
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+
+class IngestionQueue:
+    """
+    文档入库的后台任务队列。
+
+    上传接口只保存文件并登记任务；后台协程从队列取任务，把 CPU 密集的
+    文本提取交给进程池逐页并行处理，边提取边分块、流式嵌入并分组写入
+    向量库，期间持续更新进度与各阶段耗时。失败的任务按指数退避重试，超过 ``INGEST_MAX_ATTEMPTS``
+    次后标记为 failed。文档在入库过程中被删除时任务随之取消，已写入的分块
+    与文本会被清掉。
+    """
+
+    def __init__(self, store: JobStore):
+        self.store = store
+        self._queue: asyncio.Queue = None
+        self._workers: List[asyncio.Task] = []
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.cache = ExtractionCache(settings.EXTRACT_CACHE_DIR) if settings.EXTRACT_CACHE else None
+
+    async def start(self) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._pool = self._new_pool()
+        pending = await asyncio.to_thread(self.store.unfinished)
+        for job in pending:
+            await asyncio.to_thread(self.store.update, job["id"], status=QUEUED)
+            self._queue.put_nowait(job["id"])
+        if pending:
+            logger.info(f"恢复 {len(pending)} 个未完成的入库任务")
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(settings.INGEST_WORKERS)
+        ]
+        logger.info(f"入库队列已启动：{settings.INGEST_WORKERS} 个任务协程，"
+                    f"{settings.INGEST_PROCESS_WORKERS} 个提取进程")
+
+    @staticmethod
+    def _new_pool() -> ProcessPoolExecutor:
+        # 事件循环进程持有 gRPC 通道，不能 fork，子进程用 spawn 启动
+        return ProcessPoolExecutor(
+            max_workers=settings.INGEST_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def submit(
+        self,
+        doc_id: str,
+        file_name: str,
+        file_path: str,
+        sha256: str = "",
+        collection: str = DEFAULT_COLLECTION,
+        tags: Sequence[str] = (),
+    ) -> Dict:
+        """
+        登记入库任务，分块写入集合 ``collection``，``tags`` 作为可过滤的元数据。
+        同一集合内内容哈希与已有（未失败的）任务相同时不再重复入库，
+        直接返回已有任务，调用方据其 ``doc_id`` 判断是否为重复文件。
+        """
+        if sha256:
+            existing = await asyncio.to_thread(self.store.find_by_sha256, sha256, collection)
+            if existing is not None:
+                logger.info(f"文件 '{file_name}' 与文档 {existing['doc_id']} 内容相同，跳过入库")
+                return existing
+        job = await asyncio.to_thread(
+            self.store.create, doc_id, file_name, file_path, sha256, collection, tags
+        )
+        self._queue.put_nowait(job["id"])
+        logger.info(f"入库任务 {job['id']} 已排队: {file_name}")
+        return job
+
+    async def retry(self, job_id: str) -> Optional[Dict]:
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or job["status"] != FAILED:
+            return job
+        requeued = await asyncio.to_thread(
+            self.store.update, job_id, FAILED,
+            status=QUEUED, attempts=0, error="", progress=0.0, stage="",
+        )
+        if requeued:
+            self._queue.put_nowait(job_id)
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def list(self, status: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        return await asyncio.to_thread(self.store.list, status, limit)
+
+    async def mark_deleted(self, doc_id: str) -> int:
+        return await asyncio.to_thread(self.store.mark_deleted, doc_id)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._process(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"入库任务 {job_id} 处理异常")
+            finally:
+                self._queue.task_done()
+
+    async def _update(self, job_id: str, **fields) -> bool:
+        # 执行中的任务只在仍为 running 时更新，不会覆盖删除接口写入的 deleted
+        return await asyncio.to_thread(self.store.update, job_id, RUNNING, **fields)
+
+    async def _discard(self, job: Dict) -> None:
+        """清掉被取消的任务已写入的分块与文本"""
+        vector_db = await asyncio.to_thread(vector_store.collection, job["collection"])
+        await asyncio.to_thread(vector_db.delete_documents_by_source, job["doc_id"])
+        await asyncio.to_thread(knowledge_service.remove_text, job["doc_id"])
+        logger.info(f"入库任务 {job['id']} 已取消：文档 {job['doc_id']} 已被删除")
+
+    async def _process(self, job_id: str) -> None:
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or job["status"] != QUEUED:
+            return
+        attempts = job["attempts"] + 1
+        timings: Dict[str, float] = {"queued": time.time() - job["updated_at"]}
+        started_ok = await asyncio.to_thread(
+            self.store.update, job_id, QUEUED, status=RUNNING, stage="extract", progress=0.0,
+            attempts=attempts, error="", timings=timings,
+        )
+        if not started_ok:
+            return
+        started = time.perf_counter()
+        try:
+            await self._run(job, timings)
+        except JobCancelled:
+            await self._discard(job)
+            return
+        except Exception as e:
+            timings["total"] = time.perf_counter() - started
+            logger.error(f"入库任务 {job_id} 第 {attempts} 次尝试失败: {e}", exc_info=True)
+            # ValueError 表示文件本身无法处理（如不支持的类型），不再重试
+            retry = attempts < settings.INGEST_MAX_ATTEMPTS and not isinstance(e, ValueError)
+            if not await self._update(
+                job_id, status=QUEUED if retry else FAILED, error=str(e), timings=timings
+            ):
+                await self._discard(job)
+            elif retry:
+                delay = settings.INGEST_RETRY_DELAY * 2 ** (attempts - 1)
+                asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, job_id)
+            return
+        timings["total"] = time.perf_counter() - started
+        if not await self._update(
+            job_id, status=SUCCEEDED, stage="done", progress=100.0, timings=timings
+        ):
+            # 写完文本后、标记完成前文档被删除
+            await self._discard(job)
+            return
+        logger.info(f"入库任务 {job_id} 完成，用时 {timings['total']:.2f}s")
+
+    async def iter_chunks(
+        self,
+        file_path: str,
+        file_name: str,
+        metadata: Dict,
+        sha256: Optional[str] = None,
+        timings: Optional[Dict[str, float]] = None,
+    ):
+        """
+        在进程池中逐页提取并分块，按页产出 (总页数, 页文本, 该页的分块)。
+        分块的序号与偏移按全文连续计算；``timings`` 中累加 extract/chunk 耗时。
+        """
+        timings = timings if timings is not None else {}
+        offset = count = 0
+        waited = time.perf_counter()
+        async for page_no, page_count, page in stream_pages(
+            self._pool,
+            file_path,
+            file_name,
+            cache=self.cache,
+            sha256=sha256,
+            pages_per_task=settings.EXTRACT_PAGES_PER_TASK,
+            max_pending=settings.INGEST_PROCESS_WORKERS * 2,
+        ):
+            chunked = time.perf_counter()
+            timings["extract"] = timings.get("extract", 0.0) + chunked - waited
+            if page_no is None:
+                new = await asyncio.to_thread(chunk_text, page, file_name, metadata)
+            else:
+                new = await asyncio.to_thread(chunk_page, page, page_no, offset, metadata, count)
+                offset += len(page) + len(PAGE_BREAK)
+            count += len(new)
+            waited = time.perf_counter()
+            timings["chunk"] = timings.get("chunk", 0.0) + waited - chunked
+            yield page_count, page, new
+
+    async def _run(self, job: Dict, timings: Dict[str, float]) -> None:
+        """
+        提取、分块、嵌入与写库流水线并行：进程池逐页提取，每页分块后立即
+        送入 EmbedStream，返回的向量按组写库。各阶段耗时相互重叠。
+        """
+        job_id, doc_id, file_name = job["id"], job["doc_id"], job["file_name"]
+        # 文档类型、上传时间与标签写进每个分块的元数据，检索时可按它们过滤；
+        # 标签写成 "tag_<标签>": true，两种向量索引后端都能按等值过滤
+        metadata = {
+            "id": doc_id,
+            "title": file_name,
+            "doc_type": os.path.splitext(file_name)[1].lstrip(".").lower(),
+            "uploaded_at": int(job["created_at"]),
+            **{f"tag_{tag}": True for tag in job["tags"]},
+        }
+        vector_db = await asyncio.to_thread(vector_store.collection, job["collection"])
+        chunks: List[Document] = []
+        pages: List[str] = []
+        state = {"page_count": 1, "extracted": False, "progress": 0.0}
+        for stage in ("extract", "chunk", "embed", "store"):
+            timings[stage] = 0.0
+
+        async def chunk_texts():
+            async for page_count, page, new in self.iter_chunks(
+                job["file_path"], file_name, metadata, sha256=job["sha256"] or None, timings=timings
+            ):
+                pages.append(page)
+                state["page_count"] = page_count
+                chunks.extend(new)
+                for chunk in new:
+                    yield chunk.page_content
+            state["extracted"] = True
+
+        # 先清掉之前的尝试可能写入的部分分块（新文档时为空操作）
+        await asyncio.to_thread(vector_db.delete_documents_by_source, doc_id)
+
+        try:
+            async with vector_db.bulk_writer(doc_id) as writer:
+                waited = time.perf_counter()
+                async for offset, vectors in embedding_model.embed_stream(
+                    chunk_texts(), group_size=settings.INGEST_EMBED_GROUP_SIZE
+                ):
+                    stored = time.perf_counter()
+                    timings["embed"] += stored - waited
+                    await writer.add(
+                        chunks[offset : offset + len(vectors)], vectors, start_index=offset
+                    )
+                    waited = time.perf_counter()
+                    timings["store"] += waited - stored
+                    # 已提取页的比例 × 已提取分块中完成嵌入的比例
+                    done = (offset + len(vectors)) / len(chunks)
+                    progress = 99.9 * len(pages) / state["page_count"] * done
+                    state["progress"] = max(state["progress"], progress)
+                    if not await self._update(
+                        job_id,
+                        stage="embed" if state["extracted"] else "extract",
+                        progress=state["progress"],
+                        chunks=len(chunks),
+                        timings=timings,
+                    ):
+                        raise JobCancelled(job_id)
+                stored = time.perf_counter()
+            timings["store"] += time.perf_counter() - stored
+        except BrokenProcessPool:
+            # 子进程崩溃（如解析异常文件时内存耗尽）后进程池不可再用，重建后按失败重试
+            logger.warning("文本提取进程异常退出，重建进程池")
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = self._new_pool()
+            raise
+
+        await asyncio.to_thread(knowledge_service.save_text, doc_id, PAGE_BREAK.join(pages))
+        await self._update(job_id, chunks=len(chunks))
+
+
+ingestion_queue = IngestionQueue(JobStore(settings.INGEST_DB_PATH))
@@ -4,7 +4,9 @@ from typing import List
 from langchain_core.documents import Document
 
 from core.db_client import vector_db
+from core.grpc_client import grpc_client_manager
 from services.embedding import embedding_model
+from services.chunking import chunk_text
 
 logger = logging.getLogger(__name__)
 
@@ -40,9 +42,7 @@ class KnowledgeBaseService:
         except UnicodeDecodeError:
             text = data.decode("gbk", errors="ignore")
 
-        doc = Document(page_content=text, metadata={"source": file_name})
-        embedding = await embedding_model.embed(text)
-        await vector_db.add_documents([doc], [embedding], file_name)
+        await self.add_documents(chunk_text(text, file_name), file_name)
         logger.info(f"Document '{file_name}' embedded and stored")
         return True
 
@@ -57,15 +57,7 @@ class KnowledgeBaseService:
     async def list_all_documents(self) -> List[dict] | None:
         """List all documents stored in the vector database."""
         try:
-            results = vector_db.collection.get(include=["metadatas"], limit=None)
-            sources: List[dict] = []
-            seen: set[str] = set()
-            for meta in results.get("metadatas", []):
-                src = meta.get("source")
-                if src and src not in seen:
-                    seen.add(src)
-                    sources.append({"source": src})
-            return sources
+            return [{"source": src} for src in vector_db.list_sources()]
         except Exception as e:
             logger.error(f"Failed to list documents: {e}", exc_info=True)
             return None
@@ -85,7 +77,13 @@ class KnowledgeBaseService:
 
     async def delete_documents_by_source(self, source_name: str) -> bool:
         """Asynchronously delete all vectors related to the given source."""
-        return self.delete_document(source_name)
+        deleted = self.delete_document(source_name)
+        if deleted:
+            try:
+                await grpc_client_manager.invalidate_cache([source_name])
+            except Exception:
+                logger.warning("Failed to invalidate cached answers", exc_info=True)
+        return deleted
 
     async def add_documents(
         self, documents: List[Document], document_source: str
@@ -95,8 +93,12 @@ class KnowledgeBaseService:
             return
         try:
             texts = [d.page_content for d in documents]
-            embeddings = await embedding_model.embed_batch(texts)
-            await vector_db.add_documents(documents, embeddings, document_source)
+            # 流式嵌入：服务端计算后续分组的同时批量写入已返回的向量
+            async with vector_db.bulk_writer(document_source) as writer:
+                async for offset, vectors in embedding_model.embed_stream(texts):
+                    await writer.add(
+                        documents[offset : offset + len(vectors)], vectors, start_index=offset
+                    )
             logger.info(f"Added {len(documents)} documents from '{document_source}'")
         except Exception as e:
             logger.error(f"Error adding documents: {e}", exc_info=True)
@@ -1,16 +1,42 @@
 import os
+import asyncio
 import logging
 import uuid
-import io
 from typing import List, Optional, Dict
 from langchain_core.documents import Document
-from core.db_client import vector_db
+from core.db_client import vector_db, vector_store
+from core.grpc_client import grpc_client_manager
+from core.metadata_filter import normalize_where
+from core.settings import settings
 from services.embedding import embedding_model
-import pdfplumber
-from docx import Document as DocxDocument
+from services.chunking import chunk_text
+from services.extraction import extract_text
+from services.rerank import reranker
 
 logger = logging.getLogger(__name__)
 
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], n_results: int, k: int = 60) -> List[Document]:
+    """
+    倒数排名融合：每路结果按名次计 1/(k + rank) 分累加，只看名次不看原始分数，
+    向量距离与 BM25 分数不必归一化。同一分块以 (集合, ``chunk_id``) 识别，元数据合并。
+    """
+    scores: Dict[tuple, float] = {}
+    docs: Dict[tuple, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = (doc.metadata.get("collection"), doc.metadata.get("chunk_id") or doc.page_content)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            if key in docs:
+                docs[key].metadata.update(doc.metadata)
+            else:
+                docs[key] = Document(page_content=doc.page_content, metadata=dict(doc.metadata))
+    fused = sorted(scores, key=scores.get, reverse=True)[:n_results]
+    for key in fused:
+        docs[key].metadata["rrf_score"] = scores[key]
+    return [docs[key] for key in fused]
+
+
 class KnowledgeService:
     def __init__(self, storage_dir: Optional[str] = None) -> None:
         self.storage_dir = storage_dir or os.getenv("KNOWLEDGE_BASE_DOCS", "/knowledge_base_docs")
@@ -18,26 +44,30 @@ class KnowledgeService:
         logger.info(f"Knowledge base storage directory: {self.storage_dir}")
 
     def _extract_text(self, file_bytes: bytes, file_name: str) -> str:
-        suffix = file_name.lower().split(".")[-1]
-        if suffix in ["txt", "md"]:
-            return file_bytes.decode("utf-8", errors="ignore")
-        elif suffix == "pdf":
-            with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
-                return "\n".join([page.extract_text() or "" for page in pdf.pages])
-        elif suffix == "docx":
-            doc = DocxDocument(io.BytesIO(file_bytes))
-            return "\n".join([para.text for para in doc.paragraphs])
-        else:
-            raise ValueError("不支持的文件类型")
+        return extract_text(file_bytes, file_name)
 
     def add_document(self, file_name: str, file_bytes: bytes, doc_id: Optional[str] = None) -> str:
         doc_id = doc_id or str(uuid.uuid4())
         text = self._extract_text(file_bytes, file_name)
+        file_path = self.save_text(doc_id, text)
+        logger.info(f"Document '{file_name}' saved as '{file_path}' with UUID {doc_id}")
+        return doc_id
+
+    def save_text(self, doc_id: str, text: str) -> str:
+        """Store extracted text as ``<doc_id>.txt`` and return its path."""
         file_path = os.path.join(self.storage_dir, doc_id + ".txt")
         with open(file_path, "w", encoding="utf-8") as f:
             f.write(text)
-        logger.info(f"Document '{file_name}' saved as '{file_path}' with UUID {doc_id}")
-        return doc_id
+        return file_path
+
+    def remove_text(self, doc_id: str) -> bool:
+        """Remove ``<doc_id>.txt``; returns whether it existed."""
+        file_path = os.path.join(self.storage_dir, doc_id + ".txt")
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            return False
+        return True
 
     async def embed_document(self, doc_id: str, original_name: str) -> bool:
         file_path = os.path.join(self.storage_dir, doc_id + ".txt")
@@ -47,58 +77,136 @@ class KnowledgeService:
         with open(file_path, "r", encoding="utf-8") as f:
             text = f.read()
 
-        doc = Document(page_content=text, metadata={"id": doc_id, "source": original_name})
-        embedding = await embedding_model.embed(text)
-        await vector_db.add_documents([doc], [embedding], doc_id)
-        logger.info(f"Document '{doc_id}' embedded and stored")
+        chunks = chunk_text(text, original_name, metadata={"id": doc_id, "title": original_name})
+        async with vector_db.bulk_writer(doc_id) as writer:
+            async for offset, vectors in embedding_model.embed_stream(
+                [c.page_content for c in chunks]
+            ):
+                await writer.add(chunks[offset : offset + len(vectors)], vectors, start_index=offset)
+        logger.info(f"Document '{doc_id}' embedded and stored as {len(chunks)} chunks")
         return True
 
-    async def delete_documents_by_id(self, doc_id: str) -> bool:
-        file_path = os.path.join(self.storage_dir, doc_id + ".txt")
-        if not os.path.exists(file_path):
+    async def delete_documents_by_id(self, doc_id: str, missing_ok: bool = False) -> bool:
+        """
+        Delete the stored text and all chunks of ``doc_id``. Returns False when the
+        text does not exist, unless ``missing_ok`` (the document is still being ingested).
+        """
+        if not await asyncio.to_thread(self.remove_text, doc_id) and not missing_ok:
             return False
-        os.remove(file_path)
         try:
-            vector_db.delete_documents_by_source(doc_id)
+            # 文档 ID 全局唯一，不必记录它写在哪个集合里；索引与 SQLite 删除放到线程里
+            for client in await asyncio.to_thread(vector_store.all):
+                await asyncio.to_thread(client.delete_documents_by_source, doc_id)
         except Exception:
             logger.warning("Failed to delete document from vector DB", exc_info=True)
+        try:
+            await grpc_client_manager.invalidate_cache([doc_id])
+        except Exception:
+            logger.warning("Failed to invalidate cached answers", exc_info=True)
         logger.info(f"Document '{doc_id}' deleted")
         return True
 
-    def _load_doc_meta(self) -> List[Dict]:
+    def _list_doc_files(self) -> List[str]:
+        return [
+            file
+            for file in os.listdir(self.storage_dir)
+            if file.endswith(".txt") and os.path.isfile(os.path.join(self.storage_dir, file))
+        ]
+
+    def _load_doc_meta(self, files: List[str]) -> List[Dict]:
         docs = []
-        for file in os.listdir(self.storage_dir):
-            if not file.endswith(".txt"):
-                continue
+        for file in files:
             doc_id = file.replace(".txt", "")
             path = os.path.join(self.storage_dir, file)
-            if os.path.isfile(path):
-                with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                    content = f.read(5000)
-                preview = content.strip().replace('\n', '').replace('\r', '')
-                preview = preview[:50] + '...' if len(preview) > 50 else preview
-                docs.append({"id": doc_id, "title": file, "content": preview})
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                content = f.read(5000)
+            preview = content.strip().replace('\n', '').replace('\r', '')
+            preview = preview[:50] + '...' if len(preview) > 50 else preview
+            docs.append({"id": doc_id, "title": file, "content": preview})
         return docs
 
     async def paginated_list(self, page: int, page_size: int, search: str, by: str):
-        all_docs = self._load_doc_meta()
+        # 只列文件名；内容搜索走关键词索引（全文），只为当前页读取预览
+        files = await asyncio.to_thread(self._list_doc_files)
         if search:
-            def match(doc):
-                s = search.lower()
-                return (s in doc["title"].lower() if by in ("title", "all") else False) or \
-                       (s in doc["content"].lower() if by in ("content", "all") else False)
-            all_docs = [doc for doc in all_docs if match(doc)]
-        all_docs.sort(key=lambda d: d["title"])
-        total = len(all_docs)
+            s = search.lower()
+            matched = set()
+            if by in ("title", "all"):
+                matched.update(f for f in files if s in f.lower())
+            if by in ("content", "all"):
+                sources = set()
+                for client in await asyncio.to_thread(vector_store.all):
+                    sources |= await asyncio.to_thread(client.lexical.matching_sources, search)
+                # 上传的文档以 doc_id 为来源，目录索引的文件以相对路径为来源
+                matched.update(f for f in files if f[: -len(".txt")] in sources or f in sources)
+            files = [f for f in files if f in matched]
+        files.sort()
+        total = len(files)
         start = (page - 1) * page_size
         end = start + page_size
-        page_docs = all_docs[start:end]
+        page_docs = await asyncio.to_thread(self._load_doc_meta, files[start:end])
         return {"total": total, "docs": page_docs}
 
-    async def search(self, query: str, n_results: int = 3) -> List[Document]:
+    async def _retrieve(
+        self, query: str, n_results: int, clients: List, where: Optional[dict]
+    ) -> List[Document]:
+        """
+        分散-汇聚：各集合的向量检索（和关键词检索）并行执行。各集合的向量
+        来自同一嵌入模型，按距离直接合并；BM25 分数按分数合并，再与向量
+        结果做倒数排名融合。
+        """
+        depth = max(n_results, settings.HYBRID_CANDIDATES) if settings.HYBRID_SEARCH else n_results
+        try:
+            embedding = await embedding_model.embed(query)
+        except Exception as e:
+            # 向量化失败时仍返回关键词检索结果
+            logger.error(f"查询向量化失败: {e}", exc_info=True)
+            embedding = None
+        if not embedding:
+            logger.warning("未能获得有效的 embedding。")
+        dense = [c.search_with_vector(embedding, depth, where) for c in clients] if embedding else []
+        lexical = [c.lexical_search(query, depth, where) for c in clients] if settings.HYBRID_SEARCH else []
+        results = await asyncio.gather(*dense, *lexical)
+        dense_hits = sorted(
+            (d for hits in results[: len(dense)] for d in hits),
+            key=lambda d: d.metadata["distance"],
+        )
+        if not settings.HYBRID_SEARCH:
+            return dense_hits[:n_results]
+        lexical_hits = sorted(
+            (d for hits in results[len(dense) :] for d in hits),
+            key=lambda d: d.metadata["bm25"],
+            reverse=True,
+        )
+        return reciprocal_rank_fusion(
+            [dense_hits[:depth], lexical_hits[:depth]], n_results, k=settings.RRF_K
+        )
+
+    async def search(
+        self,
+        query: str,
+        n_results: int = 3,
+        collections: Optional[List[str]] = None,
+        where: Optional[dict] = None,
+    ) -> List[Document]:
+        """
+        在一个或多个集合中检索（默认只查默认集合），``where`` 为元数据过滤
+        条件。集合不存在或过滤条件无效时抛出 ``ValueError``。
+        """
+        where = normalize_where(where)
+        clients = (
+            [vector_store.collection(name, create=False) for name in dict.fromkeys(collections)]
+            if collections
+            else [vector_db]
+        )
         try:
-            results = await vector_db.asimilarity_search(query, k=n_results)
-            return results
+            if not settings.RERANK_ENABLED:
+                return await self._retrieve(query, n_results, clients, where)
+            # 先取更宽的候选集，再用交叉编码器选出最相关的 n_results 条
+            candidates = await self._retrieve(
+                query, max(n_results, settings.RERANK_CANDIDATES), clients, where
+            )
+            return await reranker.rerank(query, candidates, n_results)
         except Exception as e:
             logger.error(f"知识库搜索失败: {e}", exc_info=True)
             return []
@@ -5,6 +5,8 @@ from pathlib import Path
 from core.grpc_client import grpc_client_manager
 from core.settings import settings
 from protos import inference_pb2
+from services.embedding import embedding_model
+from services.uploads import safe_filename, save_upload
 
 
 class ModelService:
@@ -20,13 +22,15 @@ class ModelService:
         if not (file.filename.endswith(".gguf") or file.filename.endswith(".safetensors")):
             return {"success": False, "message": "只允许上传 .gguf 或 .safetensors 文件"}
 
-        dest = self.model_dir / file.filename
-
         try:
-            with open(dest, "wb") as f:
-                while chunk := await file.read(1024 * 1024):  # 每次读取 1MB 块
-                    f.write(chunk)
-            return {"success": True, "message": f"模型 {file.filename} 上传成功"}
+            # 流式写入临时文件并计算 SHA-256，完成后原子改名，不会留下半个模型文件
+            saved = await save_upload(file, self.model_dir / safe_filename(file.filename))
+            return {
+                "success": True,
+                "message": f"模型 {file.filename} 上传成功",
+                "sha256": saved["sha256"],
+                "size": saved["size"],
+            }
         except Exception as e:
             return {"success": False, "message": f"模型保存失败：{str(e)}"}
 
@@ -77,6 +81,7 @@ class ModelService:
                 active["generation"] = model_name
             elif model_type == inference_pb2.ModelType.EMBEDDING:
                 active["embedding"] = model_name
+                embedding_model.clear_cache()
             self._save_active(active)
         return success, loading, message
 
@@ -0,0 +1,248 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from core.db_client import vector_db
+from core.grpc_client import grpc_client_manager
+from core.settings import settings
+from services.embedding import embedding_model
+from services.extraction import SUPPORTED_SUFFIXES, file_sha256
+from services.ingestion import ingestion_queue
+from services.knowledge_service import knowledge_service
+
+logger = logging.getLogger(__name__)
+
+
+def chunk_ids(doc_id: str, chunks: List[Document]) -> List[str]:
+    """
+    按内容寻址的分块 ID：``<doc_id>:<文本哈希>``，同一文档内重复的文本
+    追加序号。文件修改后未变的分块 ID 不变，无需重新嵌入。
+    """
+    seen: Dict[str, int] = {}
+    ids = []
+    for chunk in chunks:
+        digest = hashlib.sha1(chunk.page_content.encode("utf-8")).hexdigest()[:16]
+        n = seen.get(digest, 0)
+        seen[digest] = n + 1
+        ids.append(f"{doc_id}:{digest}" + (f"-{n}" if n else ""))
+    return ids
+
+
+class IndexManifest:
+    """
+    目录索引清单（SQLite）：每个文件的大小、mtime、内容哈希及其分块 ID。
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS index_files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    chunk_ids TEXT NOT NULL,
+                    indexed_at REAL NOT NULL
+                )
+                """
+            )
+
+    def all(self) -> Dict[str, Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, mtime_ns, sha256, chunk_ids FROM index_files"
+            ).fetchall()
+        return {
+            path: {"size": size, "mtime_ns": mtime_ns, "sha256": sha256, "chunk_ids": chunk_ids}
+            for path, size, mtime_ns, sha256, chunk_ids in rows
+        }
+
+    def put(self, path: str, size: int, mtime_ns: int, sha256: str, ids: List[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO index_files VALUES (?, ?, ?, ?, ?, ?)",
+                (path, size, mtime_ns, sha256, json.dumps(ids), time.time()),
+            )
+
+    def touch(self, path: str, size: int, mtime_ns: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE index_files SET size = ?, mtime_ns = ? WHERE path = ?",
+                (size, mtime_ns, path),
+            )
+
+    def delete(self, path: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM index_files WHERE path = ?", (path,))
+
+
+class DirectoryIndexer:
+    """
+    把知识库目录与向量库增量同步。
+
+    - 按 (大小, mtime) 快速判断未变的文件，变了再比对内容哈希；
+    - 内容变化的文件重新提取分块，只嵌入新增的分块，删除消失的分块，
+      保留的分块只更新元数据（偏移、序号）；
+    - 目录中已删除的文件，其向量一并删除；
+    - 多个文件并发处理，提取复用入库队列的进程池与提取缓存。
+
+    上传入库生成的 ``<uuid>.txt`` 由上传流程管理，这里跳过。
+    """
+
+    def __init__(self, root: str, manifest: IndexManifest):
+        self.root = root
+        self.manifest = manifest
+        self._lock = asyncio.Lock()
+        self.running = False
+        self.last_run: Dict = {}
+
+    @staticmethod
+    def _is_upload_text(rel: str) -> bool:
+        stem, ext = os.path.splitext(rel)
+        if ext != ".txt" or os.sep in stem:
+            return False
+        try:
+            uuid.UUID(stem)
+            return True
+        except ValueError:
+            return False
+
+    def _scan(self) -> Dict[str, os.stat_result]:
+        files = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for name in filenames:
+                if name.startswith(".") or name.lower().split(".")[-1] not in SUPPORTED_SUFFIXES:
+                    continue
+                path = os.path.join(dirpath, name)
+                rel = os.path.relpath(path, self.root)
+                if self._is_upload_text(rel):
+                    continue
+                files[rel] = os.stat(path)
+        return files
+
+    async def run(self) -> Dict:
+        if self._lock.locked():
+            return {"success": False, "message": "索引任务正在运行"}
+        async with self._lock:
+            self.running = True
+            try:
+                self.last_run = await self._run()
+            finally:
+                self.running = False
+        return self.last_run
+
+    async def _run(self) -> Dict:
+        started = time.perf_counter()
+        stats = {
+            "scanned": 0, "unchanged": 0, "indexed": 0, "removed": 0, "failed": 0,
+            "chunks_added": 0, "chunks_removed": 0, "chunks_kept": 0,
+        }
+        files = await asyncio.to_thread(self._scan)
+        known = await asyncio.to_thread(self.manifest.all)
+        stats["scanned"] = len(files)
+        logger.info(f"开始增量索引 {self.root}: {len(files)} 个文件，清单中 {len(known)} 个")
+
+        semaphore = asyncio.Semaphore(settings.REINDEX_CONCURRENCY)
+        changed: List[str] = []
+
+        async def sync(rel: str, st: os.stat_result) -> None:
+            async with semaphore:
+                try:
+                    if await self._sync_file(rel, st, known.get(rel), stats):
+                        changed.append(rel)
+                except Exception as e:
+                    stats["failed"] += 1
+                    logger.error(f"索引文件 {rel} 失败: {e}", exc_info=True)
+
+        await asyncio.gather(*(sync(rel, st) for rel, st in files.items()))
+
+        for rel in set(known) - set(files):
+            await asyncio.to_thread(vector_db.delete_documents_by_source, rel)
+            await asyncio.to_thread(self.manifest.delete, rel)
+            stats["removed"] += 1
+            stats["chunks_removed"] += len(json.loads(known[rel]["chunk_ids"]))
+            changed.append(rel)
+
+        if changed:
+            try:
+                await grpc_client_manager.invalidate_cache(changed)
+            except Exception:
+                logger.warning("Failed to invalidate cached answers", exc_info=True)
+        stats["seconds"] = time.perf_counter() - started
+        stats["finished_at"] = time.time()
+        logger.info(f"增量索引完成: {stats}")
+        return stats
+
+    async def _sync_file(
+        self, rel: str, st: os.stat_result, entry: Optional[Dict], stats: Dict
+    ) -> bool:
+        """Bring one file's vectors up to date; return True if its content changed."""
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            stats["unchanged"] += 1
+            return False
+        path = os.path.join(self.root, rel)
+        sha256 = await asyncio.to_thread(file_sha256, path)
+        if entry and entry["sha256"] == sha256:
+            await asyncio.to_thread(self.manifest.touch, rel, st.st_size, st.st_mtime_ns)
+            stats["unchanged"] += 1
+            return False
+
+        name = os.path.basename(rel)
+        chunks: List[Document] = []
+        async for _, _, new in ingestion_queue.iter_chunks(
+            path, name, {"id": rel, "title": name}, sha256=sha256
+        ):
+            chunks.extend(new)
+        ids = chunk_ids(rel, chunks)
+
+        if entry is None:
+            # 清单里没有（首次索引或清单丢失），清掉该来源可能残留的旧向量
+            await asyncio.to_thread(vector_db.delete_documents_by_source, rel)
+            old_ids = set()
+        else:
+            old_ids = set(json.loads(entry["chunk_ids"]))
+        stale = list(old_ids - set(ids))
+        kept = [i for i, cid in enumerate(ids) if cid in old_ids]
+        added = [i for i, cid in enumerate(ids) if cid not in old_ids]
+
+        await asyncio.to_thread(vector_db.delete_ids, stale)
+        await asyncio.to_thread(
+            vector_db.update_metadatas, [ids[i] for i in kept], [chunks[i] for i in kept], rel
+        )
+        if added:
+            async with vector_db.bulk_writer(rel) as writer:
+                async for offset, vectors in embedding_model.embed_stream(
+                    [chunks[i].page_content for i in added],
+                    group_size=settings.INGEST_EMBED_GROUP_SIZE,
+                ):
+                    group = added[offset : offset + len(vectors)]
+                    await writer.add(
+                        [chunks[i] for i in group], vectors, ids=[ids[i] for i in group]
+                    )
+
+        await asyncio.to_thread(self.manifest.put, rel, st.st_size, st.st_mtime_ns, sha256, ids)
+        stats["indexed"] += 1
+        stats["chunks_added"] += len(added)
+        stats["chunks_removed"] += len(stale)
+        stats["chunks_kept"] += len(kept)
+        logger.info(f"已索引 {rel}: 新增 {len(added)} 块，删除 {len(stale)} 块，保留 {len(kept)} 块")
+        return True
+
+
+directory_indexer = DirectoryIndexer(
+    knowledge_service.storage_dir, IndexManifest(settings.REINDEX_MANIFEST_PATH)
+)
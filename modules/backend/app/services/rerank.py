@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Sequence, Tuple
+
+import grpc
+from langchain_core.documents import Document
+
+from core.grpc_client import grpc_client_manager
+from core.settings import settings
+from services.embedding import normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def chunk_key(doc: Document) -> str:
+    chunk_id = doc.metadata.get("chunk_id")
+    if not chunk_id:
+        return _digest(doc.page_content)
+    return f"{doc.metadata.get('collection', '')}/{chunk_id}"
+
+
+class RerankScoreCache:
+    """
+    重排分数 LRU，键为 (规范化查询哈希, 分块 ID)。
+
+    推理服务返回的重排模型名变化时整体清空；分块 ID 不变而内容改写
+    （如按序号编号的分块）时靠 TTL 兜底。
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.model_name = ""
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, query_key: str, keys: Sequence[str]) -> Dict[str, float]:
+        now = time.monotonic()
+        found = {}
+        for key in keys:
+            entry = self._entries.get((query_key, key))
+            if entry is None or now - entry[0] > self.ttl_seconds:
+                self.misses += 1
+                continue
+            self._entries.move_to_end((query_key, key))
+            self.hits += 1
+            found[key] = entry[1]
+        return found
+
+    def put_many(self, query_key: str, scores: Sequence[Tuple[str, float]], model_name: str) -> None:
+        if model_name != self.model_name:
+            self.clear()
+            self.model_name = model_name
+        now = time.monotonic()
+        for key, score in scores:
+            self._entries[(query_key, key)] = (now, score)
+            self._entries.move_to_end((query_key, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class Reranker:
+    """
+    用推理服务的交叉编码器为候选分块重新排序。
+
+    只有缓存未命中的分块才发给推理服务，一次 RPC 批量打分。打分超过
+    ``RERANK_TIMEOUT_MS`` 或推理服务不可用时按原顺序（检索顺序）返回；
+    超时的打分在后台继续完成并写入缓存，同一查询下次可以直接命中。
+    """
+
+    def __init__(self, cache: RerankScoreCache):
+        self.cache = cache
+        self.calls = 0
+        self.timeouts = 0
+        self.failures = 0
+        self._unavailable_until = 0.0
+
+    async def _score(self, query: str, query_key: str, keys: List[str], texts: List[str]) -> Dict[str, float]:
+        scores, model_name = await grpc_client_manager.rerank(query, texts)
+        if len(scores) != len(texts):
+            # 分数与文本对不上时无法确定对应关系，不写入缓存
+            raise ValueError(f"重排返回 {len(scores)} 个分数，请求了 {len(texts)} 个文本")
+        pairs = list(zip(keys, scores))
+        self.cache.put_many(query_key, pairs, model_name)
+        return dict(pairs)
+
+    async def rerank(self, query: str, docs: List[Document], n_results: int) -> List[Document]:
+        if not docs or time.monotonic() < self._unavailable_until:
+            return docs[:n_results]
+        query_key = _digest(normalize_text(query))
+        keys = [chunk_key(doc) for doc in docs]
+        scores = self.cache.get_many(query_key, keys)
+        missing = list(dict.fromkeys(k for k in keys if k not in scores))
+        if missing:
+            texts = {key: doc.page_content for key, doc in zip(keys, docs)}
+            self.calls += 1
+            task = asyncio.ensure_future(
+                self._score(query, query_key, missing, [texts[k] for k in missing])
+            )
+            try:
+                scores.update(
+                    await asyncio.wait_for(
+                        asyncio.shield(task), timeout=settings.RERANK_TIMEOUT_MS / 1000
+                    )
+                )
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                # 让打分在后台完成并写入缓存，不在这里取消
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                logger.warning(f"重排超过 {settings.RERANK_TIMEOUT_MS}ms，按检索顺序返回")
+                return docs[:n_results]
+            except Exception as e:
+                self.failures += 1
+                if isinstance(e, grpc.aio.AioRpcError) and e.code() == grpc.StatusCode.UNAVAILABLE:
+                    self._unavailable_until = time.monotonic() + settings.RERANK_RETRY_SECONDS
+                logger.warning(f"重排失败，按检索顺序返回: {e}")
+                return docs[:n_results]
+
+        if any(key not in scores for key in keys):
+            # 缓存与本次打分合起来仍缺某些分块的分数，不能排序
+            self.failures += 1
+            logger.warning(f"重排分数不完整（{len(scores)}/{len(set(keys))}），按检索顺序返回")
+            return docs[:n_results]
+        ranked = sorted(range(len(docs)), key=lambda i: scores[keys[i]], reverse=True)
+        results = []
+        for i in ranked[:n_results]:
+            docs[i].metadata["rerank_score"] = scores[keys[i]]
+            results.append(docs[i])
+        return results
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+            "cache_entries": len(self.cache._entries),
+            "model_name": self.cache.model_name,
+        }
+
+
+reranker = Reranker(RerankScoreCache(settings.RERANK_CACHE_SIZE, settings.RERANK_CACHE_TTL))
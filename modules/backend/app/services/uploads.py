@@ -0,0 +1,311 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterable, Dict, List, Optional
+
+from fastapi import UploadFile
+
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class UploadError(ValueError):
+    pass
+
+
+class OffsetMismatch(UploadError):
+    """The chunk does not start where the stored upload ends."""
+
+    def __init__(self, received: int):
+        super().__init__(f"上传偏移不匹配，服务端已接收 {received} 字节")
+        self.received = received
+
+
+def safe_filename(filename: str) -> str:
+    name = Path(filename or "").name
+    if not name or name in (".", ".."):
+        raise UploadError("文件名无效")
+    return name
+
+
+def _write_block(f, digest, block: bytes) -> None:
+    f.write(block)
+    digest.update(block)
+
+
+def _finish(f) -> None:
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+
+
+async def save_stream(
+    blocks: AsyncIterable[bytes],
+    dest: Path,
+    expected_sha256: Optional[str] = None,
+) -> Dict:
+    """
+    把字节流写入目标目录下的临时文件并同时计算 SHA-256，写完后原子地改名为
+    ``dest``；失败或校验不通过时删除临时文件，目标文件保持不变。
+
+    文件写入与哈希在线程中完成，不阻塞事件循环，内存占用只有一个块。
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        f = await asyncio.to_thread(open, tmp, "wb")
+        try:
+            async for block in blocks:
+                await asyncio.to_thread(_write_block, f, digest, block)
+                size += len(block)
+        finally:
+            await asyncio.to_thread(_finish, f)
+        sha256 = digest.hexdigest()
+        if expected_sha256 and sha256 != expected_sha256.lower():
+            raise UploadError(f"SHA-256 校验失败: {sha256}")
+        os.replace(tmp, dest)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    logger.info(f"已保存上传文件 {dest} ({size} 字节, sha256={sha256[:12]})")
+    return {"path": str(dest), "size": size, "sha256": sha256}
+
+
+def _copy_file(src: Path, dst: Path) -> None:
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        shutil.copyfileobj(fsrc, fdst, settings.UPLOAD_CHUNK_BYTES)
+        fdst.flush()
+        os.fsync(fdst.fileno())
+
+
+async def _upload_blocks(file: UploadFile, block_size: int):
+    while block := await file.read(block_size):
+        yield block
+
+
+async def save_upload(
+    file: UploadFile, dest: Path, expected_sha256: Optional[str] = None
+) -> Dict:
+    """Stream a multipart ``UploadFile`` to ``dest``; see ``save_stream``."""
+    return await save_stream(
+        _upload_blocks(file, settings.UPLOAD_CHUNK_BYTES), dest, expected_sha256
+    )
+
+
+class ResumableUploads:
+    """
+    分片/可续传上传。
+
+    会话描述保存在 ``directory`` 下的 ``<id>.json``，数据写入目标目录中的
+    ``.<id>.part``，完成时在同一文件系统内改名，大文件无需再复制一遍。
+    分片必须从已接收的字节数处续写，断线后客户端查询已接收字节数再继续。
+    同一进程内按顺序到达的分片增量计算 SHA-256，进程重启后在完成时重新
+    计算。完成后校验大小与哈希，再原子改名到目标位置。
+
+    超过 ``UPLOAD_SESSION_TTL`` 秒没有新数据的会话视为已放弃，启动时及之后
+    每隔 ``UPLOAD_SWEEP_INTERVAL`` 秒清理一次，连同分片文件与内存中的状态。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._digests: Dict[str, tuple] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def _meta_path(self, upload_id: str) -> Path:
+        if not upload_id or Path(upload_id).name != upload_id:
+            raise UploadError("上传 ID 无效")
+        return self.directory / f"{upload_id}.json"
+
+    def create(
+        self,
+        filename: str,
+        size: int,
+        target: str,
+        part_dir: Path,
+        sha256: Optional[str] = None,
+    ) -> Dict:
+        upload_id = uuid.uuid4().hex
+        part_dir.mkdir(parents=True, exist_ok=True)
+        part = part_dir / f".{upload_id}.part"
+        meta = {
+            "id": upload_id,
+            "filename": safe_filename(filename),
+            "size": size,
+            "sha256": (sha256 or "").lower(),
+            "target": target,
+            "part": str(part),
+            "created_at": time.time(),
+        }
+        part.touch()
+        self._meta_path(upload_id).write_text(json.dumps(meta))
+        self._digests[upload_id] = (0, hashlib.sha256())
+        return {**meta, "received": 0}
+
+    def status(self, upload_id: str) -> Optional[Dict]:
+        meta_path = self._meta_path(upload_id)
+        if not meta_path.exists():
+            return None
+        meta = json.loads(meta_path.read_text())
+        part = Path(meta["part"])
+        return {**meta, "received": part.stat().st_size if part.exists() else 0}
+
+    async def append(self, upload_id: str, offset: int, blocks: AsyncIterable[bytes]) -> Dict:
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            meta = self.status(upload_id)
+            if meta is None:
+                raise KeyError(upload_id)
+            if offset != meta["received"]:
+                raise OffsetMismatch(meta["received"])
+            part = Path(meta["part"])
+            position, digest = self._digests.get(upload_id, (-1, None))
+            if position != offset:
+                digest = None  # 哈希状态丢失（如重启），完成时重算
+            received = offset
+            f = await asyncio.to_thread(open, part, "ab")
+            try:
+                async for block in blocks:
+                    if received + len(block) > meta["size"]:
+                        raise UploadError("上传数据超过声明的文件大小")
+                    if digest is not None:
+                        await asyncio.to_thread(_write_block, f, digest, block)
+                    else:
+                        await asyncio.to_thread(f.write, block)
+                    received += len(block)
+            finally:
+                await asyncio.to_thread(_finish, f)
+                if digest is not None:
+                    self._digests[upload_id] = (received, digest)
+                else:
+                    self._digests.pop(upload_id, None)
+            return {**meta, "received": received}
+
+    @staticmethod
+    def _hash_file(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while block := f.read(settings.UPLOAD_CHUNK_BYTES):
+                digest.update(block)
+        return digest.hexdigest()
+
+    async def complete(self, upload_id: str, dest: Path) -> Dict:
+        """Verify the finished upload and atomically move it to ``dest``."""
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            meta = self.status(upload_id)
+            if meta is None:
+                raise KeyError(upload_id)
+            if meta["received"] != meta["size"]:
+                raise UploadError(f"上传未完成: {meta['received']}/{meta['size']} 字节")
+            part, meta_path = Path(meta["part"]), self._meta_path(upload_id)
+            position, digest = self._digests.pop(upload_id, (-1, None))
+            if digest is not None and position == meta["size"]:
+                sha256 = digest.hexdigest()
+            else:
+                sha256 = await asyncio.to_thread(self._hash_file, part)
+            if meta["sha256"] and sha256 != meta["sha256"]:
+                raise UploadError(f"SHA-256 校验失败: {sha256}")
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            # 目标不在分片所在的文件系统时，先复制到目标目录再原子改名
+            try:
+                os.replace(part, dest)
+            except OSError:
+                tmp = dest.with_name(f".{dest.name}.{upload_id}.part")
+                await asyncio.to_thread(_copy_file, part, tmp)
+                os.replace(tmp, dest)
+                part.unlink(missing_ok=True)
+            meta_path.unlink(missing_ok=True)
+        self._locks.pop(upload_id, None)
+        logger.info(f"分片上传 {upload_id} 完成: {dest} ({meta['size']} 字节)")
+        return {"path": str(dest), "size": meta["size"], "sha256": sha256}
+
+    def abort(self, upload_id: str) -> bool:
+        meta = self.status(upload_id)
+        if meta is None:
+            return False
+        Path(meta["part"]).unlink(missing_ok=True)
+        self._meta_path(upload_id).unlink(missing_ok=True)
+        self._digests.pop(upload_id, None)
+        self._locks.pop(upload_id, None)
+        return True
+
+    @staticmethod
+    def _idle_seconds(meta: Dict, now: float) -> float:
+        """Seconds since the session was created or last received data."""
+        try:
+            last = max(meta["created_at"], Path(meta["part"]).stat().st_mtime)
+        except FileNotFoundError:
+            last = meta["created_at"]
+        return now - last
+
+    def _expired(self, ttl: float) -> List[str]:
+        now = time.time()
+        expired = []
+        for meta_path in self.directory.glob("*.json"):
+            try:
+                meta = json.loads(meta_path.read_text())
+            except (OSError, ValueError):
+                continue
+            if self._idle_seconds(meta, now) >= ttl:
+                expired.append(meta_path.stem)
+        return expired
+
+    async def sweep(self, ttl: float) -> int:
+        """删除超过 ``ttl`` 秒没有新数据的会话及其分片文件，返回删除的会话数"""
+        removed = 0
+        for upload_id in await asyncio.to_thread(self._expired, ttl):
+            lock = self._locks.setdefault(upload_id, asyncio.Lock())
+            if lock.locked():
+                continue  # 正在写入或完成
+            async with lock:
+                meta = self.status(upload_id)
+                if meta is None or self._idle_seconds(meta, time.time()) < ttl:
+                    continue
+                Path(meta["part"]).unlink(missing_ok=True)
+                self._meta_path(upload_id).unlink(missing_ok=True)
+                self._digests.pop(upload_id, None)
+            self._locks.pop(upload_id, None)
+            removed += 1
+            logger.info(f"已清理过期的分片上传 {upload_id}（{meta['filename']}，已接收 {meta['received']} 字节）")
+        # 会话文件已不存在（如请求了不存在的 ID）的内存状态一并丢弃
+        for upload_id in list(self._locks.keys() | self._digests.keys()):
+            lock = self._locks.get(upload_id)
+            if (lock is None or not lock.locked()) and not self._meta_path(upload_id).exists():
+                self._locks.pop(upload_id, None)
+                self._digests.pop(upload_id, None)
+        return removed
+
+    async def _sweep_forever(self, ttl: float, interval: float) -> None:
+        while True:
+            try:
+                await self.sweep(ttl)
+            except Exception:
+                logger.exception("清理过期的分片上传失败")
+            await asyncio.sleep(interval)
+
+    def start(self) -> None:
+        """Start the periodic sweep of abandoned sessions (the first sweep runs immediately)."""
+        if self._sweeper is None and settings.UPLOAD_SESSION_TTL > 0:
+            self._sweeper = asyncio.create_task(
+                self._sweep_forever(settings.UPLOAD_SESSION_TTL, settings.UPLOAD_SWEEP_INTERVAL)
+            )
+
+    async def stop(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+
+
+resumable_uploads = ResumableUploads(settings.UPLOAD_TMP_DIR)
@@ -0,0 +1,20 @@
+import os
+import sys
+import tempfile
+
+# 设置在导入应用模块之前生效：所有数据文件写到临时目录，向量索引用进程内 IVF
+_DATA_DIR = tempfile.mkdtemp(prefix="kb-tests-")
+os.environ.update(
+    VECTOR_INDEX_BACKEND="ivf",
+    VECTOR_INDEX_DIR=os.path.join(_DATA_DIR, "vector_index"),
+    LEXICAL_INDEX_PATH=os.path.join(_DATA_DIR, "lexical_index.sqlite3"),
+    INGEST_DB_PATH=os.path.join(_DATA_DIR, "ingest_jobs.sqlite3"),
+    KNOWLEDGE_BASE_DOCS=os.path.join(_DATA_DIR, "docs"),
+    KB_UPLOAD_DIR=os.path.join(_DATA_DIR, "knowledge"),
+    UPLOAD_TMP_DIR=os.path.join(_DATA_DIR, "uploads"),
+    EXTRACT_CACHE_DIR=os.path.join(_DATA_DIR, "extract_cache"),
+)
+# 与容器内一致，在应用目录下导入（不读取部署用的 modules/backend/.env）
+_APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+os.chdir(_APP_DIR)
+sys.path.insert(0, _APP_DIR)
@@ -0,0 +1,63 @@
+import asyncio
+import hashlib
+
+import numpy as np
+
+from api.endpoints.kb_admin import delete_document, submit_document
+from core.db_client import vector_db
+from services.chunking import chunk_text
+from services.embedding import embedding_model
+from services.ingestion import DELETED, ingestion_queue
+from services.knowledge_service import knowledge_service
+
+
+def _submit(tmp_path, doc_id: str, content: bytes) -> dict:
+    path = tmp_path / f"{doc_id}.txt"
+    path.write_bytes(content)
+    saved = {"path": str(path), "sha256": hashlib.sha256(content).hexdigest()}
+    return asyncio.run(submit_document(doc_id, "a.txt", saved))
+
+
+def _fake_chunks(monkeypatch, text: str):
+    async def iter_chunks(file_path, file_name, metadata, sha256=None, timings=None):
+        yield 1, text, chunk_text(text, file_name, metadata)
+
+    monkeypatch.setattr(ingestion_queue, "iter_chunks", iter_chunks)
+
+
+def test_delete_while_ingesting_cancels_job(tmp_path, monkeypatch):
+    ingestion_queue._queue = asyncio.Queue()
+    job = _submit(tmp_path, "doc-running", b"running contents")
+    text = "\n\n".join(f"段落 {i} " + "内容" * 400 for i in range(3))
+    _fake_chunks(monkeypatch, text)
+    # 每个分块单独写库，取消时已有部分分块写入
+    monkeypatch.setattr(vector_db, "batch_size", 1)
+
+    async def embed_stream(texts, group_size=64):
+        offset = 0
+        async for text in texts:
+            if offset == 1:
+                # 第一组写入之后、第二组之前删除文档
+                assert (await delete_document("doc-running"))["success"]
+            yield offset, np.ones((1, 8), dtype=np.float32)
+            offset += 1
+
+    monkeypatch.setattr(embedding_model, "embed_stream", embed_stream)
+
+    asyncio.run(ingestion_queue._process(job["job_id"]))
+
+    assert ingestion_queue.store.get(job["job_id"])["status"] == DELETED
+    assert "doc-running" not in vector_db.list_sources()
+    assert not knowledge_service.remove_text("doc-running")
+
+
+def test_delete_queued_job_skips_it(tmp_path, monkeypatch):
+    ingestion_queue._queue = asyncio.Queue()
+    job = _submit(tmp_path, "doc-queued", b"queued contents")
+    _fake_chunks(monkeypatch, "queued contents")
+
+    assert asyncio.run(delete_document("doc-queued"))["success"]
+    asyncio.run(ingestion_queue._process(job["job_id"]))
+
+    assert ingestion_queue.store.get(job["job_id"])["status"] == DELETED
+    assert not knowledge_service.remove_text("doc-queued")
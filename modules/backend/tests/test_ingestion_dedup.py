@@ -0,0 +1,37 @@
+import asyncio
+import hashlib
+
+from api.endpoints.kb_admin import delete_document, submit_document
+from services.ingestion import DELETED, SUCCEEDED, ingestion_queue
+from services.knowledge_service import knowledge_service
+
+
+def _saved(path, content: bytes) -> dict:
+    path.write_bytes(content)
+    return {"path": str(path), "sha256": hashlib.sha256(content).hexdigest()}
+
+
+def test_reupload_after_delete_is_not_duplicate(tmp_path):
+    async def flow():
+        # 不启动后台任务协程，只登记任务
+        ingestion_queue._queue = asyncio.Queue()
+        content = b"same contents"
+
+        first = await submit_document("doc-1", "a.txt", _saved(tmp_path / "1_a.txt", content))
+        assert not first["duplicate"]
+        # 模拟入库完成
+        ingestion_queue.store.update(first["job_id"], status=SUCCEEDED)
+        knowledge_service.save_text("doc-1", "same contents")
+
+        dup = await submit_document("doc-2", "a.txt", _saved(tmp_path / "2_a.txt", content))
+        assert dup["duplicate"] and dup["id"] == "doc-1"
+        assert not (tmp_path / "2_a.txt").exists()
+
+        await delete_document("doc-1")
+        assert ingestion_queue.store.get(first["job_id"])["status"] == DELETED
+
+        again = await submit_document("doc-3", "a.txt", _saved(tmp_path / "3_a.txt", content))
+        assert not again["duplicate"] and again["id"] == "doc-3"
+        assert (tmp_path / "3_a.txt").exists()
+
+    asyncio.run(flow())
@@ -0,0 +1,47 @@
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+
+from services.uploads import ResumableUploads
+
+
+async def _blocks(*blocks):
+    for block in blocks:
+        yield block
+
+
+def _age(uploads: ResumableUploads, upload_id: str, seconds: float) -> None:
+    """Pretend the session was created and last written ``seconds`` ago."""
+    meta_path = uploads.directory / f"{upload_id}.json"
+    meta = json.loads(meta_path.read_text())
+    meta["created_at"] -= seconds
+    meta_path.write_text(json.dumps(meta))
+    past = time.time() - seconds
+    os.utime(meta["part"], (past, past))
+
+
+def test_sweep_removes_abandoned_sessions(tmp_path):
+    async def flow():
+        uploads = ResumableUploads(str(tmp_path / "sessions"))
+        parts = tmp_path / "models"
+        stale = uploads.create("old.gguf", 10, "model", parts)
+        fresh = uploads.create("new.gguf", 10, "model", parts)
+        await uploads.append(stale["id"], 0, _blocks(b"abc"))
+        await uploads.append(fresh["id"], 0, _blocks(b"abc"))
+        # 请求不存在的会话也会留下内存中的锁
+        try:
+            await uploads.append("missing", 0, _blocks(b"x"))
+        except KeyError:
+            pass
+        _age(uploads, stale["id"], 7200)
+
+        assert await uploads.sweep(3600) == 1
+        assert uploads.status(stale["id"]) is None
+        assert not Path(stale["part"]).exists()
+        assert stale["id"] not in uploads._locks and stale["id"] not in uploads._digests
+        assert "missing" not in uploads._locks
+        assert uploads.status(fresh["id"])["received"] == 3
+
+    asyncio.run(flow())
@@ -1,5 +1,64 @@
+import json
 import os
 
 MAX_TOKENS = int(os.getenv("MAX_TOKENS", "4096"))
 EARLY_STOP_TOKENS = [t for t in os.getenv("EARLY_STOP_TOKENS", "").split(",") if t]
 USE_KV_CACHE = os.getenv("USE_KV_CACHE", "1").lower() not in ("0", "false", "no")
+# 会话级 KV 状态缓存的内存预算（字节）与最多保留的会话数
+KV_CACHE_BYTES = int(os.getenv("KV_CACHE_BYTES", str(2 * 1024**3)))
+KV_CACHE_MAX_SESSIONS = int(os.getenv("KV_CACHE_MAX_SESSIONS", "256"))
+
+# 调度器：同时解码的序列数（每个序列独占一个 llama.cpp 上下文）与等待队列深度；
+# 0 表示自动：CPU 上为 4，GPU 上为 1（卸载到 GPU 时每个上下文在显存中各有一份权重）
+MAX_CONCURRENT_SEQUENCES = int(os.getenv("MAX_CONCURRENT_SEQUENCES", "0"))
+DEFAULT_CPU_SEQUENCES = 4
+MAX_QUEUE_DEPTH = int(os.getenv("MAX_QUEUE_DEPTH", "32"))
+
+# 历史压缩：摘要最大长度，以及是否在回答结束后于后台预先计算下一轮的摘要
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "256"))
+HISTORY_PRECOMPUTE = os.getenv("HISTORY_PRECOMPUTE", "1").lower() not in ("0", "false", "no")
+
+# 语义回答缓存：相似度阈值、有效期（秒）与最大条目数
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "1").lower() not in ("0", "false", "no")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "4096"))
+
+# 缓存命中时按块重放回答，每块的最大字符数
+CACHE_REPLAY_CHUNK_CHARS = int(os.getenv("CACHE_REPLAY_CHUNK_CHARS", "32"))
+
+# 模型池：常驻生成模型的内存预算（字节，0 表示不限）与最大常驻模型数
+MODEL_POOL_BYTES = int(os.getenv("MODEL_POOL_BYTES", "0"))
+MODEL_POOL_MAX_MODELS = int(os.getenv("MODEL_POOL_MAX_MODELS", "1"))
+# 切换默认模型后，等待旧模型上的请求结束的最长时间（秒）
+MODEL_DRAIN_TIMEOUT = float(os.getenv("MODEL_DRAIN_TIMEOUT", "600"))
+
+# 模型加载策略：是否 mmap 权重（缺页时按需读入）、是否 mlock 锁定在内存中、
+# 加载后是否做一次预热推理；MODEL_LOAD_POLICY 可按模型文件名覆盖，例如
+# {"qwen2-7b.gguf": {"use_mlock": true}}
+MODEL_USE_MMAP = os.getenv("MODEL_USE_MMAP", "1").lower() not in ("0", "false", "no")
+MODEL_USE_MLOCK = os.getenv("MODEL_USE_MLOCK", "0").lower() not in ("0", "false", "no")
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1").lower() not in ("0", "false", "no")
+MODEL_LOAD_POLICY = json.loads(os.getenv("MODEL_LOAD_POLICY", "{}"))
+
+# 聊天模板渲染：缓存的对话前缀（渲染文本 + token）条目数
+PROMPT_PREFIX_CACHE_ENTRIES = int(os.getenv("PROMPT_PREFIX_CACHE_ENTRIES", "1024"))
+
+# 嵌入请求微批处理：单批最多文本数与等待凑批的时间窗（毫秒）
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "64"))
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+# 流式嵌入：每个流最多同时处理的文本组数，超出后暂停读取客户端数据
+EMBED_STREAM_WINDOW = int(os.getenv("EMBED_STREAM_WINDOW", "8"))
+
+# 持久化向量缓存：按 (嵌入模型, 规范化文本哈希) 保存，切换嵌入模型时清除旧模型条目
+EMBED_CACHE = os.getenv("EMBED_CACHE", "1").lower() not in ("0", "false", "no")
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "/app/.cache/embeddings")
+EMBED_CACHE_BYTES = int(os.getenv("EMBED_CACHE_BYTES", str(1024**3)))
+
+# 交叉编码器重排：模型（本地目录或 HuggingFace 名称，留空时使用 /models/rerank-model/
+# 下的第一个子目录，再回退到 BAAI/bge-reranker-base）、是否加载、单批最多文本对数、
+# 每个文本对的最大 token 数
+RERANK_MODEL = os.getenv("RERANK_MODEL", "")
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "1").lower() not in ("0", "false", "no")
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "512"))
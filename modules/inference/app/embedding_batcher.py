@@ -0,0 +1,138 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _length(item):
+    return len(item) if isinstance(item, str) else sum(len(part) for part in item)
+
+
+class _Request:
+    __slots__ = ("texts", "future")
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.future = Future()
+
+
+class EmbeddingBatcher:
+    """
+    嵌入请求的动态微批处理。
+
+    各线程提交的文本先进入队列，后台线程在 ``window_ms`` 时间窗内或凑满
+    ``max_batch_size`` 条文本后，把它们按长度排序（减少 padding）合并成一次
+    ``encode`` 调用，再把结果按原顺序分发回各个请求。
+
+    条目也可以是 (查询, 文本) 对，用于交叉编码器打分；``name`` 区分统计项
+    的前缀与后台线程名。
+    """
+
+    def __init__(self, encode, max_batch_size=64, window_ms=5, name="embedding"):
+        self._encode = encode
+        self.name = name
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = max(0, window_ms) / 1000.0
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+        self.requests = 0
+        self.max_batch = 0
+        self.last_batch_size = 0
+        self.total_latency = 0.0
+        self.last_latency = 0.0
+        threading.Thread(target=self._loop, name=f"{name}-batcher", daemon=True).start()
+
+    def submit(self, texts):
+        """Queue ``texts`` and return a Future for their vectors."""
+        request = _Request(list(texts))
+        if not request.texts:
+            request.future.set_result([])
+            return request.future
+        with self._cond:
+            self._pending.append(request)
+            self._cond.notify()
+        return request.future
+
+    def encode(self, texts):
+        """Block until ``texts`` are embedded as part of some batch."""
+        return self.submit(texts).result()
+
+    def _collect(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            batch = [self._pending.popleft()]
+            count = len(batch[0].texts)
+            deadline = time.monotonic() + self.window
+            while count < self.max_batch_size:
+                if not self._pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                    continue
+                request = self._pending.popleft()
+                batch.append(request)
+                count += len(request.texts)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._run(batch)
+            except Exception as e:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+    def _run(self, batch):
+        texts = [text for request in batch for text in request.texts]
+        # 按长度排序后编码，再还原顺序
+        order = sorted(range(len(texts)), key=lambda i: _length(texts[i]))
+        start = time.perf_counter()
+        encoded = self._encode([texts[i] for i in order])
+        latency = time.perf_counter() - start
+        vectors = np.empty_like(encoded)
+        vectors[order] = encoded
+
+        offset = 0
+        for request in batch:
+            n = len(request.texts)
+            request.future.set_result(vectors[offset : offset + n])
+            offset += n
+
+        with self._stats_lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.texts += len(texts)
+            self.last_batch_size = len(texts)
+            self.max_batch = max(self.max_batch, len(texts))
+            self.last_latency = latency
+            self.total_latency += latency
+        if len(batch) > 1:
+            logger.debug(
+                f"合并 {len(batch)} 个 {self.name} 请求为一批 ({len(texts)} 条, {latency * 1000:.1f}ms)"
+            )
+
+    def stats(self):
+        with self._stats_lock:
+            batches = self.batches or 1
+            return {
+                f"{self.name}_batches": self.batches,
+                f"{self.name}_requests": self.requests,
+                f"{self.name}_texts": self.texts,
+                f"{self.name}_avg_batch_size": self.texts / batches,
+                f"{self.name}_max_batch_size": self.max_batch,
+                f"{self.name}_last_batch_size": self.last_batch_size,
+                f"{self.name}_avg_batch_ms": self.total_latency * 1000 / batches,
+                f"{self.name}_last_batch_ms": self.last_latency * 1000,
+            }
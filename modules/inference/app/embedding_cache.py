@@ -0,0 +1,65 @@
+import hashlib
+import logging
+import unicodedata
+
+import numpy as np
+from diskcache import Cache
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text):
+    """NFKC + collapsed whitespace, so trivially different copies share a key."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class EmbeddingCache:
+    """
+    持久化的向量缓存，键为 (嵌入模型名, 规范化文本的哈希)。
+
+    条目以模型名作为 diskcache 的 tag，切换嵌入模型时按 tag 清除旧模型
+    的全部条目。
+    """
+
+    def __init__(self, directory, size_limit):
+        self._cache = Cache(
+            directory,
+            size_limit=size_limit,
+            eviction_policy="least-recently-used",
+            tag_index=True,
+        )
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(model_name, text):
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{model_name}:{digest}"
+
+    def get_many(self, model_name, texts):
+        """Return a list with a float32 vector or None for every text."""
+        found = []
+        for text in texts:
+            raw = self._cache.get(self._key(model_name, text))
+            found.append(None if raw is None else np.frombuffer(raw, dtype=np.float32))
+        hits = sum(v is not None for v in found)
+        self.hits += hits
+        self.misses += len(texts) - hits
+        return found
+
+    def put_many(self, model_name, texts, vectors):
+        for text, vector in zip(texts, vectors):
+            self._cache.set(
+                self._key(model_name, text),
+                np.asarray(vector, dtype=np.float32).tobytes(),
+                tag=model_name,
+            )
+
+    def drop_model(self, model_name):
+        removed = self._cache.evict(model_name)
+        if removed:
+            logger.info(f"嵌入缓存清除模型 {model_name} 的 {removed} 条向量")
+        return removed
+
+    def __len__(self):
+        return len(self._cache)
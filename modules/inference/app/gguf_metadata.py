@@ -0,0 +1,217 @@
+import logging
+import os
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+GGUF_MAGIC = b"GGUF"
+
+# GGUF 元数据值类型 -> struct 格式
+_SCALAR_FORMATS = {
+    0: "<B",  # UINT8
+    1: "<b",  # INT8
+    2: "<H",  # UINT16
+    3: "<h",  # INT16
+    4: "<I",  # UINT32
+    5: "<i",  # INT32
+    6: "<f",  # FLOAT32
+    7: "<?",  # BOOL
+    10: "<Q",  # UINT64
+    11: "<q",  # INT64
+    12: "<d",  # FLOAT64
+}
+_STRING = 8
+_ARRAY = 9
+
+# 默认不保留任何数组；分词表只在解析时记下各字符串的偏移，
+# 读出特殊 token（bos/eos 等）的文本后即丢弃
+DEFAULT_KEEP_ARRAYS = ()
+TOKENS_KEY = "tokenizer.ggml.tokens"
+# 解析时派生的键：{特殊 token id: 文本}
+SPECIAL_TOKEN_TEXTS_KEY = "tokenizer.ggml.special_token_texts"
+_SKIP_BLOCK = 1024 * 1024
+
+
+class GGUFFormatError(ValueError):
+    pass
+
+
+class _Reader:
+    def __init__(self, f):
+        self.f = f
+
+    def read(self, n):
+        data = self.f.read(n)
+        if len(data) != n:
+            raise GGUFFormatError("unexpected end of file in GGUF header")
+        return data
+
+    def unpack(self, fmt):
+        return struct.unpack(fmt, self.read(struct.calcsize(fmt)))[0]
+
+    def string(self):
+        return self.read(self.unpack("<Q")).decode("utf-8", errors="replace")
+
+    def skip_strings(self, count, offsets=None):
+        """
+        Skip ``count`` length-prefixed strings, reading the file in large blocks
+        instead of one seek per string. The file offset of each string is
+        appended to ``offsets`` when given.
+        """
+        base = self.f.tell()
+        buf, pos = self.f.read(_SKIP_BLOCK), 0
+        for _ in range(count):
+            if pos + 8 > len(buf):
+                base += pos
+                self.f.seek(base)
+                buf, pos = self.f.read(_SKIP_BLOCK), 0
+                if len(buf) < 8:
+                    raise GGUFFormatError("unexpected end of file in GGUF header")
+            if offsets is not None:
+                offsets.append(base + pos)
+            pos += 8 + struct.unpack_from("<Q", buf, pos)[0]
+        self.f.seek(base + pos)
+
+    def string_offsets(self):
+        """Skip a string array, returning the file offset of each element."""
+        etype = self.unpack("<I")
+        count = self.unpack("<Q")
+        if etype != _STRING:
+            raise GGUFFormatError(f"{TOKENS_KEY} is not a string array")
+        offsets = array("Q")
+        self.skip_strings(count, offsets)
+        return offsets
+
+    def value(self, vtype, keep=True):
+        if vtype in _SCALAR_FORMATS:
+            return self.unpack(_SCALAR_FORMATS[vtype])
+        if vtype == _STRING:
+            return self.string()
+        if vtype == _ARRAY:
+            etype = self.unpack("<I")
+            count = self.unpack("<Q")
+            if keep:
+                return [self.value(etype) for _ in range(count)]
+            # 跳过不需要的数组：定长元素直接 seek，字符串逐个跳过长度
+            if etype in _SCALAR_FORMATS:
+                self.f.seek(count * struct.calcsize(_SCALAR_FORMATS[etype]), os.SEEK_CUR)
+            elif etype == _STRING:
+                self.skip_strings(count)
+            else:
+                for _ in range(count):
+                    self.value(etype, keep=False)
+            return None
+        raise GGUFFormatError(f"unknown GGUF value type {vtype}")
+
+
+def read_gguf_metadata(path, keep_arrays=DEFAULT_KEEP_ARRAYS):
+    """
+    只解析 GGUF 文件头中的键值元数据，不加载权重。
+
+    数组类型的值只保留 ``keep_arrays`` 中列出的键，其余跳过（值为 None）。
+    分词表不整体解码：``tokenizer.ggml.*_token_id`` 指向的特殊 token 按偏移
+    单独读出，保存在 ``SPECIAL_TOKEN_TEXTS_KEY`` 下。
+    """
+    with open(path, "rb") as f:
+        r = _Reader(f)
+        if r.read(4) != GGUF_MAGIC:
+            raise GGUFFormatError(f"{path} is not a GGUF file")
+        version = r.unpack("<I")
+        # v1 的计数是 32 位，v2 起改为 64 位
+        count_fmt = "<I" if version == 1 else "<Q"
+        r.unpack(count_fmt)  # tensor count
+        kv_count = r.unpack(count_fmt)
+        metadata = {"general.gguf_version": version}
+        token_offsets = None
+        for _ in range(kv_count):
+            key = r.string()
+            vtype = r.unpack("<I")
+            if key == TOKENS_KEY and vtype == _ARRAY and key not in keep_arrays:
+                token_offsets = r.string_offsets()
+                continue
+            value = r.value(vtype, keep=vtype != _ARRAY or key in keep_arrays)
+            if value is not None:
+                metadata[key] = value
+        if token_offsets is not None:
+            texts = {}
+            for key, token_id in metadata.items():
+                if (
+                    key.startswith("tokenizer.ggml.")
+                    and key.endswith("_token_id")
+                    and isinstance(token_id, int)
+                    and 0 <= token_id < len(token_offsets)
+                ):
+                    f.seek(token_offsets[token_id])
+                    texts[token_id] = r.string()
+            metadata[SPECIAL_TOKEN_TEXTS_KEY] = texts
+        return metadata
+
+
+def _file_key(path):
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+class MetadataCache:
+    """
+    按 (路径, 大小, mtime) 缓存 GGUF 元数据及由其派生的对象（聊天模板处理器等），
+    文件被替换后自动失效。
+    """
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, kind="metadata", factory=None):
+        key = (_file_key(path), kind)
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return self._data[key]
+        if factory is None:
+            value = read_gguf_metadata(path)
+        else:
+            value = factory(self.get(path))
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+
+metadata_cache = MetadataCache()
+
+
+def token_text(metadata, key):
+    """Return the text of a special token such as ``tokenizer.ggml.eos_token_id``."""
+    token_id = metadata.get(key)
+    if token_id is None:
+        return ""
+    texts = metadata.get(SPECIAL_TOKEN_TEXTS_KEY) or {}
+    if token_id in texts:
+        return texts[token_id]
+    # 调用方通过 keep_arrays 保留了整个分词表
+    tokens = metadata.get(TOKENS_KEY) or []
+    return tokens[token_id] if 0 <= token_id < len(tokens) else ""
+
+
+def estimate_kv_bytes(metadata, n_ctx):
+    """
+    根据模型元数据估算一个上下文的 KV cache 大小（f16）。
+    元数据缺失时返回 0。
+    """
+    try:
+        arch = metadata.get("general.architecture", "")
+        n_layer = int(metadata.get(f"{arch}.block_count", 0))
+        n_embd = int(metadata.get(f"{arch}.embedding_length", 0))
+        n_head = int(metadata.get(f"{arch}.attention.head_count", 0)) or 1
+        n_head_kv = int(metadata.get(f"{arch}.attention.head_count_kv", n_head))
+        n_embd_kv = n_embd * n_head_kv // n_head
+        return 2 * 2 * n_layer * n_embd_kv * n_ctx
+    except Exception:
+        return 0
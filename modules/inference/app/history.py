@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 每条消息在聊天模板中额外占用的 token（角色标记、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 8
+
+
+class _LRU:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class HistoryCompressor:
+    """
+    基于 token 的对话历史压缩。
+
+    - 用模型自身的分词器计算长度（结果按文本哈希缓存）；
+    - 开头的 system 消息（RAG 上下文）原样保留，只对中间的旧对话做摘要；
+    - 摘要按「会话 + 旧消息前缀」的链式哈希缓存，新一轮只需把新移出窗口
+      的消息合并进已有摘要；
+    - ``precompute`` 可以在回答结束后于后台提前算好下一轮需要的摘要。
+    """
+
+    def __init__(self, summary_max_tokens=256, max_summaries=1024, max_token_counts=8192):
+        self.summary_max_tokens = summary_max_tokens
+        self._summaries = _LRU(max_summaries)
+        self._token_counts = _LRU(max_token_counts)
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+
+    def count_tokens(self, llm, model_key, text):
+        key = (model_key, hashlib.sha1(text.encode("utf-8")).hexdigest())
+        count = self._token_counts.get(key)
+        if count is None:
+            count = len(llm.tokenize(text.encode("utf-8"), add_bos=False, special=True))
+            self._token_counts.put(key, count)
+        return count
+
+    def _message_tokens(self, llm, model_key, messages):
+        return [
+            self.count_tokens(llm, model_key, m["content"]) + MESSAGE_OVERHEAD_TOKENS
+            for m in messages
+        ]
+
+    @staticmethod
+    def _prefix_hashes(session_id, messages):
+        """h[i] identifies messages[:i] within the session."""
+        h = hashlib.sha256((session_id or "").encode("utf-8"))
+        hashes = [h.hexdigest()]
+        for m in messages:
+            h.update(f"\x00{m['role']}\x01{m['content']}".encode("utf-8"))
+            hashes.append(h.copy().hexdigest())
+        return hashes
+
+    def _split(self, lead_tokens, rest_tokens, budget):
+        """Return the index into ``rest`` where kept (recent) messages start."""
+        available = budget - lead_tokens - self.summary_max_tokens - MESSAGE_OVERHEAD_TOKENS
+        used = 0
+        split = len(rest_tokens)
+        while split > 0 and used + rest_tokens[split - 1] <= available:
+            used += rest_tokens[split - 1]
+            split -= 1
+        # 至少保留最后一条（当前问题）
+        return min(split, len(rest_tokens) - 1)
+
+    @staticmethod
+    def _align_to_user(rest, split):
+        # 保留部分从 user 消息开始，避免部分聊天模板因角色顺序报错
+        while split < len(rest) - 1 and rest[split]["role"] != "user":
+            split += 1
+        return split
+
+    def _plan(self, llm, model_key, messages, budget):
+        lead_len = 0
+        while lead_len < len(messages) and messages[lead_len]["role"] == "system":
+            lead_len += 1
+        lead, rest = messages[:lead_len], messages[lead_len:]
+        lead_tokens = sum(self._message_tokens(llm, model_key, lead))
+        rest_tokens = self._message_tokens(llm, model_key, rest)
+        if lead_tokens + sum(rest_tokens) <= budget or len(rest) < 2:
+            return lead, rest, 0
+        split = self._split(lead_tokens, rest_tokens, budget)
+        return lead, rest, self._align_to_user(rest, split)
+
+    def _summary_for(self, session_id, aged, summarize):
+        hashes = self._prefix_hashes(session_id, aged)
+        done, summary = 0, None
+        for i in range(len(aged), 0, -1):
+            cached = self._summaries.get(hashes[i])
+            if cached is not None:
+                done, summary = i, cached
+                break
+        if done < len(aged):
+            logger.info(
+                f"合并 {len(aged) - done} 条旧消息到摘要 (已缓存 {done} 条)"
+            )
+            summary = summarize(summary, aged[done:])
+            self._summaries.put(hashes[len(aged)], summary)
+        return summary
+
+    def compress(self, llm, model_key, messages, budget, summarize, session_id=None):
+        lead, rest, split = self._plan(llm, model_key, messages, budget)
+        if split <= 0:
+            return messages
+
+        logger.info("Context length exceeded, compressing history...")
+        summary = self._summary_for(session_id, rest[:split], summarize)
+        new_history = list(lead)
+        new_history.append({"role": "system", "content": f"先前对话摘要: {summary}"})
+        new_history.extend(rest[split:])
+        logger.info(f"History compressed. New length: {len(new_history)} messages.")
+        return new_history
+
+    def precompute(self, llm, model_key, messages, budget, summarize, session_id=None):
+        """
+        在后台线程中为下一轮对话预先计算摘要，立即返回 Future。
+
+        假设下一轮的用户提问与本轮长度相近，按同样的窗口划分提前把将要
+        移出窗口的消息合并进摘要缓存。分词、划分窗口与摘要都在后台完成，
+        调用方（回答流）不等待。
+        """
+        return self._executor.submit(
+            self._precompute, llm, model_key, messages, budget, summarize, session_id
+        )
+
+    def _precompute(self, llm, model_key, messages, budget, summarize, session_id):
+        last_user = next((m for m in reversed(messages) if m["role"] == "user"), None)
+        if last_user is None:
+            return
+        upcoming = list(messages) + [dict(last_user)]
+        try:
+            lead, rest, split = self._plan(llm, model_key, upcoming, budget)
+            if split <= 0:
+                return
+            aged = rest[:split]
+            key = self._prefix_hashes(session_id, aged)[-1]
+            with self._pending_lock:
+                if key in self._pending or self._summaries.get(key) is not None:
+                    return
+                self._pending.add(key)
+            try:
+                self._summary_for(session_id, aged, summarize)
+            finally:
+                with self._pending_lock:
+                    self._pending.discard(key)
+        except Exception as e:
+            logger.warning(f"后台摘要失败: {e}")
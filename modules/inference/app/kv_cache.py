@@ -0,0 +1,140 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from llama_cpp import Llama
+from llama_cpp.llama_cache import BaseLlamaCache
+
+logger = logging.getLogger(__name__)
+
+
+def _state_nbytes(state):
+    """Approximate host memory held by a ``LlamaState``."""
+    size = int(getattr(state, "llama_state_size", 0) or 0)
+    for name in ("scores", "input_ids"):
+        arr = getattr(state, name, None)
+        size += int(getattr(arr, "nbytes", 0) or 0)
+    return size
+
+
+class _Entry:
+    __slots__ = ("model_key", "tokens", "state", "nbytes")
+
+    def __init__(self, model_key, tokens, state):
+        self.model_key = model_key
+        self.tokens = list(tokens)
+        self.state = state
+        self.nbytes = _state_nbytes(state)
+
+
+class SessionKVCache:
+    """
+    按 session_id 保存 llama.cpp 的 KV 状态。
+
+    每个会话只保留最近一次生成结束后的状态（提示词 + 回答），下一轮对话
+    在 token 前缀匹配的前提下直接恢复该状态，只需计算新增的 token。
+    超出内存预算或会话数上限时按 LRU 淘汰。
+    """
+
+    def __init__(self, capacity_bytes, max_sessions=256):
+        self.capacity_bytes = capacity_bytes
+        self.max_sessions = max_sessions
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def size_bytes(self):
+        return self._size
+
+    def get(self, session_id, model_key):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry.model_key != model_key:
+                return None
+            self._entries.move_to_end(session_id)
+            return entry
+
+    def put(self, session_id, model_key, tokens, state):
+        entry = _Entry(model_key, tokens, state)
+        if entry.nbytes > self.capacity_bytes:
+            logger.info(f"会话 {session_id} 的 KV 状态过大 ({entry.nbytes} 字节)，不缓存")
+            self.drop(session_id)
+            return
+        with self._lock:
+            old = self._entries.pop(session_id, None)
+            if old is not None:
+                self._size -= old.nbytes
+            self._entries[session_id] = entry
+            self._size += entry.nbytes
+            while self._entries and (
+                self._size > self.capacity_bytes
+                or len(self._entries) > self.max_sessions
+            ):
+                evicted_id, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.nbytes
+                logger.info(f"KV 缓存淘汰会话 {evicted_id}")
+
+    def drop(self, session_id):
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is not None:
+                self._size -= entry.nbytes
+
+    def drop_model(self, model_key):
+        with self._lock:
+            for session_id in [
+                sid for sid, e in self._entries.items() if e.model_key == model_key
+            ]:
+                self._size -= self._entries.pop(session_id).nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def view(self, session_id, model_key):
+        """Return a llama-cpp cache object bound to one session."""
+        return _SessionCacheView(self, session_id, model_key)
+
+
+class _SessionCacheView(BaseLlamaCache):
+    """
+    供 ``Llama.set_cache`` 使用的单会话视图。
+
+    llama-cpp 在生成前按提示词 token 查询缓存，只有缓存状态与提示词的
+    公共前缀比当前上下文中已计算的前缀更长时才会加载；生成结束后写回
+    提示词 + 回答对应的状态。
+    """
+
+    def __init__(self, store, session_id, model_key):
+        super().__init__(capacity_bytes=store.capacity_bytes)
+        self.store = store
+        self.session_id = session_id
+        self.model_key = model_key
+
+    @property
+    def cache_size(self):
+        return self.store.size_bytes
+
+    def _find_longest_prefix_key(self, key):
+        entry = self.store.get(self.session_id, self.model_key)
+        if entry is None or Llama.longest_token_prefix(entry.tokens, key) == 0:
+            return None
+        return tuple(entry.tokens)
+
+    def __getitem__(self, key):
+        entry = self.store.get(self.session_id, self.model_key)
+        if entry is None or Llama.longest_token_prefix(entry.tokens, key) == 0:
+            self.store.misses += 1
+            raise KeyError(self.session_id)
+        self.store.hits += 1
+        return entry.state
+
+    def __contains__(self, key):
+        return self._find_longest_prefix_key(key) is not None
+
+    def __setitem__(self, key, value):
+        self.store.put(self.session_id, self.model_key, key, value)
@@ -5,17 +5,67 @@ import logging
 import threading
 import time
 import json
+import queue
+from concurrent.futures import Future
 from enum import Enum
 
+import numpy as np
+
 import protos.inference_pb2 as inference_pb2
 import protos.inference_pb2_grpc as inference_pb2_grpc
 from grpc_reflection.v1alpha import reflection
+from grpc_health.v1 import health, health_pb2, health_pb2_grpc
 
-from config import MAX_TOKENS, EARLY_STOP_TOKENS
-from utils import IS_GPU_AVAILABLE
+from config import (
+    MAX_TOKENS,
+    EARLY_STOP_TOKENS,
+    MAX_CONCURRENT_SEQUENCES,
+    DEFAULT_CPU_SEQUENCES,
+    MAX_QUEUE_DEPTH,
+    USE_KV_CACHE,
+    KV_CACHE_BYTES,
+    KV_CACHE_MAX_SESSIONS,
+    SUMMARY_MAX_TOKENS,
+    HISTORY_PRECOMPUTE,
+    SEMANTIC_CACHE,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_TTL,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    CACHE_REPLAY_CHUNK_CHARS,
+    MODEL_POOL_BYTES,
+    MODEL_POOL_MAX_MODELS,
+    MODEL_DRAIN_TIMEOUT,
+    MODEL_USE_MMAP,
+    MODEL_USE_MLOCK,
+    MODEL_LOAD_POLICY,
+    MODEL_WARMUP,
+    PROMPT_PREFIX_CACHE_ENTRIES,
+    EMBED_BATCH_MAX_SIZE,
+    EMBED_BATCH_WINDOW_MS,
+    EMBED_STREAM_WINDOW,
+    EMBED_CACHE,
+    EMBED_CACHE_DIR,
+    EMBED_CACHE_BYTES,
+    RERANK_MODEL,
+    RERANK_ENABLED,
+    RERANK_BATCH_SIZE,
+    RERANK_MAX_LENGTH,
+)
+from utils import IS_GPU_AVAILABLE, read_gpu_memory_info, read_memory_info, prefetch_file
+from metrics import LoadMetrics
+from scheduler import ContextPool, RequestScheduler, SchedulerFullError
+from kv_cache import SessionKVCache
+from history import HistoryCompressor
+from semantic_cache import SemanticCache
+from streaming import InflightRegistry, iter_chunks
+from model_pool import ModelPool
+from gguf_metadata import metadata_cache, estimate_kv_bytes
+from prompts import PromptRenderer
+from embedding_batcher import EmbeddingBatcher
+from embedding_cache import EmbeddingCache
 
 from llama_cpp import Llama
-from sentence_transformers import SentenceTransformer
+from sentence_transformers import CrossEncoder, SentenceTransformer
 from diskcache import Cache
 
 logging.basicConfig(
@@ -25,6 +75,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 MODELS_PATH = "/models/"
+SERVICE_NAME = inference_pb2.DESCRIPTOR.services_by_name["InferenceService"].full_name
 
 class ModelStatus(Enum):
     IDLE = "IDLE"
@@ -52,16 +103,6 @@ def detect_model_type(model_name, loaded_model=None):
             return cf.lower()
     return "llama"
 
-def build_prompt_qwen(messages):
-    prompt = ""
-    for msg in messages:
-        if msg["role"] == "user":
-            prompt += f"<|im_start|>user\n{msg['content']}<|im_end|>\n"
-        elif msg["role"] == "assistant":
-            prompt += f"<|im_start|>assistant\n{msg['content']}<|im_end|>\n"
-    prompt += "<|im_start|>assistant\n"
-    return prompt
-
 class ModelManager:
     _instance = None
     _lock = threading.Lock()
@@ -77,61 +118,309 @@ class ModelManager:
         if self.initialized:
             return
         self.model = None
+        self.pool = None
         self.model_name = ""
         self.model_type = None
+        self.loading_model = ""
+        self.load_progress = 0.0
         self.status = ModelStatus.IDLE
         self.error_message = ""
         self.embedding_model = None
         self.embedding_model_name = ""
         self.lock = threading.Lock()
         self.cache = Cache("/app/.cache")
+        self.scheduler = RequestScheduler(
+            max_concurrent_sequences=MAX_CONCURRENT_SEQUENCES
+            or (1 if IS_GPU_AVAILABLE else DEFAULT_CPU_SEQUENCES),
+            max_queue_depth=MAX_QUEUE_DEPTH,
+        )
+        self.semantic_cache = SemanticCache(
+            threshold=SEMANTIC_CACHE_THRESHOLD,
+            ttl_seconds=SEMANTIC_CACHE_TTL,
+            max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+        )
+        self.inflight = InflightRegistry()
+        self.history = HistoryCompressor(summary_max_tokens=SUMMARY_MAX_TOKENS)
+        self.kv_cache = SessionKVCache(
+            capacity_bytes=KV_CACHE_BYTES, max_sessions=KV_CACHE_MAX_SESSIONS
+        )
+        self.models = ModelPool(
+            budget_bytes=MODEL_POOL_BYTES,
+            max_models=MODEL_POOL_MAX_MODELS,
+            on_evict=self._on_model_evicted,
+        )
+        self.prompts = PromptRenderer(max_prefixes=PROMPT_PREFIX_CACHE_ENTRIES)
+        self.embedding_batcher = EmbeddingBatcher(
+            self._encode_texts,
+            max_batch_size=EMBED_BATCH_MAX_SIZE,
+            window_ms=EMBED_BATCH_WINDOW_MS,
+        )
+        self.embedding_cache = EmbeddingCache(EMBED_CACHE_DIR, size_limit=EMBED_CACHE_BYTES)
+        self.rerank_model = None
+        self.rerank_model_name = ""
+        # 并发的重排请求与嵌入一样合并成批，按文本对长度排序后一次打分
+        self.rerank_batcher = EmbeddingBatcher(
+            self._score_pairs,
+            max_batch_size=RERANK_BATCH_SIZE,
+            window_ms=EMBED_BATCH_WINDOW_MS,
+            name="rerank",
+        )
+        self.load_metrics = LoadMetrics()
+        # 由 serve() 注入；生成模型与嵌入模型都预热完成后才报告 SERVING
+        self.health_servicer = None
         self.initialized = True
         logger.info("模型管理器初始化完成。")
 
-    def _load_model_in_background(self, new_model_name):
-        try:
-            with self.lock:
-                if self.model is not None:
-                    del self.model
-                self.model_name = new_model_name
-                self.status = ModelStatus.LOADING
-                self.error_message = ""
-                self.model_type = None
+    def _create_pool(self, model_name, progress=None):
+        model_path = os.path.join(MODELS_PATH, model_name)
+        n_gpu_layers = -1 if IS_GPU_AVAILABLE else 0
+        logger.info(
+            f"加载模型 {model_name} 到 {'GPU' if IS_GPU_AVAILABLE else 'CPU'}"
+        )
 
-            model_path = os.path.join(MODELS_PATH, new_model_name)
-            n_gpu_layers = -1 if IS_GPU_AVAILABLE else 0
-            logger.info(
-                f"加载模型 {new_model_name} 到 {'GPU' if IS_GPU_AVAILABLE else 'CPU'}"
-            )
+        # 只解析文件头，不实例化模型
+        try:
+            metadata = metadata_cache.get(model_path)
+        except Exception as e:
+            logger.warning(f"读取模型元数据失败: {e}")
+            metadata = {}
 
-            chat_format = None
-            if "qwen" in new_model_name.lower():
+        # 模型自带聊天模板时交给 llama-cpp 使用，否则按文件名推断
+        chat_format = None
+        if not metadata.get("tokenizer.chat_template"):
+            if "qwen" in model_name.lower():
                 chat_format = "chatml"
-            elif "llama-3" in new_model_name.lower():
+            elif "llama-3" in model_name.lower():
                 chat_format = "llama-3"
-            elif "llama-2" in new_model_name.lower():
+            elif "llama-2" in model_name.lower():
                 chat_format = "llama-2"
 
-            new_model = Llama(
-                model_path=model_path,
-                n_ctx=8192,
-                n_gpu_layers=n_gpu_layers,
-                chat_format=chat_format,
-                verbose=True,
+        policy = self._load_policy(model_name)
+        n_contexts = self.scheduler.max_concurrent_sequences
+        weight_bytes = os.path.getsize(model_path)
+        kv_bytes = estimate_kv_bytes(metadata, 8192)
+        if IS_GPU_AVAILABLE and n_contexts > 1:
+            # 每个上下文都把权重卸载到显存，按空闲显存能容纳的份数限制上下文数
+            _, free_vram = read_gpu_memory_info()
+            fits = free_vram // (weight_bytes + kv_bytes) if free_vram else 0
+            if fits < n_contexts:
+                logger.warning(
+                    f"空闲显存 {free_vram / 1024**3:.2f} GiB 只够模型 {model_name} 的"
+                    f" {max(1, fits)} 个上下文（配置 {n_contexts} 个），按 {max(1, fits)} 个加载"
+                )
+                n_contexts = max(1, int(fits))
+        # 只有 CPU + mmap 时权重在上下文之间共享页缓存；卸载到 GPU 或不用 mmap
+        # 时每个上下文各有一份权重
+        weight_copies = 1 if not IS_GPU_AVAILABLE and policy["use_mmap"] else n_contexts
+        if weight_copies > 1 and not IS_GPU_AVAILABLE:
+            logger.warning(f"模型 {model_name} 未启用 mmap，{n_contexts} 个上下文将各自复制一份权重")
+
+        # 加载前按「权重 + 各上下文 KV cache」估算占用，为新模型腾出空间；
+        # 当前默认模型不会被卸载
+        nbytes = weight_copies * weight_bytes + n_contexts * kv_bytes
+        self.models.reserve(nbytes, protect={self.model_name})
+
+        if policy["use_mmap"] and not policy["use_mlock"]:
+            # 让内核提前异步读入文件，缺页时多半已在页缓存中
+            prefetch_file(model_path)
+
+        # 每个并发序列一个独立上下文
+        contexts = []
+        with self.load_metrics.phase(f"generation_load:{model_name}"):
+            for _ in range(n_contexts):
+                contexts.append(
+                    Llama(
+                        model_path=model_path,
+                        n_ctx=8192,
+                        n_gpu_layers=n_gpu_layers,
+                        chat_format=chat_format,
+                        use_mmap=policy["use_mmap"],
+                        use_mlock=policy["use_mlock"],
+                        verbose=True,
+                    )
+                )
+                if progress is not None:
+                    progress(len(contexts) / n_contexts)
+        if policy["warmup"]:
+            with self.load_metrics.phase(f"generation_warmup:{model_name}"):
+                for ctx in contexts:
+                    self._warm_up_context(ctx)
+        logger.info(f"成功加载模型 {model_name}，估算占用 {nbytes / 1024**3:.2f} GiB")
+        return ContextPool(
+            contexts,
+            name=model_name,
+            model_type=detect_model_type(model_name, contexts[0]),
+            nbytes=nbytes,
+        )
+
+    @staticmethod
+    def _load_policy(model_name):
+        """全局 mmap/mlock/预热设置，叠加 MODEL_LOAD_POLICY 中针对该模型的覆盖项。"""
+        policy = {
+            "use_mmap": MODEL_USE_MMAP,
+            "use_mlock": MODEL_USE_MLOCK,
+            "warmup": MODEL_WARMUP,
+        }
+        policy.update(
+            (k, bool(v))
+            for k, v in MODEL_LOAD_POLICY.get(model_name, {}).items()
+            if k in policy
+        )
+        return policy
+
+    @staticmethod
+    def _warm_up_context(ctx):
+        """
+        Run one tiny generation so weights are paged in and compute kernels
+        are initialised before the first real request.
+        """
+        try:
+            ctx.create_completion("Hello", max_tokens=1)
+            ctx.reset()
+        except Exception as e:
+            logger.warning(f"模型预热失败: {e}")
+
+    def _warm_up_embedding(self, embedding_model):
+        if not MODEL_WARMUP:
+            return
+        try:
+            with self.load_metrics.phase("embedding_warmup"):
+                embedding_model.encode(["预热 warm-up"], normalize_embeddings=True)
+        except Exception as e:
+            logger.warning(f"嵌入模型预热失败: {e}")
+
+    def _update_readiness(self):
+        """
+        生成模型与嵌入模型都就绪后，gRPC 健康检查才报告 SERVING；之后加载
+        失败或默认模型、嵌入模型丢失时改回 NOT_SERVING。
+        """
+        ready = self.status == ModelStatus.READY and self.embedding_model is not None
+        if self.health_servicer is None:
+            return
+        if ready:
+            self.load_metrics.mark_ready()
+        serving = (
+            health_pb2.HealthCheckResponse.SERVING
+            if ready
+            else health_pb2.HealthCheckResponse.NOT_SERVING
+        )
+        for service in ("", SERVICE_NAME):
+            self.health_servicer.set(service, serving)
+
+    def _set_load_progress(self, value):
+        self.load_progress = value
+        logger.info(f"模型 {self.loading_model} 加载进度 {value:.0%}")
+
+    def _load_model_in_background(self, new_model_name):
+        """
+        蓝绿切换：新模型在旧模型旁边加载，期间旧模型继续服务；加载完成后
+        原子地切换默认模型，旧模型上的请求全部结束后再按需卸载。
+        """
+        try:
+            with self.lock:
+                old_pool = self.pool
+                self.loading_model = new_model_name
+                self.load_progress = 0.0
+                self.error_message = ""
+                if old_pool is None:
+                    self.model_name = new_model_name
+                    self.status = ModelStatus.LOADING
+            self._update_readiness()
+
+            pool = self.models.load(
+                new_model_name,
+                lambda: self._create_pool(new_model_name, self._set_load_progress),
+                protect={old_pool.name} if old_pool else (),
             )
 
             with self.lock:
-                self.model = new_model
-                self.model_type = detect_model_type(new_model_name, new_model)
-                self.status = ModelStatus.READY
-                logger.info(f"成功加载模型 {new_model_name}")
+                self._activate(pool)
+                self.loading_model = ""
+                self.load_progress = 1.0
+            self._update_readiness()
+
+            if old_pool is not None and old_pool is not pool:
+                threading.Thread(
+                    target=self._drain,
+                    args=(old_pool,),
+                    name="model-drain",
+                    daemon=True,
+                ).start()
         except Exception as e:
             logger.error(f"加载模型出错: {e}", exc_info=True)
             with self.lock:
+                self.loading_model = ""
+                self.load_progress = 0.0
+                self.error_message = str(e)
+                if self.pool is None:
+                    self.model = None
+                    self.model_type = None
+                    self.status = ModelStatus.ERROR
+            self._update_readiness()
+
+    def _drain(self, old_pool):
+        """Wait for in-flight streams on a replaced model, then trim the pool."""
+        waited = 0.0
+        while old_pool.refs > 0:
+            if waited >= MODEL_DRAIN_TIMEOUT:
+                logger.warning(
+                    f"模型 {old_pool.name} 仍有 {old_pool.refs} 个请求未结束，暂不卸载"
+                )
+                return
+            time.sleep(0.5)
+            waited += 0.5
+        logger.info(f"旧模型 {old_pool.name} 上的请求已全部结束")
+        self.models.trim(protect={self.model_name})
+
+    def _activate(self, pool):
+        """Make a resident pool the default generation model (caller holds lock)."""
+        self.model = pool.primary
+        self.pool = pool
+        self.model_name = pool.name
+        self.model_type = pool.model_type
+        self.status = ModelStatus.READY
+        logger.info(f"当前默认生成模型: {pool.name}")
+
+    def _on_model_evicted(self, model_name):
+        self.kv_cache.drop_model(model_name)
+        self.prompts.forget_model(model_name)
+        with self.lock:
+            lost = self.pool is not None and self.pool.name == model_name
+            if lost:
+                # 默认模型被卸载（如同名模型重新加载时替换），在重新激活前不可用
+                self.pool = None
                 self.model = None
                 self.model_type = None
                 self.status = ModelStatus.ERROR
-                self.error_message = str(e)
+                self.error_message = f"默认模型 {model_name} 已卸载"
+        if lost:
+            self._update_readiness()
+
+    def _resolve_pool(self, model_name=None):
+        """
+        返回请求使用的模型，已持有引用（调用方用完后 ``unpin()``）。
+        未指定或与默认模型相同时使用默认模型；否则从模型池中取出，不在池中
+        则加载（同名模型只加载一次）。引用在模型池的锁内获得，取出后到
+        开始使用前不会被并发的加载淘汰。
+        """
+        if not model_name or model_name == self.model_name:
+            with self.lock:
+                pool = self.pool if self.status == ModelStatus.READY else None
+            # 默认模型刚被切换掉并卸载时取不到，按未就绪处理
+            pool = self.models.get(pool.name, pin=True) if pool else None
+            if pool is None:
+                raise RuntimeError("模型未就绪")
+            return pool
+        if os.path.basename(model_name) != model_name or not os.path.exists(
+            os.path.join(MODELS_PATH, model_name)
+        ):
+            raise RuntimeError(f"模型不存在: {model_name}")
+        return self.models.load(
+            model_name,
+            lambda: self._create_pool(model_name),
+            protect={self.model_name},
+            pin=True,
+        )
 
     def _load_embedding_model(self, model_name=None):
         try:
@@ -166,14 +455,51 @@ class ModelManager:
                     logger.info(f"使用 HuggingFace 下载模型: {embed_model_path}")
 
             device = "cuda" if IS_GPU_AVAILABLE else "cpu"
-            self.embedding_model = SentenceTransformer(embed_model_path, device=device)
+            with self.load_metrics.phase("embedding_load"):
+                embedding_model = SentenceTransformer(embed_model_path, device=device)
+            self._warm_up_embedding(embedding_model)
+            self.embedding_model = embedding_model
             self.embedding_model_name = os.path.basename(embed_model_path)
             logger.info(f"嵌入模型加载成功: {self.embedding_model_name}")
+            self._update_readiness()
         except Exception as e:
             logger.error(f"加载嵌入模型出错: {e}", exc_info=True)
             if model_name:
                 logger.info("尝试加载默认嵌入模型...")
                 self._load_embedding_model()
+            else:
+                self._update_readiness()
+
+    def _load_rerank_model(self):
+        """Load the cross-encoder; reranking stays unavailable if this fails."""
+        if not RERANK_ENABLED:
+            return
+        try:
+            model_path = RERANK_MODEL
+            rerank_root = os.path.join(MODELS_PATH, "rerank-model")
+            if model_path and os.path.isdir(os.path.join(MODELS_PATH, model_path)):
+                model_path = os.path.join(MODELS_PATH, model_path)
+            if not model_path and os.path.isdir(rerank_root):
+                candidates = sorted(
+                    os.path.join(rerank_root, d)
+                    for d in os.listdir(rerank_root)
+                    if os.path.isdir(os.path.join(rerank_root, d))
+                )
+                model_path = candidates[0] if candidates else ""
+            model_path = model_path or "BAAI/bge-reranker-base"
+
+            device = "cuda" if IS_GPU_AVAILABLE else "cpu"
+            with self.load_metrics.phase("rerank_load"):
+                rerank_model = CrossEncoder(
+                    model_path, max_length=RERANK_MAX_LENGTH, device=device
+                )
+            if MODEL_WARMUP:
+                rerank_model.predict([("预热", "warm-up")])
+            self.rerank_model = rerank_model
+            self.rerank_model_name = os.path.basename(model_path.rstrip("/"))
+            logger.info(f"重排模型加载成功: {self.rerank_model_name}")
+        except Exception as e:
+            logger.error(f"加载重排模型出错: {e}", exc_info=True)
 
     def switch_embedding_model(self, embed_model_path: str):
         """Load a specific embedding model from the given path or HF repo."""
@@ -185,11 +511,18 @@ class ModelManager:
                 return {"status": "already_loaded"}
         try:
             device = "cuda" if IS_GPU_AVAILABLE else "cpu"
-            embedding_model = SentenceTransformer(embed_model_path, device=device)
+            with self.load_metrics.phase("embedding_load"):
+                embedding_model = SentenceTransformer(embed_model_path, device=device)
+            self._warm_up_embedding(embedding_model)
             with self.lock:
+                old_name = self.embedding_model_name
                 self.embedding_model = embedding_model
                 self.embedding_model_name = os.path.basename(embed_model_path)
+                self.semantic_cache.clear()
+            if old_name and old_name != self.embedding_model_name:
+                self.embedding_cache.drop_model(old_name)
             logger.info(f"嵌入模型加载成功: {self.embedding_model_name}")
+            self._update_readiness()
             return {"status": "loaded"}
         except Exception as e:
             logger.error(f"加载嵌入模型出错: {e}", exc_info=True)
@@ -197,12 +530,21 @@ class ModelManager:
 
     def switch_model(self, new_model_name):
         with self.lock:
-            if self.status == ModelStatus.LOADING:
+            if self.loading_model:
                 return {"status": "loading_busy"}
             if self.model_name == new_model_name and self.status == ModelStatus.READY:
                 return {"status": "already_loaded"}
             if not os.path.exists(os.path.join(MODELS_PATH, new_model_name)):
                 return {"status": "error", "message": "模型不存在"}
+            resident = self.models.get(new_model_name, pin=True)
+            if resident is not None:
+                # 已常驻内存，直接切换；切换完成前持有引用，不会被淘汰
+                try:
+                    self._activate(resident)
+                finally:
+                    resident.unpin()
+                self._update_readiness()
+                return {"status": "switched", "name": new_model_name}
 
             threading.Thread(
                 target=self._load_model_in_background,
@@ -211,70 +553,259 @@ class ModelManager:
             ).start()
             return {"status": "loading_started", "name": new_model_name}
 
-    def compress_history(
-        self, messages: list, max_length: int = 4096, keep_last: int = 4
-    ) -> list:
-        total_len = sum(len(msg["content"]) for msg in messages)
+    def _history_budget(self, llm):
+        """Prompt tokens available for history; the rest is left for the answer."""
+        n_ctx = llm.n_ctx()
+        return max(n_ctx // 2, n_ctx - MAX_TOKENS)
+
+    def _summarize(self, pool, previous_summary, new_messages):
+        if previous_summary:
+            summary_prompt = (
+                "以下是先前对话的摘要和之后新增的对话，请把它们合并成一段精简的摘要，"
+                "以便我能理解后续对话的背景:\n"
+                f"已有摘要: {previous_summary}\n新增对话:\n"
+            )
+        else:
+            summary_prompt = (
+                "请用一段话精简地总结以下对话的核心内容，以便我能理解后续对话的背景:\n"
+            )
+        for msg in new_messages:
+            summary_prompt += f"{msg['role']}: {msg['content']}\n"
 
-        if total_len <= max_length:
-            return messages
+        def work(llm, job):
+            response = llm.create_chat_completion(
+                messages=[{"role": "user", "content": summary_prompt}],
+                temperature=0.2,
+                max_tokens=self.history.summary_max_tokens,
+            )
+            yield response["choices"][0]["message"]["content"]
 
-        logger.info("Context length exceeded, compressing history...")
-        to_summarize = messages[:-keep_last]
+        return "".join(self.scheduler.stream(pool, work))
 
-        summary_prompt = (
-            "请用一段话精简地总结以下对话的核心内容，以便我能理解后续对话的背景:\n"
+    def compress_history(self, messages: list, session_id=None, pool=None) -> list:
+        pool = pool or self.pool
+        return self.history.compress(
+            pool.primary,
+            pool.name,
+            messages,
+            self._history_budget(pool.primary),
+            lambda prev, new: self._summarize(pool, prev, new),
+            session_id=session_id,
         )
-        for msg in to_summarize:
-            summary_prompt += f"{msg['role']}: {msg['content']}\n"
 
-        response = self.model.create_chat_completion(
-            messages=[{"role": "user", "content": summary_prompt}],
-            temperature=0.2,
-            max_tokens=256,
-        )
-        summary_text = response["choices"][0]["message"]["content"]
+    def _precompute_history(self, messages: list, session_id=None, pool=None):
+        """提交后台摘要后立即返回；完成前持有模型引用，避免模型在分词时被卸载。"""
+        pool = pool or self.pool
+        if not pool:
+            return
+        pool.pin()
+        try:
+            future = self.history.precompute(
+                pool.primary,
+                pool.name,
+                messages,
+                self._history_budget(pool.primary),
+                lambda prev, new: self._summarize(pool, prev, new),
+                session_id=session_id,
+            )
+        except BaseException:
+            pool.unpin()
+            raise
+        future.add_done_callback(lambda _: pool.unpin())
 
-        new_history = [{"role": "system", "content": f"先前对话摘要: {summary_text}"}]
-        new_history.extend(messages[-keep_last:])
+    def _semantic_query(self, messages: list):
+        """
+        返回可用于语义缓存的问题向量。
 
-        logger.info(f"History compressed. New length: {len(new_history)} messages.")
-        return new_history
+        只对单轮提问（除 system 外只有一条 user 消息）启用，多轮对话的
+        回答依赖历史，不能仅凭问题复用。
+        """
+        if not SEMANTIC_CACHE or not self.embedding_model:
+            return None
+        turns = [m for m in messages if m["role"] != "system"]
+        if len(turns) != 1 or turns[0]["role"] != "user":
+            return None
+        try:
+            return self.get_embeddings_batch([turns[0]["content"]])[0]
+        except Exception as e:
+            logger.warning(f"语义缓存计算问题向量失败: {e}")
+            return None
 
-    def infer_stream(self, messages: list):
-        if self.status != ModelStatus.READY or not self.model:
-            raise RuntimeError("模型未就绪")
+    def infer_stream(
+        self, messages: list, session_id=None, context_doc_ids=(), model_name=None
+    ):
+        pool = self._resolve_pool(model_name)
+        try:
+            yield from self._infer_with_pool(
+                pool, messages, session_id, context_doc_ids
+            )
+        finally:
+            pool.unpin()
 
-        compressed_messages = self.compress_history(messages)
-        cache_key = json.dumps(compressed_messages, sort_keys=True)
+    def _infer_with_pool(self, pool, messages, session_id, context_doc_ids):
+        model_key = pool.name
+        compressed_messages = self.compress_history(
+            messages, session_id=session_id, pool=pool
+        )
+        cache_key = json.dumps(
+            {"model": model_key, "messages": compressed_messages}, sort_keys=True
+        )
         if cache_key in self.cache:
             cached_result = self.cache[cache_key]
-            yield cached_result
+            yield from iter_chunks(cached_result, CACHE_REPLAY_CHUNK_CHARS)
             return
 
-        stream = self.model.create_chat_completion(
-            messages=compressed_messages,
-            stream=True,
-            max_tokens=MAX_TOKENS,
-            stop=EARLY_STOP_TOKENS or None,
-        )
+        query_embedding = self._semantic_query(messages)
+        if query_embedding is not None:
+            cached_result = self.semantic_cache.lookup(
+                query_embedding, context_doc_ids, model_key
+            )
+            if cached_result is not None:
+                logger.info("语义缓存命中")
+                yield from iter_chunks(cached_result, CACHE_REPLAY_CHUNK_CHARS)
+                return
+
+        def work(llm, job):
+            # 同一会话的后续轮次复用上一轮的 KV 状态，只计算新增 token
+            if USE_KV_CACHE and session_id:
+                llm.set_cache(self.kv_cache.view(session_id, model_key))
+            try:
+                # 模板已编译缓存，对话前缀的 token 直接复用
+                prompt = self.prompts.render(llm, model_key, compressed_messages)
+                if prompt is not None:
+                    stream = llm.create_completion(
+                        prompt=prompt.tokens,
+                        stream=True,
+                        max_tokens=MAX_TOKENS,
+                        stop=(prompt.stop + EARLY_STOP_TOKENS) or None,
+                    )
+                    for output in stream:
+                        token = output["choices"][0].get("text", "")
+                        if token:
+                            yield token
+                    return
+                stream = llm.create_chat_completion(
+                    messages=compressed_messages,
+                    stream=True,
+                    max_tokens=MAX_TOKENS,
+                    stop=EARLY_STOP_TOKENS or None,
+                )
+                for output in stream:
+                    token = output["choices"][0].get("delta", {}).get("content", "")
+                    if token:
+                        yield token
+            finally:
+                llm.set_cache(None)
+
+        def on_complete(full_response):
+            self.cache[cache_key] = full_response
+            if query_embedding is not None and full_response:
+                self.semantic_cache.put(
+                    query_embedding, context_doc_ids, model_key, full_response
+                )
+
         full_response = ""
-        for output in stream:
-            token = output["choices"][0].get("delta", {}).get("content", "")
-            if token:
-                full_response += token
-                yield token
+        # 相同的并发请求共享同一次生成
+        for token in self.inflight.stream(
+            cache_key,
+            lambda: self.scheduler.stream(pool, work),
+            on_complete=on_complete,
+        ):
+            full_response += token
+            yield token
+
+        if HISTORY_PRECOMPUTE:
+            self._precompute_history(
+                messages + [{"role": "assistant", "content": full_response}],
+                session_id=session_id,
+                pool=pool,
+            )
 
-        self.cache[cache_key] = full_response
+    def _encode_texts(self, texts):
+        embedding_model = self.embedding_model
+        if not embedding_model:
+            raise RuntimeError("嵌入模型未加载")
+        return embedding_model.encode(
+            texts, batch_size=EMBED_BATCH_MAX_SIZE, normalize_embeddings=True
+        )
+
+    def submit_embeddings(self, texts):
+        """
+        返回一个 Future，结果为 ``texts`` 对应的向量矩阵。
+
+        先查持久化向量缓存，只有未命中的文本交给批处理器编码，结果写回缓存。
+        """
+        texts = list(texts)
+        model_name = self.embedding_model_name
+        if not EMBED_CACHE or not texts:
+            return self.embedding_batcher.submit(texts)
+        vectors = self.embedding_cache.get_many(model_name, texts)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        result = Future()
+        if not missing:
+            result.set_result(np.stack(vectors))
+            return result
+
+        def done(future):
+            try:
+                encoded = future.result()
+            except Exception as e:
+                result.set_exception(e)
+                return
+            # 编码期间嵌入模型被切换时不写缓存
+            if self.embedding_model_name == model_name:
+                self.embedding_cache.put_many(
+                    model_name, [texts[i] for i in missing], encoded
+                )
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+            result.set_result(np.stack(vectors).astype(np.float32, copy=False))
+
+        self.embedding_batcher.submit([texts[i] for i in missing]).add_done_callback(done)
+        return result
+
+    def _score_pairs(self, pairs):
+        rerank_model = self.rerank_model
+        if not rerank_model:
+            raise RuntimeError("重排模型未加载")
+        return np.asarray(
+            rerank_model.predict(pairs, batch_size=RERANK_BATCH_SIZE), dtype=np.float32
+        )
+
+    def rerank(self, query, texts):
+        """Score each ``(query, text)`` pair with the cross-encoder."""
+        if not self.rerank_model:
+            raise RuntimeError("重排模型未加载")
+        return self.rerank_batcher.encode([(query, text) for text in texts])
 
     def get_embeddings_batch(self, texts):
         if not self.embedding_model:
             raise RuntimeError("嵌入模型未加载")
-        vectors = self.embedding_model.encode(texts, normalize_embeddings=True)
-        return vectors
+        # 并发调用方的请求在批处理线程中合并成一次 encode
+        return self.submit_embeddings(texts).result()
 
 model_manager = ModelManager()
 
+_PACKED_DTYPES = {
+    inference_pb2.EMBEDDING_FLOAT32: np.dtype("<f4"),
+    inference_pb2.EMBEDDING_FLOAT16: np.dtype("<f2"),
+}
+
+
+def _pack(vectors, encoding):
+    matrix = np.ascontiguousarray(vectors, dtype=_PACKED_DTYPES[encoding])
+    if matrix.size == 0:
+        matrix = matrix.reshape(0, 0)
+    rows, dim = matrix.shape
+    return dict(packed=matrix.tobytes(), packed_encoding=encoding, rows=rows, dim=dim)
+
+
+def pack_embeddings(vectors, encoding, model_name=""):
+    """Pack a batch of vectors into one little-endian buffer."""
+    return inference_pb2.EmbeddingBatchResponse(
+        model_name=model_name, **_pack(vectors, encoding)
+    )
+
 class InferenceService(inference_pb2_grpc.InferenceServiceServicer):
     def ListAvailableModels(self, request, context):
         gen_models = []
@@ -302,6 +833,7 @@ class InferenceService(inference_pb2_grpc.InferenceServiceServicer):
             else ""
         )
         device = "GPU" if IS_GPU_AVAILABLE else "CPU"
+        mem_total, mem_available = read_memory_info()
 
         return inference_pb2.ModelListResponse(
             generation_models=gen_models,
@@ -309,6 +841,12 @@ class InferenceService(inference_pb2_grpc.InferenceServiceServicer):
             current_generation_model=current_gen,
             current_embedding_model=model_manager.embedding_model_name,
             device=device,
+            resident_models=model_manager.models.names(),
+            loading_model=model_manager.loading_model,
+            load_progress=model_manager.load_progress,
+            memory_total_bytes=mem_total,
+            memory_available_bytes=mem_available,
+            resident_model_bytes=model_manager.models.resident_bytes,
         )
 
     def SwitchModel(self, request, context):
@@ -317,7 +855,7 @@ class InferenceService(inference_pb2_grpc.InferenceServiceServicer):
             success = res["status"] in ("loaded", "already_loaded")
         else:
             res = model_manager.switch_model(request.model_name)
-            success = res["status"] in ("loading_started", "already_loaded")
+            success = res["status"] in ("loading_started", "already_loaded", "switched")
         msg = res.get("message", "") or res.get("status", "")
         return inference_pb2.SwitchModelResponse(success=success, message=msg)
 
@@ -329,8 +867,24 @@ class InferenceService(inference_pb2_grpc.InferenceServiceServicer):
             messages = [
                 {"role": msg.role, "content": msg.content} for msg in request.messages
             ]
-            for token in model_manager.infer_stream(messages):
+            session_id = (
+                request.session_id if request.HasField("session_id") else None
+            )
+            model_name = (
+                request.model_name if request.HasField("model_name") else None
+            )
+            for token in model_manager.infer_stream(
+                messages,
+                session_id=session_id,
+                context_doc_ids=list(request.context_doc_ids),
+                model_name=model_name,
+            ):
                 yield inference_pb2.ChatResponse(token=token)
+        except SchedulerFullError as e:
+            logger.warning(f"ChatStream 被拒绝: {e}")
+            context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+            context.set_details(str(e))
+            yield inference_pb2.ChatResponse(error_message=str(e))
         except Exception as e:
             logger.error(f"ChatStream 异常: {e}", exc_info=True)
             context.set_code(grpc.StatusCode.INTERNAL)
@@ -348,8 +902,13 @@ class InferenceService(inference_pb2_grpc.InferenceServiceServicer):
         try:
             texts = list(request.texts)
             vectors = model_manager.get_embeddings_batch(texts)
+            if request.encoding != inference_pb2.EMBEDDING_VALUES:
+                return pack_embeddings(
+                    vectors, request.encoding, model_manager.embedding_model_name
+                )
             # 注意proto结构！！如果你的proto不是values, 请调整
             return inference_pb2.EmbeddingBatchResponse(
+                model_name=model_manager.embedding_model_name,
                 embeddings=[
                     inference_pb2.Embedding(values=list(map(float, v)))
                     for v in vectors
@@ -361,14 +920,141 @@ class InferenceService(inference_pb2_grpc.InferenceServiceServicer):
             context.set_details(f"生成嵌入向量时出错: {e}")
             return inference_pb2.EmbeddingBatchResponse()
 
+    def InvalidateCache(self, request, context):
+        """
+        知识库文档删除后，使依赖这些文档的语义缓存失效
+        """
+        removed = model_manager.semantic_cache.invalidate_docs(list(request.doc_ids))
+        return inference_pb2.InvalidateCacheResponse(removed=removed)
+
+    def EmbedStream(self, request_iterator, context):
+        """
+        双向流式嵌入。
+
+        后台线程读取客户端发来的文本组并提交给批处理器，最多同时处理
+        EMBED_STREAM_WINDOW 组；窗口满时暂停读取，由 HTTP/2 流控反压客户端。
+        结果按发送顺序返回，并附带进度计数。
+        """
+        if not model_manager.embedding_model:
+            context.abort(grpc.StatusCode.UNAVAILABLE, "嵌入模型未加载。")
+        pending = queue.Queue(maxsize=EMBED_STREAM_WINDOW)
+        progress = {"received": 0}
+
+        def put(item):
+            while context.is_active():
+                try:
+                    pending.put(item, timeout=1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def reader():
+            try:
+                for request in request_iterator:
+                    texts = list(request.texts)
+                    encoding = request.encoding or inference_pb2.EMBEDDING_FLOAT32
+                    future = model_manager.submit_embeddings(texts)
+                    if not put((progress["received"], encoding, future)):
+                        return
+                    progress["received"] += len(texts)
+                put(None)
+            except Exception as e:
+                put(e)
+
+        threading.Thread(target=reader, name="embed-stream", daemon=True).start()
+        processed = 0
+        while True:
+            try:
+                item = pending.get(timeout=1)
+            except queue.Empty:
+                # 客户端取消后读取线程不再入队（连结束标记也没有），这里随之退出
+                if not context.is_active():
+                    return
+                continue
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                logger.error(f"EmbedStream 读取请求出错: {item}")
+                context.abort(grpc.StatusCode.INTERNAL, str(item))
+            offset, encoding, future = item
+            try:
+                vectors = future.result()
+            except Exception as e:
+                logger.error(f"生成嵌入向量时出错: {e}", exc_info=True)
+                context.abort(grpc.StatusCode.INTERNAL, f"生成嵌入向量时出错: {e}")
+            processed += len(vectors)
+            yield inference_pb2.EmbedStreamResponse(
+                model_name=model_manager.embedding_model_name,
+                offset=offset,
+                received=progress["received"],
+                processed=processed,
+                **_pack(vectors, encoding),
+            )
+
+    def Rerank(self, request, context):
+        """
+        交叉编码器重排：返回查询与每条候选文本的相关性分数
+        """
+        if not model_manager.rerank_model:
+            context.abort(grpc.StatusCode.UNAVAILABLE, "重排模型未加载。")
+        try:
+            scores = model_manager.rerank(request.query, list(request.texts))
+        except Exception as e:
+            logger.error(f"重排打分出错: {e}", exc_info=True)
+            context.abort(grpc.StatusCode.INTERNAL, f"重排打分出错: {e}")
+        return inference_pb2.RerankResponse(
+            scores=[float(s) for s in scores],
+            model_name=model_manager.rerank_model_name,
+        )
+
+    def GetServiceStats(self, request, context):
+        """
+        加载阶段耗时与运行时计数器
+        """
+        counters = {
+            "queue_depth": model_manager.scheduler.queue_depth,
+            "active_sequences": model_manager.scheduler.active_sequences,
+            "kv_cache_hits": model_manager.kv_cache.hits,
+            "kv_cache_misses": model_manager.kv_cache.misses,
+            "semantic_cache_hits": model_manager.semantic_cache.hits,
+            "semantic_cache_misses": model_manager.semantic_cache.misses,
+            "coalesced_requests": model_manager.inflight.coalesced,
+            "prompt_tokens_reused": model_manager.prompts.reused_tokens,
+            "prompt_tokens_tokenized": model_manager.prompts.tokenized_tokens,
+        }
+        counters.update(model_manager.embedding_batcher.stats())
+        counters.update(model_manager.rerank_batcher.stats())
+        counters["embedding_cache_hits"] = model_manager.embedding_cache.hits
+        counters["embedding_cache_misses"] = model_manager.embedding_cache.misses
+        return inference_pb2.ServiceStatsResponse(
+            ready="time_to_ready" in model_manager.load_metrics.snapshot(),
+            load_seconds=model_manager.load_metrics.snapshot(),
+            counters={k: float(v) for k, v in counters.items()},
+        )
+
 def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    # gRPC 线程只负责转发 token，数量需覆盖解码中与排队中的全部请求
+    max_workers = max(
+        10,
+        model_manager.scheduler.max_concurrent_sequences
+        + model_manager.scheduler.max_queue_depth,
+    )
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers))
     inference_pb2_grpc.add_InferenceServiceServicer_to_server(
         InferenceService(), server
     )
 
+    # 模型加载并预热完成前健康检查返回 NOT_SERVING
+    health_servicer = health.HealthServicer()
+    for service in ("", SERVICE_NAME):
+        health_servicer.set(service, health_pb2.HealthCheckResponse.NOT_SERVING)
+    health_pb2_grpc.add_HealthServicer_to_server(health_servicer, server)
+    model_manager.health_servicer = health_servicer
+
     SERVICE_NAMES = (
-        inference_pb2.DESCRIPTOR.services_by_name["InferenceService"].full_name,
+        SERVICE_NAME,
+        health.SERVICE_NAME,
         reflection.SERVICE_NAME,
     )
     reflection.enable_server_reflection(SERVICE_NAMES, server)
@@ -399,6 +1085,7 @@ def serve():
         args=(embed_model_cfg,),
         daemon=True,
     ).start()
+    threading.Thread(target=model_manager._load_rerank_model, daemon=True).start()
 
     try:
         if gen_model_cfg:
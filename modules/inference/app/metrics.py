@@ -0,0 +1,44 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class LoadMetrics:
+    """
+    记录模型加载各阶段的耗时（秒）。
+
+    阶段名形如 ``generation_load:<模型>``、``embedding_warmup``，同名阶段
+    保留最近一次的结果；``time_to_ready`` 为进程启动到服务就绪的时间。
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self._timings = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._timings[name] = seconds
+        logger.info(f"阶段 {name} 耗时 {seconds:.2f}s")
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def mark_ready(self):
+        with self._lock:
+            if "time_to_ready" in self._timings:
+                return
+        self.record("time_to_ready", time.monotonic() - self.started_at)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._timings)
@@ -0,0 +1,140 @@
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ModelPool:
+    """
+    常驻内存的生成模型池。
+
+    按名字保存已加载模型的 ContextPool，在内存预算 ``budget_bytes``
+    （0 表示不限）和模型数上限 ``max_models`` 内按 LRU 淘汰空闲模型；
+    正在被请求使用的模型和调用方指定保护的模型不会被淘汰。
+
+    ``get``/``load`` 传入 ``pin=True`` 时在持有池锁的情况下增加引用计数，
+    返回的模型不会在调用方 ``pin()`` 之前被其他线程淘汰；用完后调用
+    ``unpin()``。
+    """
+
+    def __init__(self, budget_bytes=0, max_models=1, on_evict=None):
+        self.budget_bytes = budget_bytes
+        self.on_evict = on_evict
+        self.max_models = max(1, max_models)
+        self._models = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, pin=False):
+        with self._lock:
+            pool = self._models.get(name)
+            if pool is not None:
+                self._models.move_to_end(name)
+                if pin:
+                    pool.pin()
+            return pool
+
+    def names(self):
+        with self._lock:
+            return list(self._models.keys())
+
+    @property
+    def resident_bytes(self):
+        with self._lock:
+            return sum(p.nbytes for p in self._models.values())
+
+    def _over_limit(self, extra_bytes, extra_models):
+        if len(self._models) + extra_models > self.max_models:
+            return True
+        if self.budget_bytes <= 0:
+            return False
+        used = sum(p.nbytes for p in self._models.values())
+        return used + extra_bytes > self.budget_bytes
+
+    def _evict_locked(self, extra_bytes, extra_models, protect):
+        evicted = []
+        for name in list(self._models.keys()):
+            if not self._over_limit(extra_bytes, extra_models):
+                break
+            pool = self._models[name]
+            if name in protect or pool.refs > 0:
+                continue
+            del self._models[name]
+            evicted.append(pool)
+        return evicted
+
+    def _close(self, pools):
+        for pool in pools:
+            logger.info(f"从模型池卸载模型 {pool.name}")
+            pool.close()
+            if self.on_evict is not None:
+                self.on_evict(pool.name)
+
+    def reserve(self, nbytes, protect=()):
+        """Evict idle models so that one more model of ``nbytes`` fits."""
+        with self._lock:
+            evicted = self._evict_locked(nbytes, 1, set(protect))
+        self._close(evicted)
+
+    def add(self, pool, protect=()):
+        protect = set(protect) | {pool.name}
+        with self._lock:
+            old = self._models.pop(pool.name, None)
+            self._models[pool.name] = pool
+            evicted = self._evict_locked(0, 0, protect)
+        if old is not None and old is not pool:
+            evicted.append(old)
+        self._close(evicted)
+        if self._over_limit(0, 0):
+            logger.warning("模型池超出内存预算，但其余模型仍在使用中，暂不卸载")
+
+    def trim(self, protect=()):
+        """Evict idle models until the pool is back within its limits."""
+        with self._lock:
+            evicted = self._evict_locked(0, 0, set(protect))
+        self._close(evicted)
+
+    def remove(self, name):
+        with self._lock:
+            pool = self._models.pop(name, None)
+        if pool is not None:
+            self._close([pool])
+
+    def load(self, name, loader, protect=(), pin=False):
+        """
+        Return the resident pool for ``name``, loading it with ``loader()``
+        if needed. Concurrent callers for the same name share one load.
+        With ``pin=True`` the pool is returned already pinned.
+        """
+        pool = self.get(name, pin=pin)
+        if pool is not None:
+            return pool
+        with self._lock:
+            event = self._loading.get(name)
+            owner = event is None
+            if owner:
+                event = threading.Event()
+                self._loading[name] = event
+        if not owner:
+            event.wait()
+            pool = self.get(name, pin=pin)
+            if pool is None:
+                raise RuntimeError(f"模型 {name} 加载失败")
+            return pool
+        try:
+            pool = loader()
+            # 在放进池之前引用，其他线程看到它时已不能淘汰
+            if pin:
+                pool.pin()
+            try:
+                self.add(pool, protect=protect)
+            except BaseException:
+                if pin:
+                    pool.unpin()
+                raise
+            return pool
+        finally:
+            with self._lock:
+                self._loading.pop(name, None)
+            event.set()
@@ -0,0 +1,238 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from jinja2 import BaseLoader
+from jinja2.sandbox import ImmutableSandboxedEnvironment
+
+logger = logging.getLogger(__name__)
+
+
+def _raise_exception(message):
+    raise ValueError(message)
+
+
+# 编译模板时用来检验能否增量渲染的示例对话（含推理内容，部分模板会改写历史轮次）
+_PROBE_MESSAGES = [
+    {"role": "system", "content": "s"},
+    {"role": "user", "content": "u1"},
+    {"role": "assistant", "content": "<think>t</think>a1"},
+    {"role": "user", "content": "u2"},
+    {"role": "assistant", "content": "a2"},
+    {"role": "user", "content": "u3"},
+]
+
+
+class _Template:
+    __slots__ = ("template", "bos_token", "eos_token", "incremental")
+
+    def __init__(self, source, bos_token, eos_token):
+        env = ImmutableSandboxedEnvironment(
+            loader=BaseLoader(), trim_blocks=True, lstrip_blocks=True
+        )
+        self.template = env.from_string(source)
+        self.bos_token = bos_token
+        self.eos_token = eos_token
+        self.incremental = self._probe_incremental()
+
+    def render(self, messages, add_generation_prompt):
+        return self.template.render(
+            messages=messages,
+            bos_token=self.bos_token,
+            eos_token=self.eos_token,
+            raise_exception=_raise_exception,
+            add_generation_prompt=add_generation_prompt,
+        )
+
+    def render_delta(self, messages, k):
+        """
+        只渲染 ``messages[k:]``：前面换成一个小的上下文窗口（开头的 system
+        消息加上 k 之前的一两条消息，保持角色交替的奇偶性），渲染后去掉窗口
+        本身的文本。返回 (新增消息的文本, 生成提示)，对不上时返回 None。
+        """
+        head = 1 if messages[0]["role"] == "system" else 0
+        rest = k - head
+        window = min(rest, 2 if rest % 2 == 0 else 1)
+        context = messages[:head] + messages[k - window : k]
+        context_text = self.render(context, add_generation_prompt=False)
+        base = self.render(context + messages[k:], add_generation_prompt=False)
+        full = self.render(context + messages[k:], add_generation_prompt=True)
+        if not base.startswith(context_text) or not full.startswith(base):
+            return None
+        return base[len(context_text) :], full[len(base) :]
+
+    def _probe_incremental(self):
+        """用示例对话检验「缓存前缀 + 增量渲染」与整体渲染逐字一致"""
+        for conversation in (_PROBE_MESSAGES, _PROBE_MESSAGES[1:]):
+            for n in range(2, len(conversation) + 1):
+                messages = conversation[:n]
+                try:
+                    expected_base = self.render(messages, add_generation_prompt=False)
+                    expected_full = self.render(messages, add_generation_prompt=True)
+                except Exception:
+                    # 模板本身不接受这种对话（如不支持 system 角色），实际请求也会走整体渲染
+                    continue
+                for k in range(1, n):
+                    try:
+                        prefix = self.render(messages[:k], add_generation_prompt=False)
+                        delta = self.render_delta(messages, k)
+                    except Exception:
+                        delta = None
+                    if (
+                        delta is None
+                        or prefix + delta[0] != expected_base
+                        or prefix + delta[0] + delta[1] != expected_full
+                    ):
+                        return False
+        return True
+
+
+class RenderedPrompt:
+    __slots__ = ("tokens", "stop", "reused_tokens")
+
+    def __init__(self, tokens, stop, reused_tokens):
+        self.tokens = tokens
+        self.stop = stop
+        self.reused_tokens = reused_tokens
+
+
+class PromptRenderer:
+    """
+    编译并缓存每个模型的聊天模板，直接输出 token id。
+
+    - 模型自带的 ``tokenizer.chat_template`` 只编译一次，按模型缓存；
+    - 对话前缀（不含生成提示）的渲染文本与 token 按「模型 + 消息链式哈希」
+      缓存，新一轮只渲染新增的消息与生成提示，再分词拼接到已缓存的前缀后；
+    - 编译时用示例对话检验模板能否这样增量渲染；会改写历史轮次的模板
+      （如按最后一条用户消息裁掉推理内容）退回整体渲染，只复用前缀的分词；
+    - 前缀都在消息边界（模板的结束标记）处切分，分开分词与整体分词结果一致；
+      渲染结果与缓存前缀对不上时退回整体分词。
+
+    模型没有内置模板时 ``render`` 返回 None，由调用方改用 llama-cpp 的
+    chat_format。
+    """
+
+    def __init__(self, max_prefixes=1024):
+        self.max_prefixes = max_prefixes
+        self._templates = {}
+        self._prefixes = OrderedDict()
+        self._lock = threading.Lock()
+        self.reused_tokens = 0
+        self.tokenized_tokens = 0
+
+    def _template_for(self, llm, model_key):
+        with self._lock:
+            if model_key in self._templates:
+                return self._templates[model_key]
+        source = (llm.metadata or {}).get("tokenizer.chat_template")
+        template = None
+        if source:
+            try:
+                template = _Template(
+                    source,
+                    bos_token=self._token_text(llm, llm.token_bos()),
+                    eos_token=self._token_text(llm, llm.token_eos()),
+                )
+                logger.info(f"已编译模型 {model_key} 的聊天模板")
+            except Exception as e:
+                logger.warning(f"编译模型 {model_key} 的聊天模板失败: {e}")
+        with self._lock:
+            self._templates[model_key] = template
+        return template
+
+    @staticmethod
+    def _token_text(llm, token_id):
+        if token_id is None or token_id < 0:
+            return ""
+        return llm.detokenize([token_id], special=True).decode("utf-8", errors="ignore")
+
+    @staticmethod
+    def _prefix_hashes(model_key, messages):
+        """h[i] identifies messages[:i] for one model."""
+        h = hashlib.sha256(model_key.encode("utf-8"))
+        hashes = [h.hexdigest()]
+        for m in messages:
+            h.update(f"\x00{m['role']}\x01{m['content']}".encode("utf-8"))
+            hashes.append(h.copy().hexdigest())
+        return hashes
+
+    def _cached_prefix(self, hashes):
+        with self._lock:
+            for i in range(len(hashes) - 1, 0, -1):
+                entry = self._prefixes.get(hashes[i])
+                if entry is not None:
+                    self._prefixes.move_to_end(hashes[i])
+                    return i, entry[1], entry[2]
+        return None
+
+    def _store_prefix(self, model_key, key, text, tokens):
+        with self._lock:
+            self._prefixes[key] = (model_key, text, tokens)
+            self._prefixes.move_to_end(key)
+            while len(self._prefixes) > self.max_prefixes:
+                self._prefixes.popitem(last=False)
+
+    def _tokenize(self, llm, text, add_bos):
+        tokens = llm.tokenize(text.encode("utf-8"), add_bos=add_bos, special=True)
+        with self._lock:
+            self.tokenized_tokens += len(tokens)
+        return tokens
+
+    def render(self, llm, model_key, messages):
+        template = self._template_for(llm, model_key)
+        if template is None:
+            return None
+
+        hashes = self._prefix_hashes(model_key, messages)
+        cached = self._cached_prefix(hashes)
+        rendered = None
+        if cached is not None and template.incremental:
+            k, prefix_text, prefix_tokens = cached
+            try:
+                delta = template.render_delta(messages, k)
+            except Exception:
+                delta = None
+            if delta is not None:
+                rendered = prefix_text + delta[0], prefix_text + delta[0] + delta[1]
+        if rendered is None:
+            rendered = self._render_full(template, messages)
+            if cached is not None and rendered[0].startswith(cached[1]):
+                prefix_text, prefix_tokens = cached[1:]
+            else:
+                prefix_text, prefix_tokens = "", []
+        base_text, full_text = rendered
+
+        # 模板自己输出 bos_token，分词时不再额外添加
+        base_tokens = list(prefix_tokens)
+        if len(base_text) > len(prefix_text):
+            base_tokens += self._tokenize(
+                llm, base_text[len(prefix_text) :], add_bos=False
+            )
+        if base_text:
+            self._store_prefix(model_key, hashes[-1], base_text, base_tokens)
+        tokens = base_tokens + self._tokenize(
+            llm, full_text[len(base_text) :], add_bos=False
+        )
+        with self._lock:
+            self.reused_tokens += len(prefix_tokens)
+
+        stop = [template.eos_token] if template.eos_token else []
+        return RenderedPrompt(tokens, stop, len(prefix_tokens))
+
+    @staticmethod
+    def _render_full(template, messages):
+        full_text = template.render(messages, add_generation_prompt=True)
+        try:
+            base_text = template.render(messages, add_generation_prompt=False)
+        except Exception:
+            base_text = ""
+        if not full_text.startswith(base_text):
+            base_text = ""
+        return base_text, full_text
+
+    def forget_model(self, model_key):
+        with self._lock:
+            self._templates.pop(model_key, None)
+            for key in [k for k, v in self._prefixes.items() if v[0] == model_key]:
+                del self._prefixes[key]
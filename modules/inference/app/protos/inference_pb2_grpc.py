@@ -34,6 +34,26 @@ class InferenceServiceStub(object):
             request_serializer=inference__pb2.EmbeddingBatchRequest.SerializeToString,
             response_deserializer=inference__pb2.EmbeddingBatchResponse.FromString,
         )
+        self.InvalidateCache = channel.unary_unary(
+            "/inference.InferenceService/InvalidateCache",
+            request_serializer=inference__pb2.InvalidateCacheRequest.SerializeToString,
+            response_deserializer=inference__pb2.InvalidateCacheResponse.FromString,
+        )
+        self.GetServiceStats = channel.unary_unary(
+            "/inference.InferenceService/GetServiceStats",
+            request_serializer=inference__pb2.Empty.SerializeToString,
+            response_deserializer=inference__pb2.ServiceStatsResponse.FromString,
+        )
+        self.EmbedStream = channel.stream_stream(
+            "/inference.InferenceService/EmbedStream",
+            request_serializer=inference__pb2.EmbedStreamRequest.SerializeToString,
+            response_deserializer=inference__pb2.EmbedStreamResponse.FromString,
+        )
+        self.Rerank = channel.unary_unary(
+            "/inference.InferenceService/Rerank",
+            request_serializer=inference__pb2.RerankRequest.SerializeToString,
+            response_deserializer=inference__pb2.RerankResponse.FromString,
+        )
 
 
 class InferenceServiceServicer(object):
@@ -63,6 +83,30 @@ class InferenceServiceServicer(object):
         context.set_details("Method not implemented!")
         raise NotImplementedError("Method not implemented!")
 
+    def InvalidateCache(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details("Method not implemented!")
+        raise NotImplementedError("Method not implemented!")
+
+    def GetServiceStats(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details("Method not implemented!")
+        raise NotImplementedError("Method not implemented!")
+
+    def EmbedStream(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details("Method not implemented!")
+        raise NotImplementedError("Method not implemented!")
+
+    def Rerank(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details("Method not implemented!")
+        raise NotImplementedError("Method not implemented!")
+
 
 def add_InferenceServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -86,6 +130,26 @@ def add_InferenceServiceServicer_to_server(servicer, server):
             request_deserializer=inference__pb2.EmbeddingBatchRequest.FromString,
             response_serializer=inference__pb2.EmbeddingBatchResponse.SerializeToString,
         ),
+        "InvalidateCache": grpc.unary_unary_rpc_method_handler(
+            servicer.InvalidateCache,
+            request_deserializer=inference__pb2.InvalidateCacheRequest.FromString,
+            response_serializer=inference__pb2.InvalidateCacheResponse.SerializeToString,
+        ),
+        "GetServiceStats": grpc.unary_unary_rpc_method_handler(
+            servicer.GetServiceStats,
+            request_deserializer=inference__pb2.Empty.FromString,
+            response_serializer=inference__pb2.ServiceStatsResponse.SerializeToString,
+        ),
+        "EmbedStream": grpc.stream_stream_rpc_method_handler(
+            servicer.EmbedStream,
+            request_deserializer=inference__pb2.EmbedStreamRequest.FromString,
+            response_serializer=inference__pb2.EmbedStreamResponse.SerializeToString,
+        ),
+        "Rerank": grpc.unary_unary_rpc_method_handler(
+            servicer.Rerank,
+            request_deserializer=inference__pb2.RerankRequest.FromString,
+            response_serializer=inference__pb2.RerankResponse.SerializeToString,
+        ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
         "inference.InferenceService", rpc_method_handlers
@@ -212,3 +276,119 @@ class InferenceService(object):
             timeout,
             metadata,
         )
+
+    @staticmethod
+    def InvalidateCache(
+        request,
+        target,
+        options=(),
+        channel_credentials=None,
+        call_credentials=None,
+        insecure=False,
+        compression=None,
+        wait_for_ready=None,
+        timeout=None,
+        metadata=None,
+    ):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            "/inference.InferenceService/InvalidateCache",
+            inference__pb2.InvalidateCacheRequest.SerializeToString,
+            inference__pb2.InvalidateCacheResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+        )
+
+    @staticmethod
+    def GetServiceStats(
+        request,
+        target,
+        options=(),
+        channel_credentials=None,
+        call_credentials=None,
+        insecure=False,
+        compression=None,
+        wait_for_ready=None,
+        timeout=None,
+        metadata=None,
+    ):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            "/inference.InferenceService/GetServiceStats",
+            inference__pb2.Empty.SerializeToString,
+            inference__pb2.ServiceStatsResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+        )
+
+    @staticmethod
+    def EmbedStream(
+        request_iterator,
+        target,
+        options=(),
+        channel_credentials=None,
+        call_credentials=None,
+        insecure=False,
+        compression=None,
+        wait_for_ready=None,
+        timeout=None,
+        metadata=None,
+    ):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            "/inference.InferenceService/EmbedStream",
+            inference__pb2.EmbedStreamRequest.SerializeToString,
+            inference__pb2.EmbedStreamResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+        )
+
+    @staticmethod
+    def Rerank(
+        request,
+        target,
+        options=(),
+        channel_credentials=None,
+        call_credentials=None,
+        insecure=False,
+        compression=None,
+        wait_for_ready=None,
+        timeout=None,
+        metadata=None,
+    ):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            "/inference.InferenceService/Rerank",
+            inference__pb2.RerankRequest.SerializeToString,
+            inference__pb2.RerankResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+        )
@@ -0,0 +1,181 @@
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 放在 token 队列中的结束标记
+_END = object()
+
+
+class SchedulerFullError(RuntimeError):
+    """Raised when the admission queue is full."""
+
+
+class ContextPool:
+    """
+    同一模型的一组 llama.cpp 上下文。
+
+    每个上下文同一时刻只会被一个序列使用，避免多个请求共享同一个
+    KV cache 导致输出错乱。
+    """
+
+    def __init__(self, contexts, name="", model_type=None, nbytes=0):
+        if not contexts:
+            raise ValueError("ContextPool 至少需要一个上下文")
+        self.contexts = list(contexts)
+        self.name = name
+        self.model_type = model_type
+        self.nbytes = nbytes
+        self._free = queue.Queue()
+        for ctx in self.contexts:
+            self._free.put(ctx)
+        # 引用计数：排队中或执行中的任务都会持有引用，有引用时不能卸载
+        self._refs = 0
+        self._refs_lock = threading.Lock()
+
+    @property
+    def primary(self):
+        return self.contexts[0]
+
+    @property
+    def size(self):
+        return len(self.contexts)
+
+    @property
+    def in_use(self):
+        return self.size - self._free.qsize()
+
+    @property
+    def refs(self):
+        return self._refs
+
+    def pin(self):
+        with self._refs_lock:
+            self._refs += 1
+
+    def unpin(self):
+        with self._refs_lock:
+            self._refs -= 1
+
+    def close(self):
+        """Release the llama.cpp contexts held by this pool."""
+        for ctx in self.contexts:
+            close = getattr(ctx, "close", None)
+            if close is not None:
+                close()
+        self.contexts = []
+
+    def acquire(self, timeout=None):
+        return self._free.get(timeout=timeout)
+
+    def release(self, ctx):
+        self._free.put(ctx)
+
+
+class GenerationJob:
+    """A unit of work admitted into the scheduler."""
+
+    def __init__(self, pool, work):
+        self.pool = pool
+        self.work = work
+        self.tokens = queue.Queue()
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def __iter__(self):
+        while True:
+            item = self.tokens.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+class RequestScheduler:
+    """
+    连续批处理调度器。
+
+    请求先进入有界的等待队列，由 ``max_concurrent_sequences`` 个解码线程
+    取出执行；每个解码线程从对应模型的 ContextPool 中独占一个上下文，
+    生成的 token 通过每个请求自己的队列回传给 gRPC 流。一个请求结束后
+    其上下文立即被下一个等待中的请求复用，慢请求不会阻塞其他序列。
+    """
+
+    def __init__(self, max_concurrent_sequences=1, max_queue_depth=32):
+        self.max_concurrent_sequences = max(1, max_concurrent_sequences)
+        self.max_queue_depth = max(1, max_queue_depth)
+        self._pending = queue.Queue(maxsize=self.max_queue_depth)
+        self._active = 0
+        self._active_lock = threading.Lock()
+        self._workers = []
+        for i in range(self.max_concurrent_sequences):
+            t = threading.Thread(
+                target=self._decode_loop, name=f"decode-{i}", daemon=True
+            )
+            t.start()
+            self._workers.append(t)
+        logger.info(
+            f"调度器已启动: 并发序列={self.max_concurrent_sequences}, 队列深度={self.max_queue_depth}"
+        )
+
+    @property
+    def queue_depth(self):
+        return self._pending.qsize()
+
+    @property
+    def active_sequences(self):
+        return self._active
+
+    def submit(self, pool, work):
+        """
+        提交一个生成任务。``work(llm, job)`` 在解码线程中执行，返回 token 迭代器。
+        """
+        job = GenerationJob(pool, work)
+        pool.pin()
+        try:
+            self._pending.put_nowait(job)
+        except queue.Full:
+            pool.unpin()
+            raise SchedulerFullError("推理队列已满，请稍后再试")
+        return job
+
+    def stream(self, pool, work):
+        """Submit ``work`` and yield its tokens; cancels the job if the caller stops."""
+        job = self.submit(pool, work)
+        try:
+            yield from job
+        finally:
+            job.cancel()
+
+    def _decode_loop(self):
+        while True:
+            job = self._pending.get()
+            if job.cancelled.is_set():
+                job.pool.unpin()
+                job.tokens.put(_END)
+                continue
+            llm = job.pool.acquire()
+            with self._active_lock:
+                self._active += 1
+            tokens = None
+            try:
+                tokens = job.work(llm, job)
+                for token in tokens:
+                    if job.cancelled.is_set():
+                        break
+                    job.tokens.put(token)
+                job.tokens.put(_END)
+            except Exception as e:
+                logger.error(f"解码任务出错: {e}", exc_info=True)
+                job.tokens.put(e)
+            finally:
+                if hasattr(tokens, "close"):
+                    tokens.close()
+                with self._active_lock:
+                    self._active -= 1
+                job.pool.release(llm)
+                job.pool.unpin()
@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("embedding", "doc_ids", "model_key", "response", "created_at")
+
+    def __init__(self, embedding, doc_ids, model_key, response):
+        self.embedding = embedding
+        self.doc_ids = doc_ids
+        self.model_key = model_key
+        self.response = response
+        self.created_at = time.time()
+
+
+class SemanticCache:
+    """
+    语义回答缓存。
+
+    以「问题向量 + 检索到的文档 ID 集合 + 生成模型」为键：只有检索上下文
+    完全相同、且问题向量的余弦相似度不低于阈值时才命中，这样同一问题的
+    不同说法可以直接复用已有回答。条目带 TTL，超过容量按 LRU 淘汰，知识库
+    文档被删除时依赖它的条目一并失效。
+    """
+
+    def __init__(self, threshold=0.95, ttl_seconds=86400, max_entries=4096):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._by_doc = {}
+        self._lock = threading.Lock()
+        # 所有向量按行堆叠，条目变化后惰性重建
+        self._matrix = None
+        self._matrix_ids = []
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for doc_id in entry.doc_ids:
+            ids = self._by_doc.get(doc_id)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._by_doc[doc_id]
+        self._matrix = None
+
+    def _expire(self, now):
+        expired = [
+            entry_id
+            for entry_id, entry in self._entries.items()
+            if now - entry.created_at > self.ttl_seconds
+        ]
+        for entry_id in expired:
+            self._remove(entry_id)
+
+    def _ensure_matrix(self):
+        if self._matrix is None and self._entries:
+            self._matrix_ids = list(self._entries.keys())
+            self._matrix = np.stack(
+                [self._entries[i].embedding for i in self._matrix_ids]
+            )
+
+    def lookup(self, embedding, doc_ids, model_key):
+        doc_ids = frozenset(doc_ids)
+        query = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._expire(time.time())
+            self._ensure_matrix()
+            if self._matrix is None:
+                self.misses += 1
+                return None
+            # 向量已归一化，点积即余弦相似度
+            scores = self._matrix @ query
+            for idx in np.argsort(-scores):
+                if scores[idx] < self.threshold:
+                    break
+                entry_id = self._matrix_ids[idx]
+                entry = self._entries[entry_id]
+                if entry.doc_ids == doc_ids and entry.model_key == model_key:
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return entry.response
+            self.misses += 1
+            return None
+
+    def put(self, embedding, doc_ids, model_key, response):
+        entry_id = uuid.uuid4().hex
+        entry = _Entry(
+            np.asarray(embedding, dtype=np.float32),
+            frozenset(doc_ids),
+            model_key,
+            response,
+        )
+        with self._lock:
+            self._entries[entry_id] = entry
+            for doc_id in entry.doc_ids:
+                self._by_doc.setdefault(doc_id, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            self._matrix = None
+
+    def invalidate_docs(self, doc_ids):
+        """Drop every entry whose answer depended on one of ``doc_ids``."""
+        removed = 0
+        with self._lock:
+            for doc_id in doc_ids:
+                for entry_id in list(self._by_doc.get(doc_id, ())):
+                    self._remove(entry_id)
+                    removed += 1
+        if removed:
+            logger.info(f"语义缓存失效 {removed} 条 (文档: {list(doc_ids)})")
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_doc.clear()
+            self._matrix = None
@@ -163,8 +163,8 @@ class RAGService:
         try:
             messages = [{"role": "user", "content": prompt}]
             handler_result = self.chat_handler(messages=messages)
-            final_prompt = handler_result["prompt"]
-            stop_sequences = handler_result["stop"]
+            final_prompt = handler_result.prompt
+            stop_sequences = handler_result.stop
             stream = self.generation_model(
                 prompt=final_prompt,
                 stop=stop_sequences,
@@ -1,6 +1,7 @@
 import os
 import logging
-from llama_cpp import Llama
+from llama_cpp.llama_chat_format import Jinja2ChatFormatter
+from app.gguf_metadata import metadata_cache, token_text
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -8,23 +9,35 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def _build_chat_handler(metadata):
+    chat_template = metadata.get("tokenizer.chat_template")
+    if not chat_template:
+        return None
+    eos_id = metadata.get("tokenizer.ggml.eos_token_id")
+    return Jinja2ChatFormatter(
+        template=chat_template,
+        eos_token=token_text(metadata, "tokenizer.ggml.eos_token_id"),
+        bos_token=token_text(metadata, "tokenizer.ggml.bos_token_id"),
+        stop_token_ids=[eos_id] if eos_id is not None else None,
+    )
+
+
 def get_chat_handler(model_path: str):
     """
     自动根据模型元数据获取聊天处理器，无需外部配置文件。
+
+    只解析 GGUF 文件头，不加载权重；结果按 (路径, 大小, mtime) 缓存。
     """
     logger.info(f"正在为模型 '{os.path.basename(model_path)}' 自动检测聊天模板...")
     try:
-        # 只轻量读取元数据
-        llama = Llama(model_path=model_path, n_ctx=256, n_gpu_layers=0, verbose=False)
-        chat_template = llama.metadata.get("tokenizer.chat_template")
-        if chat_template:
+        chat_handler = metadata_cache.get(
+            model_path, kind="chat_handler", factory=_build_chat_handler
+        )
+        if chat_handler:
             logger.info("成功从模型元数据中提取到聊天模板")
-            chat_handler = llama.chat_handler_from_template(chat_template)
-            del llama
-            return chat_handler
-        logger.warning("未找到聊天模板，无法自动处理聊天格式。")
-        del llama
-        return None
+        else:
+            logger.warning("未找到聊天模板，无法自动处理聊天格式。")
+        return chat_handler
     except Exception as e:
         logger.error(f"读取模型元数据失败: {e}", exc_info=True)
         return None
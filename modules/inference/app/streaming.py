@@ -0,0 +1,129 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def iter_chunks(text, chunk_size):
+    """Split a cached answer into bounded pieces for streaming replay."""
+    chunk_size = max(1, chunk_size)
+    for i in range(0, len(text), chunk_size):
+        yield text[i : i + chunk_size]
+
+
+class _Flight:
+    """One running generation shared by every identical concurrent request."""
+
+    def __init__(self, key):
+        self.key = key
+        self.tokens = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.cancelled = threading.Event()
+        self.cond = threading.Condition()
+
+    def publish(self, token):
+        with self.cond:
+            self.tokens.append(token)
+            self.cond.notify_all()
+
+    def finish(self, error=None):
+        with self.cond:
+            self.done = True
+            self.error = error
+            self.cond.notify_all()
+
+
+class InflightRegistry:
+    """
+    合并相同的并发请求。
+
+    第一个请求启动生成并在后台线程中把 token 写入共享缓冲区；之后到达的
+    相同请求直接挂到这次生成上，从头重放已生成的 token 再继续跟随。所有
+    订阅者都断开时才取消底层生成。
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    @property
+    def active(self):
+        return len(self._flights)
+
+    def stream(self, key, start, on_complete=None):
+        """
+        Yield tokens for ``key``, starting ``start()`` only if no identical
+        generation is already running. ``on_complete(text)`` runs once per
+        successful generation.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = _Flight(key)
+                self._flights[key] = flight
+                threading.Thread(
+                    target=self._pump,
+                    args=(flight, start, on_complete),
+                    name="inflight-pump",
+                    daemon=True,
+                ).start()
+            else:
+                self.coalesced += 1
+                logger.info("相同请求正在生成，合并到已有的生成流")
+            flight.subscribers += 1
+        return self._subscribe(flight)
+
+    def _pump(self, flight, start, on_complete):
+        source = None
+        try:
+            source = start()
+            for token in source:
+                if flight.cancelled.is_set():
+                    break
+                flight.publish(token)
+        except Exception as e:
+            self._forget(flight)
+            flight.finish(error=e)
+            return
+        finally:
+            if hasattr(source, "close"):
+                source.close()
+
+        self._forget(flight)
+        flight.finish()
+        if on_complete is not None and not flight.cancelled.is_set():
+            try:
+                on_complete("".join(flight.tokens))
+            except Exception as e:
+                logger.warning(f"生成完成回调出错: {e}", exc_info=True)
+
+    def _forget(self, flight):
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def _subscribe(self, flight):
+        index = 0
+        try:
+            while True:
+                with flight.cond:
+                    while index >= len(flight.tokens) and not flight.done:
+                        flight.cond.wait()
+                    pending = flight.tokens[index:]
+                    done, error = flight.done, flight.error
+                index += len(pending)
+                yield from pending
+                if done and index >= len(flight.tokens):
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            with self._lock:
+                flight.subscribers -= 1
+                if flight.subscribers == 0 and not flight.done:
+                    flight.cancelled.set()
+                    if self._flights.get(flight.key) is flight:
+                        del self._flights[flight.key]
@@ -1,9 +1,60 @@
+import os
 import subprocess
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def read_memory_info():
+    """Return (total, available) host memory in bytes from /proc/meminfo."""
+    values = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                values[key] = int(rest.split()[0]) * 1024
+    except Exception:
+        return 0, 0
+    return values.get("MemTotal", 0), values.get("MemAvailable", 0)
+
+
+def read_gpu_memory_info():
+    """Return (total, free) memory in bytes summed over all NVIDIA GPUs, or (0, 0)."""
+    try:
+        result = subprocess.run(
+            [
+                "nvidia-smi",
+                "--query-gpu=memory.total,memory.free",
+                "--format=csv,noheader,nounits",
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        total = free = 0
+        for line in result.stdout.strip().splitlines():
+            gpu_total, gpu_free = (int(v) * 1024**2 for v in line.split(","))
+            total += gpu_total
+            free += gpu_free
+        return total, free
+    except Exception:
+        return 0, 0
+
+
+def prefetch_file(path):
+    """Ask the kernel to start reading ``path`` into the page cache."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        logger.debug(f"posix_fadvise failed for {path}: {e}")
+
+
 def detect_gpu_presence() -> bool:
     """Return True if a NVIDIA GPU is available."""
     try: